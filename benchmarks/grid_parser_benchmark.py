@@ -0,0 +1,68 @@
+# coding:utf-8
+"""
+比较表格文本解析方式的耗时
+
+ClipboardGridReader 与 ExportFileGridReader 得到的都是同一格式的 tab 分隔文本，
+这里用录制格式的当日委托表格文本作为样本，只比较原 pandas 解析与 parse_grid_text 的耗时，
+不包括复制或导出表格本身的耗时
+
+Usage::
+
+    python benchmarks/grid_parser_benchmark.py
+"""
+import io
+import os
+import sys
+import timeit
+
+import pandas as pd
+
+sys.path.append('.')
+
+from easytrader.config import client  # noqa: E402
+from easytrader.grid_reader import parse_grid_text  # noqa: E402
+
+ENTRUST_HEADER = '委托日期\t委托时间\t证券代码\t证券名称\t操作\t委托数量\t委托价格\t合同编号\t成交数量\t成交均价\t委托状态\t股东代码\t\n'
+ENTRUST_ROW = '20171020\t09:3{m}:0{s}\t{code:06d}\t测试股票\t买入\t{amount}\t{price:.2f}\t{no}\t{deal}\t{price:.3f}\t已成\t0000000000\t\n'
+
+
+def recorded_entrusts(rows):
+    lines = [ENTRUST_HEADER]
+    for i in range(rows):
+        lines.append(
+            ENTRUST_ROW.format(
+                m=i % 10,
+                s=i % 10,
+                code=600000 + i,
+                amount=(i % 50 + 1) * 100,
+                price=10 + i % 100 / 10,
+                no=100000 + i,
+                deal=(i % 50) * 100))
+    return ''.join(lines)
+
+
+def pandas_parse(text, dtype):
+    df = pd.read_csv(
+        io.StringIO(text), delimiter='\t', dtype=dtype, na_filter=False)
+    return df.to_dict('records')
+
+
+def main():
+    dtype = client.CommonConfig.GRID_DTYPE
+    number = int(os.environ.get('BENCH_NUMBER', 50))
+    print('{:>6} {:>14} {:>14} {:>8}'.format('rows', 'pandas(ms)',
+                                             'parse(ms)', 'speedup'))
+    for rows in (10, 100, 1000, 5000):
+        text = recorded_entrusts(rows)
+        assert pandas_parse(text, dtype) == parse_grid_text(text, dtype)
+        pandas_cost = timeit.timeit(
+            lambda: pandas_parse(text, dtype), number=number) / number
+        parse_cost = timeit.timeit(
+            lambda: parse_grid_text(text, dtype), number=number) / number
+        print('{:>6} {:>14.3f} {:>14.3f} {:>7.1f}x'.format(
+            rows, pandas_cost * 1000, parse_cost * 1000,
+            pandas_cost / parse_cost))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# coding:utf-8
+"""
+比较 GZZQClientTrader.reform_order / sort_order 原逐行实现与 order_plan 向量化实现的耗时
+
+使用随机生成的持仓及目标仓位，原实现的链式赋值改为 .loc 以便在新版 pandas 下运行，循环结构不变
+
+Usage::
+
+    python benchmarks/order_plan_benchmark.py
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.append('.')
+
+from easytrader.order_plan import plan_orders  # noqa: E402
+
+
+def synthetic_basket(names, seed=0):
+    rng = np.random.RandomState(seed)
+    codes = ['%06d' % i for i in range(names * 2)]
+    held = rng.choice(codes, names, replace=False)
+    target = rng.choice(codes, names, replace=False)
+    holding = rng.randint(1, 100, names) * 100
+    cost_price = rng.uniform(3, 100, names).round(3)
+    market_price = (cost_price * rng.uniform(0.8, 1.2, names)).round(2)
+    position_df = pd.DataFrame({
+        'sec_name': held,
+        'holding_position': holding,
+        'sellable_position': holding,
+        'cost_price': cost_price,
+        'market_price': market_price,
+        'profit_rate': (market_price / cost_price - 1) * 100,
+        'profit': (market_price - cost_price) * holding,
+        'cost_tot': cost_price * holding,
+        'market_value': market_price * holding,
+    }, index=pd.Index(held, name='stock_code'))
+    stock_target_df = pd.DataFrame({
+        'final_position': rng.randint(0, 100, names) * 100 + rng.randint(0, 100, names),
+        'ref_price': np.where(rng.rand(names) < 0.2, 0, rng.uniform(3, 100, names).round(2)),
+        'wap_mode': rng.choice(['twap', 'auto', 0], names),
+    }, index=pd.Index(target, name='stock_code'))
+    return position_df, stock_target_df
+
+
+def legacy_sort_order(stock_bs_df, buy_first):
+    stock_bs_df['orderbyvalue'] = 0.0
+    stock_bs_dfg = stock_bs_df.groupby('direction')
+    for direction in stock_bs_dfg.groups:
+        stock_bs_df_sub = stock_bs_dfg.get_group(direction)
+        for n, idx in zip(range(stock_bs_df_sub.shape[0]), stock_bs_df_sub.index):
+            stock_bs_df.loc[idx, 'orderbyvalue'] = n + (-0.5 if buy_first and direction == 1 else 0.5)
+    stock_bs_df.sort_values(by='orderbyvalue', inplace=True)
+    stock_bs_df.drop('orderbyvalue', axis=1, inplace=True)
+    return stock_bs_df
+
+
+def legacy_reform_order(position_df, stock_target_df, buy_first):
+    stock_bs_df = pd.merge(position_df, stock_target_df, left_index=True, right_index=True, how='outer').fillna(0)
+    stock_bs_df.rename(columns={'holding_position': 'init_position'}, inplace=True)
+    stock_bs_df['direction'] = (stock_bs_df.init_position < stock_bs_df.final_position).apply(
+        lambda x: 1 if x else 0)
+    stock_bs_df['wap_mode'] = stock_bs_df['wap_mode'].apply(lambda x: 'auto' if x == 0 else x)
+    for stock_code in stock_bs_df.index:
+        if stock_bs_df['ref_price'][stock_code] == 0 and stock_bs_df['market_price'][stock_code] != 0:
+            stock_bs_df.loc[stock_code, 'ref_price'] = stock_bs_df['market_price'][stock_code]
+    stock_bs_df = legacy_sort_order(stock_bs_df, buy_first)
+    return stock_bs_df[['sec_name', 'init_position', 'final_position', 'wap_mode', 'direction',
+                        'sellable_position', 'ref_price', 'cost_price', 'market_price',
+                        'profit_rate', 'profit', 'cost_tot', 'market_value']]
+
+
+def main():
+    number = int(os.environ.get('BENCH_NUMBER', 5))
+    print('{:>6} {:>14} {:>14} {:>8}'.format('names', 'legacy(ms)', 'plan(ms)', 'speedup'))
+    for names in (100, 300, 800, 1000):
+        position_df, stock_target_df = synthetic_basket(names)
+        legacy = legacy_reform_order(position_df, stock_target_df, False)
+        plan = plan_orders(position_df, stock_target_df, False)
+        assert (legacy['ref_price'].sort_index() == plan['ref_price'].sort_index()).all()
+        assert (legacy['direction'].sort_index() == plan['direction'].sort_index()).all()
+        legacy_cost = timeit.timeit(
+            lambda: legacy_reform_order(position_df, stock_target_df, False), number=number) / number
+        plan_cost = timeit.timeit(
+            lambda: plan_orders(position_df, stock_target_df, False), number=number) / number
+        print('{:>6} {:>14.3f} {:>14.3f} {:>7.1f}x'.format(
+            names, legacy_cost * 1000, plan_cost * 1000, legacy_cost / plan_cost))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+# coding:utf8
+import asyncio
+import json
+
+import aiohttp
+
+from . import exceptions
+from . import helpers
+from . import wire
+from .remoteclient import RemoteClient
+
+
+# aiohttp 3.10 起 sock_connect 超时单独抛出 ConnectionTimeoutError，此前版本没有该异常
+_ConnectionTimeoutError = getattr(aiohttp, 'ConnectionTimeoutError', ())
+
+
+def use(broker, host, port=1430, **kwargs):
+    return AsyncRemoteClient(broker, host, port, **kwargs)
+
+
+class AsyncRemoteClient:
+    """
+    基于 asyncio 的远程交易服务客户端，接口与 RemoteClient 相同，调用时需要 await
+
+    Usage::
+
+        user = AsyncRemoteClient('ht_client', host='服务器ip')
+        position = await user.position
+        await user.buy('162411', price=0.55, amount=100)
+        await user.close()
+
+    同一事件循环中可以并发调用多个账户或多个服务器，
+    多个客户端可以通过 session 参数共用同一个 aiohttp.ClientSession 连接池
+    """
+    JOB_POLL_WAIT = RemoteClient.JOB_POLL_WAIT
+    CONNECT_TIMEOUT = RemoteClient.CONNECT_TIMEOUT
+    READ_TIMEOUT = RemoteClient.READ_TIMEOUT
+    IDEMPOTENT_ENDPOINTS = RemoteClient.IDEMPOTENT_ENDPOINTS
+    RETRY_STATUS_CODES = RemoteClient.RETRY_STATUS_CODES
+
+    def __init__(self, broker, host, port=1430, account_id=None, timeout=None,
+                 wire_format='json', pool_size=100, timeouts=None, retries=2,
+                 backoff=0.5, session=None, **kwargs):
+        """
+        参数同 RemoteClient
+        :param pool_size: 连接池大小，即同时进行的最大请求数
+        :param session: 共用的 aiohttp.ClientSession，默认在第一次请求时创建
+        """
+        self._root = 'http://{}:{}'.format(host, port)
+        self._api = self._root
+        if account_id is not None:
+            self._api += '/accounts/{}'.format(account_id)
+        self._broker = broker
+        self._headers = {'Accept': wire.WIRE_FORMATS[wire_format]}
+        self._pool_size = pool_size
+        self._timeout = self.READ_TIMEOUT if timeout is None else timeout
+        self._timeouts = timeouts or {}
+        self._retries = retries
+        self._backoff = backoff
+        self._session = session
+        self._own_session = session is None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """关闭客户端自己创建的连接池"""
+        if self._own_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self):
+        # ClientSession 需要在事件循环中创建
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._pool_size))
+        return self._session
+
+    async def prepare(self, config_path=None, user=None, password=None,
+                      exe_path=None, comm_password=None, **kwargs):
+        """
+        登陆客户端，参数同 RemoteClient.prepare
+        """
+        params = locals().copy()
+        params.pop('self')
+
+        if config_path is not None:
+            account = helpers.file2dict(config_path)
+            params['user'] = account['user']
+            params['password'] = account['password']
+
+        params['broker'] = self._broker
+
+        return await self.common_post('prepare', params)
+
+    @property
+    def balance(self):
+        return self.common_get('balance')
+
+    @property
+    def position(self):
+        return self.common_get('position')
+
+    @property
+    def today_entrusts(self):
+        return self.common_get('today_entrusts')
+
+    @property
+    def today_trades(self):
+        return self.common_get('today_trades')
+
+    @property
+    def cancel_entrusts(self):
+        return self.common_get('cancel_entrusts')
+
+    def auto_ipo(self):
+        return self.common_get('auto_ipo')
+
+    def exit(self):
+        return self.common_get('exit')
+
+    async def common_get(self, endpoint):
+        return await self._request('GET', endpoint)
+
+    async def common_post(self, endpoint, params):
+        return await self._request('POST', endpoint, json=params)
+
+    def buy(self, security, price, amount, **kwargs):
+        params = locals().copy()
+        params.pop('self')
+
+        return self.common_post('buy', params)
+
+    def sell(self, security, price, amount, **kwargs):
+        params = locals().copy()
+        params.pop('self')
+
+        return self.common_post('sell', params)
+
+    def cancel_entrust(self, entrust_no):
+        return self.common_post('cancel_entrust', {'entrust_no': entrust_no})
+
+    def batch_buy(self, orders):
+        return self.batch_trade([dict(o, action='buy') for o in orders])
+
+    def batch_sell(self, orders):
+        return self.batch_trade([dict(o, action='sell') for o in orders])
+
+    def batch_trade(self, orders):
+        return self.common_post('orders:batch', {'orders': orders})
+
+    def batch_cancel(self, entrust_nos):
+        return self.common_post('cancels:batch', {'entrust_nos': entrust_nos})
+
+    async def get_job(self, job_id, wait=0):
+        """查询异步任务，同 RemoteClient.get_job"""
+        connect_timeout, read_timeout = self._get_timeout('jobs')
+        if read_timeout is not None:
+            read_timeout += wait
+        try:
+            return await self._request(
+                'GET',
+                'jobs/' + job_id,
+                root=self._root,
+                params={'wait': str(wait)},
+                timeout=self._client_timeout(connect_timeout, read_timeout))
+        except exceptions.RemoteServerError as e:
+            if e.status_code == 404:
+                raise exceptions.RemoteJobNotFoundError(str(e), e.status_code)
+            raise
+
+    async def wait_job(self, job_id, timeout=None):
+        """等待异步任务完成，同 RemoteClient.wait_job"""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            wait = self.JOB_POLL_WAIT
+            if deadline is not None:
+                wait = max(0, min(wait, deadline - loop.time()))
+            job = await self.get_job(job_id, wait)
+            if job['status'] == 'done':
+                return job['result']
+            if job['status'] == 'failed':
+                raise exceptions.RemoteServerError(job['error'])
+            if deadline is not None and loop.time() >= deadline:
+                raise exceptions.RemoteTimeoutError(
+                    'wait job {} timeout'.format(job_id))
+
+    def subscribe(self):
+        """
+        订阅服务端推送的当日委托及成交变化
+
+        Usage::
+
+            async for event in user.subscribe():
+                print(event)
+        """
+        return _EventStream(self)
+
+    def _get_timeout(self, name):
+        return self.CONNECT_TIMEOUT, self._timeouts.get(name, self._timeout)
+
+    @staticmethod
+    def _client_timeout(connect_timeout, read_timeout):
+        # connect 包括等待连接池空闲的时间，只限制建立连接本身使用 sock_connect
+        return aiohttp.ClientTimeout(
+            total=None, sock_connect=connect_timeout, sock_read=read_timeout)
+
+    async def _send(self, method, endpoint, root=None, **kwargs):
+        """
+        发送请求，重试策略同 RemoteClient._send
+        :return: aiohttp.ClientResponse，调用方负责 release
+        """
+        name = endpoint.split('?')[0].split('/')[0]
+        idempotent = name in self.IDEMPOTENT_ENDPOINTS
+        url = (root or self._api) + '/' + endpoint
+        kwargs.setdefault('timeout',
+                          self._client_timeout(*self._get_timeout(name)))
+        for attempt in range(self._retries + 1):
+            can_retry = attempt < self._retries
+            try:
+                response = await self._get_session().request(
+                    method, url, headers=self._headers, **kwargs)
+            except _ConnectionTimeoutError as e:
+                # 未建立连接，请求没有发出，任何接口都可以重试
+                error = exceptions.RemoteTimeoutError(
+                    'connect {} timeout: {}'.format(url, e))
+            except aiohttp.ClientConnectorError as e:
+                # 未建立连接，请求没有发出，任何接口都可以重试
+                error = exceptions.RemoteConnectionError(
+                    'connect {} error: {}'.format(url, e))
+            except asyncio.TimeoutError as e:
+                error = exceptions.RemoteTimeoutError(
+                    'request {} timeout: {}'.format(url, e))
+                can_retry = can_retry and idempotent
+            except aiohttp.ClientError as e:
+                error = exceptions.RemoteConnectionError(
+                    'request {} connection error: {}'.format(url, e))
+                can_retry = can_retry and idempotent
+            else:
+                if not (can_retry and idempotent and
+                        response.status in self.RETRY_STATUS_CODES):
+                    return response
+                response.release()
+                error = None
+            if not can_retry:
+                raise error
+            await asyncio.sleep(self._backoff * 2 ** attempt)
+
+    async def _request(self, method, endpoint, root=None, **kwargs):
+        response = await self._send(method, endpoint, root, **kwargs)
+        try:
+            content = await response.read()
+        except asyncio.TimeoutError as e:
+            raise exceptions.RemoteTimeoutError(
+                'read {} timeout: {}'.format(response.url, e))
+        finally:
+            response.release()
+        return self._parse_content(response.status,
+                                   response.headers.get('Content-Type'),
+                                   content)
+
+    @staticmethod
+    def _parse_content(status, content_type, content):
+        try:
+            data = wire.decode(content, content_type)
+        except ValueError:
+            raise exceptions.RemoteServerError(
+                'invalid response: {}'.format(content[:200]), status)
+        if status >= 300:
+            raise exceptions.RemoteServerError(
+                data.get('error', data) if isinstance(data, dict) else data,
+                status)
+        return data
+
+
+class _EventStream:
+    """AsyncRemoteClient.subscribe 返回的异步迭代器"""
+
+    def __init__(self, client):
+        self._client = client
+        self._response = None
+        self._data = []
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._response is None:
+            self._response = await self._client._send(
+                'GET',
+                'events',
+                timeout=self._client._client_timeout(
+                    self._client.CONNECT_TIMEOUT, None))
+            if self._response.status >= 300:
+                content = await self._response.read()
+                self._response.release()
+                self._client._parse_content(
+                    self._response.status,
+                    self._response.headers.get('Content-Type'), content)
+        while True:
+            line = await self._response.content.readline()
+            if not line:
+                self._response.release()
+                raise StopAsyncIteration
+            line = line.decode('utf-8').rstrip('\r\n')
+            if not line:
+                if self._data:
+                    event = json.loads('\n'.join(self._data))
+                    self._data = []
+                    return event
+            elif line.startswith('data:'):
+                self._data.append(line[5:].lstrip())
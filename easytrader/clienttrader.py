@@ -1,6 +1,5 @@
 # coding:utf-8
 import functools
-import io
 import os
 import re
 import sys
@@ -8,16 +7,16 @@ import time
 from abc import abstractmethod
 
 import easyutils
-import pandas as pd
 
 from . import exceptions
 from . import helpers
 from .config import client
+from .grid_reader import INPUT_LOCK, ClipboardGridReader
+from .latency import LatencyHistogram
 from .log import log
 
 if not sys.platform.startswith('darwin'):
     import pywinauto
-    import pywinauto.clipboard
 
 
 class PopDialogHandler:
@@ -48,7 +47,8 @@ class PopDialogHandler:
         self._app.top_window()['确定'].click()
 
     def _submit_by_shortcut(self):
-        self._app.top_window().type_keys('%Y')
+        with INPUT_LOCK:
+            self._app.top_window().type_keys('%Y')
 
     def _close(self):
         self._app.top_window().close()
@@ -81,10 +81,30 @@ class TradePopDialogHandler(PopDialogHandler):
 
 
 class ClientTrader:
+    # 等待界面就绪时的检查间隔，单位为秒
+    MENU_POLL_INTERVAL = 0.02
+    # 按 F5 刷新当前界面后的等待时间，单位为秒
+    MENU_REFRESH_WAIT = 0.05
+    # 操作后等待弹窗出现的最长时间，单位为秒
+    POP_DIALOG_TIMEOUT = 0.2
+    # 检查弹窗是否出现的间隔，单位为秒
+    POP_DIALOG_POLL_INTERVAL = 0.02
+    # 批量委托时等待上一笔委托弹窗关闭的最长时间，单位为秒
+    BATCH_DIALOG_CLOSE_TIMEOUT = 1
+
     def __init__(self):
         self._config = client.create(self.broker_type)
         self._app = None
         self._main = None
+        # 当前左侧菜单所处的界面路径，None 表示未知
+        self._menu_path = None
+        # 表格数据读取方式，可替换为 grid_reader.ExportFileGridReader 等实现
+        self.grid_reader = ClipboardGridReader(self)
+        # {弹窗标题: LatencyHistogram} 操作后检测到各类弹窗的耗时分布
+        self.pop_dialog_latency = {}
+        # (句柄, 标题) 已处理但可能尚未关闭的弹窗，避免重复处理
+        self._handled_dialog = None
+        self._pop_dialog_wait_time = 0
 
     def prepare(self,
                 config_path=None,
@@ -130,6 +150,7 @@ class ClientTrader:
             path=connect_path, timeout=10)
         self._close_prompt_windows()
         self._main = self._app.top_window()
+        self._menu_path = None
 
     @property
     def broker_type(self):
@@ -171,13 +192,11 @@ class ClientTrader:
 
     @property
     def cancel_entrusts(self):
-        self._refresh()
         self._switch_left_menus(['撤单[F3]'])
 
         return self._get_grid_data(self._config.COMMON_GRID_CONTROL_ID)
 
     def cancel_entrust(self, entrust_no):
-        self._refresh()
         for i, entrust in enumerate(self.cancel_entrusts):
             if entrust[
                     self._config.CANCEL_ENTRUST_ENTRUST_FIELD] == entrust_no:
@@ -186,16 +205,113 @@ class ClientTrader:
         else:
             return {'message': '委托单状态错误不能撤单, 该委托单可能已经成交或者已撤'}
 
+    def cancel_entrusts_by_no(self, entrust_nos):
+        """
+        批量撤单，撤单表格只读取一次
+        :param entrust_nos: 委托单号列表
+        :return: {委托单号: 撤单结果}
+        """
+        entrust_nos = list(entrust_nos)
+        entrusts = self.cancel_entrusts
+        row_index = {
+            entrust[self._config.CANCEL_ENTRUST_ENTRUST_FIELD]: i
+            for i, entrust in enumerate(entrusts)
+        }
+
+        results = {}
+        rows = []
+        for entrust_no in entrust_nos:
+            if entrust_no in row_index:
+                rows.append((row_index[entrust_no], entrust_no))
+            else:
+                results[entrust_no] = {
+                    'message': '委托单状态错误不能撤单, 该委托单可能已经成交或者已撤'
+                }
+
+        if entrusts and len(set(rows)) == len(entrusts):
+            # 撤销全部委托时直接使用全撤
+            self._click(self._config.CANCEL_ENTRUST_ALL_BUTTON_CONTROL_ID)
+            result = self._handle_pop_dialogs()
+            for _, entrust_no in rows:
+                results[entrust_no] = result
+            return results
+
+        # 从下往上撤单，已撤的委托从表格移除后不影响上方行的位置
+        for row, entrust_no in sorted(set(rows), reverse=True):
+            self._cancel_entrust_by_double_click(row)
+            results[entrust_no] = self._handle_pop_dialogs()
+        return results
+
     def buy(self, security, price, amount, **kwargs):
-        self._switch_left_menus(['买入[F1]'])
+        self._switch_trade_menus(['买入[F1]'])
 
         return self.trade(security, price, amount)
 
     def sell(self, security, price, amount, **kwargs):
-        self._switch_left_menus(['卖出[F2]'])
+        self._switch_trade_menus(['卖出[F2]'])
 
         return self.trade(security, price, amount)
 
+    def batch_trade(self, orders):
+        """
+        批量限价委托，按买卖方向分组，先卖后买，每组只切换一次界面
+        同一组内不再逐笔切换界面，上一笔委托的提示弹窗关闭过程中即填写下一笔委托，弹窗关闭后立即提交
+        :param orders: [{'action': 'buy' or 'sell', 'security': 证券代码, 'price': 价格, 'amount': 数量}]
+        :return: 与 orders 一一对应的结果列表，成功为 {'entrust_no': '委托单号'}，失败为 {'error': 错误信息}
+        """
+        results = [None] * len(orders)
+        start = time.time()
+        for action, menu_path in (('sell', ['卖出[F2]']), ('buy', ['买入[F1]'])):
+            indexes = [
+                i for i, o in enumerate(orders) if o.get('action') == action
+            ]
+            if not indexes:
+                continue
+            try:
+                self._switch_trade_menus(menu_path)
+            except Exception as e:
+                log.exception('切换到%s界面失败', menu_path[0])
+                for i in indexes:
+                    results[i] = {'error': '{}: {}'.format(e.__class__, e)}
+                continue
+            for i in indexes:
+                order = orders[i]
+                try:
+                    results[i] = self._batch_submit_trade(
+                        order['security'], order['price'], order['amount'])
+                except exceptions.TradeError as e:
+                    results[i] = {'error': str(e)}
+                except Exception as e:
+                    # 单笔委托失败不影响同一批次的其他委托
+                    log.exception('批量委托 %s 失败', order.get('security'))
+                    results[i] = {'error': '{}: {}'.format(e.__class__, e)}
+        for i, order in enumerate(orders):
+            if results[i] is None:
+                results[i] = {
+                    'error': 'unknown action: {}'.format(order.get('action'))
+                }
+
+        cost = time.time() - start
+        if orders:
+            log.info('批量委托 {} 笔, 耗时 {:.3f} 秒, {:.2f} 笔/秒'.format(
+                len(orders), cost,
+                len(orders) / cost if cost > 0 else float('inf')))
+        return results
+
+    def _batch_submit_trade(self, security, price, amount):
+        """
+        批量委托中的单笔委托，填写委托参数时上一笔委托的弹窗可能仍在关闭，等其关闭后再提交
+        :return: {'entrust_no': '委托单号'}
+        """
+        self._set_trade_params(security, price, amount)
+
+        if not self._wait_pop_dialog_closed(self.BATCH_DIALOG_CLOSE_TIMEOUT):
+            # 弹窗未关闭时提交会把上一笔的提示当作本笔结果，放弃本笔委托
+            raise exceptions.TradeError('上一笔委托的弹窗未关闭, 本笔委托未提交')
+        self._submit_trade(sleep=0)
+
+        return self._handle_pop_dialogs(handler_class=TradePopDialogHandler)
+
     def market_buy(self, security, amount, ttype=None, **kwargs):
         """
         市价买入
@@ -207,7 +323,7 @@ class ClientTrader:
 
         :return: {'entrust_no': '委托单号'}
         """
-        self._switch_left_menus(['市价委托', '买入'])
+        self._switch_trade_menus(['市价委托', '买入'])
 
         return self.market_trade(security, amount, ttype)
 
@@ -222,7 +338,7 @@ class ClientTrader:
 
         :return: {'entrust_no': '委托单号'}
         """
-        self._switch_left_menus(['市价委托', '卖出'])
+        self._switch_trade_menus(['市价委托', '卖出'])
 
         return self.market_trade(security, amount, ttype)
 
@@ -292,10 +408,60 @@ class ClientTrader:
             control_id=self._config.COMMON_GRID_CONTROL_ID,
             class_name='CVirtualGridCtrl').click(coords=(x, y))
 
-    def _is_exist_pop_dialog(self):
-        self._wait(0.2)  # wait dialog display
-        return self._main.wrapper_object() != self._app.top_window(
-        ).wrapper_object()
+    def _is_exist_pop_dialog(self, timeout=None):
+        """
+        轮询检查是否出现新的弹窗，弹窗出现后立即返回
+        :param timeout: 等待弹窗出现的最长时间，单位为秒，默认为 POP_DIALOG_TIMEOUT
+        :return: bool
+        """
+        if timeout is None:
+            timeout = self.POP_DIALOG_TIMEOUT
+        start = time.time()
+        deadline = start + timeout
+        main_handle = self._main.wrapper_object().handle
+        while True:
+            handle = self._get_top_window_handle()
+            if handle not in (None, main_handle) and not self._is_handled_dialog(handle):
+                self._pop_dialog_wait_time = time.time() - start
+                return True
+            if time.time() >= deadline:
+                return False
+            self._wait(self.POP_DIALOG_POLL_INTERVAL)
+
+    def _wait_pop_dialog_closed(self, timeout):
+        """
+        等待弹窗关闭，顶层窗口回到主窗口后立即返回
+        :param timeout: 最长等待时间，单位为秒
+        :return: bool 弹窗是否已关闭
+        """
+        deadline = time.time() + timeout
+        main_handle = self._main.wrapper_object().handle
+        while self._get_top_window_handle() != main_handle:
+            if time.time() >= deadline:
+                return False
+            self._wait(self.POP_DIALOG_POLL_INTERVAL)
+        return True
+
+    def _get_top_window_handle(self):
+        try:
+            return self._app.top_window().wrapper_object().handle
+        except Exception:
+            # 弹窗关闭过程中可能短暂找不到顶层窗口
+            return None
+
+    def _is_handled_dialog(self, handle):
+        # 同一窗口标题改变时视为新的弹窗
+        if self._handled_dialog is None or self._handled_dialog[0] != handle:
+            return False
+        try:
+            return self._get_pop_dialog_title() == self._handled_dialog[1]
+        except Exception:
+            return True
+
+    def _record_pop_dialog_latency(self, title, seconds):
+        if title not in self.pop_dialog_latency:
+            self.pop_dialog_latency[title] = LatencyHistogram()
+        self.pop_dialog_latency[title].record(seconds)
 
     def _run_exe_path(self, exe_path):
         return os.path.join(os.path.dirname(exe_path), 'xiadan.exe')
@@ -324,8 +490,8 @@ class ClientTrader:
         self._app.top_window().window(
             control_id=control_id, class_name='Button').click()
 
-    def _submit_trade(self):
-        time.sleep(0.05)
+    def _submit_trade(self, sleep=0.05):
+        time.sleep(sleep)
         self._main.window(
             control_id=self._config.TRADE_SUBMIT_CONTROL_ID,
             class_name='Button').click()
@@ -337,10 +503,12 @@ class ClientTrader:
     def _set_trade_params(self, security, price, amount):
         code = security[-6:]
 
+        # 清空上一笔委托残留的价格，以客户端重新填入价格作为代码输入完成的标志
+        self._type_keys(self._config.TRADE_PRICE_CONTROL_ID, '')
         self._type_keys(self._config.TRADE_SECURITY_CONTROL_ID, code)
 
         # wait security input finish
-        self._wait(0.1)
+        self._wait_security_loaded(0.1)
 
         self._type_keys(self._config.TRADE_PRICE_CONTROL_ID,
                         easyutils.round_price_by_code(price, code))
@@ -356,29 +524,76 @@ class ClientTrader:
 
         self._type_keys(self._config.TRADE_AMOUNT_CONTROL_ID, str(int(amount)))
 
+    def _wait_security_loaded(self, timeout):
+        """输入证券代码后，客户端会自动填入价格，以此判断代码输入完成，最长等待 timeout 秒"""
+        price_edit = self._main.window(
+            control_id=self._config.TRADE_PRICE_CONTROL_ID, class_name='Edit')
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if price_edit.window_text():
+                return
+            self._wait(self.MENU_POLL_INTERVAL)
+
     def _get_grid_data(self, control_id):
-        grid = self._main.window(
-            control_id=control_id, class_name='CVirtualGridCtrl')
-        grid.type_keys('^A^C')
-        return self._format_grid_data(self._get_clipboard_data())
+        return self.grid_reader.read(control_id)
 
     def _type_keys(self, control_id, text):
         self._main.window(
             control_id=control_id, class_name='Edit').set_edit_text(text)
 
-    def _get_clipboard_data(self):
-        while True:
-            try:
-                return pywinauto.clipboard.GetData()
-            except Exception as e:
-                log.warning('{}, retry ......'.format(e))
-
-    def _switch_left_menus(self, path, sleep=0.2):
-        self._get_left_menus_handle().get_item(path).click()
-        self._wait(sleep)
+    def _switch_left_menus(self, path, sleep=0.2, refresh=True,
+                           ready_control=None):
+        """
+        切换左侧菜单，当前已处于该界面时不再重复点击
+        :param path: 菜单路径
+        :param sleep: 等待界面就绪的最长时间，单位为秒
+        :param refresh: 已处于该界面时是否按 F5 刷新界面数据
+        :param ready_control: (control_id, class_name) 界面就绪时出现的控件，默认为表格控件
+        """
+        path = tuple(path)
+        if self._menu_path == path:
+            if refresh:
+                self._refresh()
+            return
+
+        if ready_control is None:
+            ready_control = (self._config.COMMON_GRID_CONTROL_ID,
+                             'CVirtualGridCtrl')
+        previous_handle = self._get_control_handle(*ready_control)
+        self._get_left_menus_handle().get_item(list(path)).click()
+        self._menu_path = path
+        self._wait_control_changed(ready_control, previous_handle, sleep)
+
+    def _switch_trade_menus(self, path, sleep=0.2):
+        self._switch_left_menus(
+            path,
+            sleep=sleep,
+            refresh=False,
+            ready_control=(self._config.TRADE_SECURITY_CONTROL_ID, 'Edit'))
+
+    def _get_control_handle(self, control_id, class_name):
+        """获取当前可见的指定控件句柄，不存在或不唯一时返回 None"""
+        spec = self._main.window(control_id=control_id, class_name=class_name)
+        try:
+            if spec.exists(timeout=0):
+                return spec.wrapper_object().handle
+        except Exception:
+            pass
+        return None
+
+    def _wait_control_changed(self, ready_control, previous_handle, timeout):
+        """等待新界面的就绪控件出现，最长等待 timeout 秒"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            handle = self._get_control_handle(*ready_control)
+            if handle is not None and handle != previous_handle:
+                return
+            self._wait(self.MENU_POLL_INTERVAL)
 
     def _switch_left_menus_by_shortcut(self, shortcut, sleep=0.5):
-        self._app.top_window().type_keys(shortcut)
+        with INPUT_LOCK:
+            self._app.top_window().type_keys(shortcut)
+        self._menu_path = None
         self._wait(sleep)
 
     @functools.lru_cache()
@@ -393,15 +608,6 @@ class ClientTrader:
             except:
                 pass
 
-    def _format_grid_data(self, data):
-        df = pd.read_csv(
-            io.StringIO(data),
-            delimiter='\t',
-            dtype=self._config.GRID_DTYPE,
-            na_filter=False,
-        )
-        return df.to_dict('records')
-
     def _cancel_entrust_by_double_click(self, row):
         x = self._config.CANCEL_ENTRUST_GRID_LEFT_MARGIN
         y = self._config.CANCEL_ENTRUST_GRID_FIRST_ROW_HEIGHT + self._config.CANCEL_ENTRUST_GRID_ROW_HEIGHT * row
@@ -410,13 +616,19 @@ class ClientTrader:
             class_name='CVirtualGridCtrl').double_click(coords=(x, y))
 
     def _refresh(self):
-        self._switch_left_menus(['买入[F1]'], sleep=0.05)
+        # F5 刷新当前界面数据
+        with INPUT_LOCK:
+            self._main.type_keys('{F5}')
+        self._wait(self.MENU_REFRESH_WAIT)
 
     def _handle_pop_dialogs(self, handler_class=PopDialogHandler):
         handler = handler_class(self._app)
+        self._handled_dialog = None
 
         while self._is_exist_pop_dialog():
             title = self._get_pop_dialog_title()
+            self._handled_dialog = (self._get_top_window_handle(), title)
+            self._record_pop_dialog_latency(title, self._pop_dialog_wait_time)
 
             result = handler.handle(title)
             if result:
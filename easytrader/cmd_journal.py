@@ -0,0 +1,136 @@
+# coding:utf8
+from __future__ import unicode_literals, print_function, division
+
+import io
+import json
+import os
+import threading
+import time
+from datetime import timedelta
+
+
+class CmdJournal(object):
+    """已执行交易指令的去重日志
+
+    每条指令以一行 json 追加写入文件并 fsync，新增指令的写入代价为 O(1)。
+    进程崩溃时最多留下最后一行未写完的记录，加载时跳过该行并压缩文件。
+    信号产生时间超过 ttl 的指令在加载及定期压缩时被淘汰，文件大小不会无限增长。
+    """
+    # 追加多少条记录后进行一次淘汰及压缩
+    COMPACT_EVERY = 1000
+
+    def __init__(self, path, ttl=timedelta(days=30)):
+        """
+        :param path: 日志文件路径
+        :param ttl: 指令保留时长，按信号产生时间计算
+        """
+        self.path = path
+        self.ttl = ttl
+        self._cmds = {}
+        self._appended = 0
+        self._tail_checked = False
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._cmds
+
+    def __len__(self):
+        return len(self._cmds)
+
+    def load(self):
+        """从日志文件加载指令，淘汰过期指令，存在无效或重复记录时压缩文件"""
+        with self._lock:
+            self._cmds = {}
+            stale = 0
+            if os.path.exists(self.path):
+                with io.open(self.path, encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            timestamp, key = json.loads(line)
+                            duplicated = key in self._cmds
+                        except (ValueError, TypeError):
+                            # 写了一半或格式不符的记录
+                            stale += 1
+                            continue
+                        if duplicated:
+                            stale += 1
+                        self._cmds[key] = timestamp
+            stale += self._evict()
+            if stale > 0:
+                self._compact()
+            self._tail_checked = True
+
+    def add(self, key, cmd_datetime):
+        """
+        追加一条指令
+        :param key: 指令 key
+        :param cmd_datetime: 信号产生时间
+        :type cmd_datetime: datetime
+        """
+        timestamp = time.mktime(cmd_datetime.timetuple())
+        with self._lock:
+            if key in self._cmds:
+                return
+            self._cmds[key] = timestamp
+            self._ensure_tail_newline()
+            with io.open(self.path, 'a', encoding='utf-8') as f:
+                f.write(self._dump_line(timestamp, key))
+                f.flush()
+                os.fsync(f.fileno())
+            self._appended += 1
+            if self._appended >= self.COMPACT_EVERY:
+                self._evict()
+                self._compact()
+
+    def update(self, keys, cmd_datetime):
+        """
+        批量导入指令，只写一次文件，用于迁移旧版本的指令缓存
+        :param keys: 指令 key 列表
+        :param cmd_datetime: 信号产生时间
+        """
+        timestamp = time.mktime(cmd_datetime.timetuple())
+        with self._lock:
+            for key in keys:
+                self._cmds.setdefault(key, timestamp)
+            self._compact()
+
+    def clear(self):
+        """清空全部指令并截断日志文件"""
+        with self._lock:
+            self._cmds = {}
+            self._compact()
+
+    def _evict(self):
+        deadline = time.time() - self.ttl.total_seconds()
+        expired_keys = [k for k, t in self._cmds.items() if t < deadline]
+        for key in expired_keys:
+            del self._cmds[key]
+        return len(expired_keys)
+
+    def _compact(self):
+        # 先写临时文件再原子替换，压缩过程中崩溃不会损坏原日志
+        tmp_path = self.path + '.tmp'
+        with io.open(tmp_path, 'w', encoding='utf-8') as f:
+            for key, timestamp in self._cmds.items():
+                f.write(self._dump_line(timestamp, key))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._appended = 0
+        self._tail_checked = True
+
+    def _ensure_tail_newline(self):
+        # 未加载过的日志末尾可能是崩溃时写了一半的记录，补换行防止与新记录粘连
+        if self._tail_checked:
+            return
+        self._tail_checked = True
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        with io.open(self.path, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+
+    @staticmethod
+    def _dump_line(timestamp, key):
+        return json.dumps([timestamp, key], ensure_ascii=False) + '\n'
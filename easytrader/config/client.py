@@ -63,6 +63,7 @@ class CommonConfig:
     CANCEL_ENTRUST_GRID_LEFT_MARGIN = 50
     CANCEL_ENTRUST_GRID_FIRST_ROW_HEIGHT = 30
     CANCEL_ENTRUST_GRID_ROW_HEIGHT = 16
+    CANCEL_ENTRUST_ALL_BUTTON_CONTROL_ID = 30001
 
     AUTO_IPO_SELECT_ALL_BUTTON_CONTROL_ID = 1098
     AUTO_IPO_BUTTON_CONTROL_ID = 1006
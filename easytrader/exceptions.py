@@ -9,3 +9,41 @@ class NotLoginError(Exception):
     def __init__(self, result=None):
         super(NotLoginError, self).__init__()
         self.result = result
+
+
+class AccountNotFoundError(Exception):
+    """交易服务中没有该账户"""
+    pass
+
+
+class JobNotFoundError(Exception):
+    """交易服务中没有该任务，任务 id 错误或已完成的任务已被清理"""
+    pass
+
+
+class RemoteError(Exception):
+    """调用远程交易服务出错"""
+
+    def __init__(self, message, status_code=None):
+        super(RemoteError, self).__init__(message)
+        self.status_code = status_code
+
+
+class RemoteConnectionError(RemoteError):
+    """无法连接远程交易服务或连接中断"""
+    pass
+
+
+class RemoteTimeoutError(RemoteError):
+    """远程交易服务响应超时"""
+    pass
+
+
+class RemoteServerError(RemoteError):
+    """远程交易服务返回错误，status_code 为 http 状态码"""
+    pass
+
+
+class RemoteJobNotFoundError(RemoteServerError):
+    """远程交易服务中没有该异步任务"""
+    pass
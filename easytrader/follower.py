@@ -1,18 +1,24 @@
 # coding:utf8
 from __future__ import unicode_literals, print_function, division
 
+import heapq
+import itertools
 import os
 import pickle
+import random
 import re
 import time
-from datetime import datetime
-from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Condition, Lock, Thread
 
 import requests
+from requests.adapters import HTTPAdapter
 # noinspection PyUnresolvedReferences
 from six.moves.queue import Queue
 
 from . import exceptions
+from .cmd_journal import CmdJournal
 from .log import log
 
 
@@ -20,15 +26,45 @@ class BaseFollower(object):
     LOGIN_PAGE = ''
     LOGIN_API = ''
     TRANSACTION_API = ''
-    CMD_CACHE_FILE = 'cmd_cache.pk'
+    CMD_CACHE_FILE = 'cmd_cache.log'
+    # 旧版本使用 pickle 保存的指令缓存，加载时自动迁移
+    LEGACY_CMD_CACHE_FILE = 'cmd_cache.pk'
+    # 指令缓存的保留时长，按信号产生时间计算
+    CMD_CACHE_TTL = timedelta(days=30)
     WEB_REFERER = ''
     WEB_ORIGIN = ''
+    # 并发查询调仓记录的线程数，不随跟踪的策略数量增长
+    TRACK_WORKERS = 4
+    # 轮询间隔的随机抖动比例，避免大量策略在同一时刻集中请求
+    TRACK_JITTER = 0.1
+    # 查询失败时指数退避的最长等待时间，单位为秒
+    TRACK_MAX_BACKOFF = 300
+    # 调仓记录游标是否包含边界，调仓时间精度不足以区分同一时刻的多条记录时应为 True，
+    # 边界上已经处理过的指令由 expired_cmds 去重
+    CURSOR_INCLUSIVE = True
 
     def __init__(self):
         self.trade_queue = Queue()
-        self.expired_cmds = set()
+        self.expired_cmds = CmdJournal(self.CMD_CACHE_FILE,
+                                       ttl=self.CMD_CACHE_TTL)
 
         self.s = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.TRACK_WORKERS,
+            pool_maxsize=self.TRACK_WORKERS)
+        self.s.mount('http://', adapter)
+        self.s.mount('https://', adapter)
+
+        # 跟踪调度表，元素为 (下次查询时间, 序号, 跟踪任务)
+        self._track_schedule = []
+        self._track_counter = itertools.count()
+        self._track_cond = Condition()
+        self._track_executor = None
+        self._tracking = False
+
+        # 各策略已处理调仓记录的游标，以及条件请求使用的 ETag / Last-Modified
+        self._transaction_cursors = {}
+        self._transaction_validators = {}
 
     def login(self, user=None, password=None, **kwargs):
         """
@@ -105,27 +141,36 @@ class BaseFollower(object):
             总资产由 初始资产 × 组合净值 算得， total_assets 会覆盖此参数
         :param track_interval: 轮询模拟交易时间，单位为秒
         :param trade_cmd_expire_seconds: 交易指令过期时间, 单位为秒
-        :param cmd_cache: 是否读取存储历史执行过的指令，防止重启时重复执行已经交易过的指令
+        :param cmd_cache: 是否读取存储历史执行过的指令，防止重启时重复执行已经交易过的指令，为 False 时清空历史指令
         """
         raise NotImplementedError
 
     def load_expired_cmd_cache(self):
-        if os.path.exists(self.CMD_CACHE_FILE):
-            with open(self.CMD_CACHE_FILE, 'rb') as f:
-                self.expired_cmds = pickle.load(f)
+        self.expired_cmds.load()
+
+        if os.path.exists(self.LEGACY_CMD_CACHE_FILE):
+            with open(self.LEGACY_CMD_CACHE_FILE, 'rb') as f:
+                legacy_cmds = pickle.load(f)
+            self.expired_cmds.update(legacy_cmds, datetime.now())
+            # Windows 下 os.rename 在目标文件已存在时失败，使用 os.replace 覆盖上次的备份
+            os.replace(self.LEGACY_CMD_CACHE_FILE,
+                       self.LEGACY_CMD_CACHE_FILE + '.bak')
+            log.info('已迁移旧版本指令缓存 {} 条'.format(len(legacy_cmds)))
 
     def start_trader_thread(self,
                             users,
                             trade_cmd_expire_seconds,
                             entrust_prop='limit',
-                            send_interval=0):
+                            send_interval=0,
+                            parallel=False):
         trader = Thread(
             target=self.trade_worker,
             args=[users],
             kwargs={
                 'expire_seconds': trade_cmd_expire_seconds,
                 'entrust_prop': entrust_prop,
-                'send_interval': send_interval
+                'send_interval': send_interval,
+                'parallel': parallel
             })
         trader.setDaemon(True)
         trader.start()
@@ -153,43 +198,161 @@ class BaseFollower(object):
         """
         pass
 
+    def track_strategies(self, strategies, interval=10, block=True):
+        """统一调度全部策略的跟踪任务，由单个调度线程按各策略的下次查询时间
+        分发到固定大小的线程池，线程数与请求频率不随策略数量增长
+        :param strategies: [(策略id, 策略名, 查询调仓记录的额外参数 dict)] 列表
+        :param interval: 轮询策略的时间间隔，单位为秒
+        :param block: 是否阻塞至跟踪结束
+        """
+        with self._track_cond:
+            if self._tracking:
+                log.warning('已经在跟踪策略, 请先调用 stop_tracking 停止跟踪')
+                return
+            self._tracking = True
+            self._track_executor = ThreadPoolExecutor(
+                max_workers=self.TRACK_WORKERS)
+            # 丢弃上次跟踪停止时遗留的任务
+            self._track_schedule = []
+            now = time.time()
+            for strategy, name, kwargs in strategies:
+                task = {
+                    'strategy': strategy,
+                    'name': name,
+                    'kwargs': kwargs,
+                    'failures': 0
+                }
+                # 首次查询在抖动范围内错开
+                first_delay = random.uniform(0, interval * self.TRACK_JITTER)
+                self._push_track_task(task, now + first_delay)
+
+        scheduler = Thread(target=self._track_scheduler, args=[interval])
+        scheduler.start()
+        if not block:
+            return
+        try:
+            while scheduler.is_alive():
+                scheduler.join(1)
+        except KeyboardInterrupt:
+            log.info('程序退出')
+            self.stop_tracking()
+
     def track_strategy_worker(self, strategy, name, interval=10, **kwargs):
-        """跟踪下单worker
+        """跟踪单个策略，阻塞至 stop_tracking，兼容旧版本为每个策略单独启动线程的用法，
+        跟踪多个策略时使用 track_strategies
         :param strategy: 策略id
         :param name: 策略名字
         :param interval: 轮询策略的时间间隔，单位为秒"""
+        task = {
+            'strategy': strategy,
+            'name': name,
+            'kwargs': kwargs,
+            'failures': 0
+        }
+        with self._track_cond:
+            self._tracking = True
+        while True:
+            deadline = time.time() + self._query_track_task(task, interval)
+            with self._track_cond:
+                # 与调度线程共用条件变量，被其他任务唤醒时继续等待至下次查询时间
+                while self._tracking:
+                    timeout = deadline - time.time()
+                    if timeout <= 0:
+                        break
+                    self._track_cond.wait(timeout)
+                if not self._tracking:
+                    return
+
+    def stop_tracking(self):
+        """停止跟踪全部策略"""
+        with self._track_cond:
+            self._tracking = False
+            self._track_cond.notify_all()
+        if self._track_executor is not None:
+            self._track_executor.shutdown(wait=False)
+
+    def _push_track_task(self, task, due):
+        heapq.heappush(self._track_schedule,
+                       (due, next(self._track_counter), task))
+
+    def _track_scheduler(self, interval):
         while True:
-            try:
-                transactions = self.query_strategy_transaction(
-                    strategy, **kwargs)
-            except Exception as e:
-                log.warning('无法获取策略 {} 调仓信息, 错误: {}, 跳过此次调仓查询'.format(name, e))
+            with self._track_cond:
+                while self._tracking:
+                    if self._track_schedule:
+                        timeout = self._track_schedule[0][0] - time.time()
+                        if timeout <= 0:
+                            break
+                    else:
+                        timeout = None
+                    self._track_cond.wait(timeout)
+                if not self._tracking:
+                    return
+                task = heapq.heappop(self._track_schedule)[-1]
+                # 持有锁时提交，stop_tracking 先在锁内停止跟踪再关闭线程池，不会提交到已关闭的线程池
+                self._track_executor.submit(self._track_once, task, interval)
+
+    def _track_once(self, task, interval):
+        """查询一次策略调仓并分发交易指令，完成后重新加入调度表"""
+        delay = self._query_track_task(task, interval)
+        with self._track_cond:
+            if self._tracking:
+                self._push_track_task(task, time.time() + delay)
+                self._track_cond.notify_all()
+
+    def _query_track_task(self, task, interval):
+        """
+        查询一次策略调仓并分发交易指令
+        :return: float 距下次查询的等待秒数
+        """
+        try:
+            transactions = self.query_strategy_transaction(
+                task['strategy'], **task['kwargs'])
+            self._dispatch_transactions(task['strategy'], task['name'],
+                                        transactions)
+        except Exception as e:
+            task['failures'] += 1
+            delay = self._next_track_delay(interval, task['failures'])
+            log.warning('无法获取策略 {} 调仓信息, 错误: {}, {:.1f} 秒后重试'.format(
+                task['name'], e, delay))
+        else:
+            task['failures'] = 0
+            delay = self._next_track_delay(interval)
+        return delay
+
+    def _next_track_delay(self, interval, failures=0):
+        """计算下次查询的等待时间，失败时按指数退避
+        :param interval: 轮询策略的时间间隔，单位为秒
+        :param failures: 连续失败次数
+        :return: float 等待秒数
+        """
+        delay = interval
+        if failures > 0:
+            backoff = interval * 2 ** min(failures, 16)
+            delay = max(interval, min(backoff, self.TRACK_MAX_BACKOFF))
+        jitter = random.uniform(-self.TRACK_JITTER, self.TRACK_JITTER)
+        return delay * (1 + jitter)
+
+    def _dispatch_transactions(self, strategy, name, transactions):
+        for t in transactions:
+            trade_cmd = {
+                'strategy': strategy,
+                'strategy_name': name,
+                'action': t['action'],
+                'stock_code': t['stock_code'],
+                'amount': t['amount'],
+                'price': t['price'],
+                'datetime': t['datetime']
+            }
+            if self.is_cmd_expired(trade_cmd):
                 continue
-            for t in transactions:
-                trade_cmd = {
-                    'strategy': strategy,
-                    'strategy_name': name,
-                    'action': t['action'],
-                    'stock_code': t['stock_code'],
-                    'amount': t['amount'],
-                    'price': t['price'],
-                    'datetime': t['datetime']
-                }
-                if self.is_cmd_expired(trade_cmd):
-                    continue
-                log.info(
-                    '策略 [{}] 发送指令到交易队列, 股票: {} 动作: {} 数量: {} 价格: {} 信号产生时间: {}'.
-                    format(name, trade_cmd['stock_code'], trade_cmd['action'],
-                           trade_cmd['amount'], trade_cmd['price'],
-                           trade_cmd['datetime']))
-                self.trade_queue.put(trade_cmd)
-                self.add_cmd_to_expired_cmds(trade_cmd)
-            try:
-                for _ in range(interval):
-                    time.sleep(1)
-            except KeyboardInterrupt:
-                log.info('程序退出')
-                break
+            log.info(
+                '策略 [{}] 发送指令到交易队列, 股票: {} 动作: {} 数量: {} 价格: {} 信号产生时间: {}'.
+                format(name, trade_cmd['stock_code'], trade_cmd['action'],
+                       trade_cmd['amount'], trade_cmd['price'],
+                       trade_cmd['datetime']))
+            self.trade_queue.put(trade_cmd)
+            self.add_cmd_to_expired_cmds(trade_cmd)
 
     @staticmethod
     def generate_expired_cmd_key(cmd):
@@ -203,10 +366,7 @@ class BaseFollower(object):
 
     def add_cmd_to_expired_cmds(self, cmd):
         key = self.generate_expired_cmd_key(cmd)
-        self.expired_cmds.add(key)
-
-        with open(self.CMD_CACHE_FILE, 'wb') as f:
-            pickle.dump(self.expired_cmds, f)
+        self.expired_cmds.add(key, cmd['datetime'])
 
     @staticmethod
     def _is_number(s):
@@ -216,97 +376,250 @@ class BaseFollower(object):
         except ValueError:
             return False
 
+    def _check_trade_cmd(self, trade_cmd, expire_seconds):
+        """检查交易指令是否过期、价格及数量是否有效
+        :return: bool 指令是否可以执行
+        """
+        # check expire
+        now = datetime.now()
+        expire = (now - trade_cmd['datetime']).total_seconds()
+        if expire > expire_seconds:
+            log.warning(
+                '策略 [{}] 指令(股票: {} 动作: {} 数量: {} 价格: {})超时，指令产生时间: {} 当前时间: {}, 超过设置的最大过期时间 {} 秒, 被丢弃'.
+                format(trade_cmd['strategy_name'], trade_cmd['stock_code'],
+                       trade_cmd['action'], trade_cmd['amount'],
+                       trade_cmd['price'], trade_cmd['datetime'], now,
+                       expire_seconds))
+            return False
+
+        # check price
+        price = trade_cmd['price']
+        if not self._is_number(price) or price <= 0:
+            log.warning(
+                '策略 [{}] 指令(股票: {} 动作: {} 数量: {} 价格: {})超时，指令产生时间: {} 当前时间: {}, 价格无效 , 被丢弃'.
+                format(trade_cmd['strategy_name'], trade_cmd['stock_code'],
+                       trade_cmd['action'], trade_cmd['amount'],
+                       trade_cmd['price'], trade_cmd['datetime'], now))
+            return False
+
+        # check amount
+        if trade_cmd['amount'] <= 0:
+            log.warning(
+                '策略 [{}] 指令(股票: {} 动作: {} 数量: {} 价格: {})超时，指令产生时间: {} 当前时间: {}, 买入股数无效 , 被丢弃'.
+                format(trade_cmd['strategy_name'], trade_cmd['stock_code'],
+                       trade_cmd['action'], trade_cmd['amount'],
+                       trade_cmd['price'], trade_cmd['datetime'], now))
+            return False
+        return True
+
+    def _execute_user_trade_cmd(self, user, trade_cmd, entrust_prop):
+        """在单个 user 上执行交易指令
+        :return: dict {'user': 交易对象名, 'response': 返回, 'error': 错误信息, 'latency': 耗时秒数}
+        """
+        trader_name = type(user).__name__
+        args = {
+            'security': trade_cmd['stock_code'],
+            'price': trade_cmd['price'],
+            'amount': trade_cmd['amount'],
+            'entrust_prop': entrust_prop
+        }
+        result = {'user': trader_name, 'response': None, 'error': None}
+        start = time.time()
+        try:
+            result['response'] = getattr(user, trade_cmd['action'])(**args)
+        except Exception as e:
+            result['error'] = '{}: {}'.format(type(e).__name__, e.args)
+            # 非交易错误如客户端界面异常，打印堆栈便于排查
+            log_func = log.error if isinstance(
+                e, exceptions.TradeError) else log.exception
+            log_func(
+                '{} 执行 策略 [{}] 指令(股票: {} 动作: {} 数量: {} 价格: {} 指令产生时间: {}) 失败, 错误信息: {}'.
+                format(trader_name, trade_cmd['strategy_name'],
+                       trade_cmd['stock_code'], trade_cmd['action'],
+                       trade_cmd['amount'], trade_cmd['price'],
+                       trade_cmd['datetime'], result['error']))
+        else:
+            log.info(
+                '策略 [{}] 指令(股票: {} 动作: {} 数量: {} 价格: {} 指令产生时间: {}) 执行成功, 返回: {}'.
+                format(trade_cmd['strategy_name'], trade_cmd['stock_code'],
+                       trade_cmd['action'], trade_cmd['amount'],
+                       trade_cmd['price'], trade_cmd['datetime'],
+                       result['response']))
+        result['latency'] = time.time() - start
+        return result
+
     def _execute_trade_cmd(self, trade_cmd, users, expire_seconds,
-                           entrust_prop, send_interval):
+                           entrust_prop, send_interval, lanes=None):
         """分发交易指令到对应的 user 并执行
         :param trade_cmd:
         :param users:
         :param expire_seconds:
         :param entrust_prop:
         :param send_interval:
-        :return:
+        :param lanes: 与 users 一一对应的单线程执行器，不为 None 时提交到各 user 的执行器后立即返回，
+            不等待执行完成，见 _submit_trade_cmd
+        :return: [] 各 user 的执行结果，并发执行时为各 user 执行结果的 Future
         """
+        if lanes is not None:
+            return self._submit_trade_cmd(trade_cmd, users, expire_seconds,
+                                          entrust_prop, send_interval, lanes)
+        results = []
         for user in users:
-            # check expire
-            now = datetime.now()
-            expire = (now - trade_cmd['datetime']).total_seconds()
-            if expire > expire_seconds:
-                log.warning(
-                    '策略 [{}] 指令(股票: {} 动作: {} 数量: {} 价格: {})超时，指令产生时间: {} 当前时间: {}, 超过设置的最大过期时间 {} 秒, 被丢弃'.
-                    format(trade_cmd['strategy_name'], trade_cmd['stock_code'],
-                           trade_cmd['action'], trade_cmd['amount'],
-                           trade_cmd['price'], trade_cmd['datetime'], now,
-                           expire_seconds))
+            if not self._check_trade_cmd(trade_cmd, expire_seconds):
                 break
-
-            # check price
-            price = trade_cmd['price']
-            if not self._is_number(price) or price <= 0:
-                log.warning(
-                    '策略 [{}] 指令(股票: {} 动作: {} 数量: {} 价格: {})超时，指令产生时间: {} 当前时间: {}, 价格无效 , 被丢弃'.
-                    format(trade_cmd['strategy_name'], trade_cmd['stock_code'],
-                           trade_cmd['action'], trade_cmd['amount'],
-                           trade_cmd['price'], trade_cmd['datetime'], now))
-                break
-
-            # check amount
-            if trade_cmd['amount'] <= 0:
-                log.warning(
-                    '策略 [{}] 指令(股票: {} 动作: {} 数量: {} 价格: {})超时，指令产生时间: {} 当前时间: {}, 买入股数无效 , 被丢弃'.
-                    format(trade_cmd['strategy_name'], trade_cmd['stock_code'],
-                           trade_cmd['action'], trade_cmd['amount'],
-                           trade_cmd['price'], trade_cmd['datetime'], now))
-                break
-
-            args = {
-                'security': trade_cmd['stock_code'],
-                'price': trade_cmd['price'],
-                'amount': trade_cmd['amount'],
-                'entrust_prop': entrust_prop
-            }
-            try:
-                response = getattr(user, trade_cmd['action'])(**args)
-            except exceptions.TradeError as e:
-                trader_name = type(user).__name__
-                err_msg = '{}: {}'.format(type(e).__name__, e.args)
-                log.error(
-                    '{} 执行 策略 [{}] 指令(股票: {} 动作: {} 数量: {} 价格: {} 指令产生时间: {}) 失败, 错误信息: {}'.
-                    format(trader_name, trade_cmd['strategy_name'],
-                           trade_cmd['stock_code'], trade_cmd['action'],
-                           trade_cmd['amount'], trade_cmd['price'],
-                           trade_cmd['datetime'], err_msg))
+            results.append(
+                self._execute_user_trade_cmd(user, trade_cmd, entrust_prop))
+        if results:
+            self.on_trade_results(trade_cmd, results)
+        return results
+
+    def _submit_trade_cmd(self, trade_cmd, users, expire_seconds,
+                          entrust_prop, send_interval, lanes):
+        """
+        将交易指令提交到各 user 的执行器，各 user 按各自的队列顺序执行，互不等待，
+        执行前检查指令是否过期，全部 user 执行完毕后调用 on_trade_results
+        :return: [] 各 user 执行结果的 Future，指令过期未执行时结果为 None
+        """
+        results = [None] * len(users)
+        pending = [len(users)]
+        lock = Lock()
+
+        def execute(user):
+            if not self._check_trade_cmd(trade_cmd, expire_seconds):
+                return None
+            result = self._execute_user_trade_cmd(user, trade_cmd,
+                                                  entrust_prop)
+            # 同一 user 的指令之间保持发送间隔，不影响其他 user
+            time.sleep(send_interval)
+            return result
+
+        def on_done(index, user, future):
+            error = future.exception()
+            if error is not None:
+                log.error('{} 执行 策略 [{}] 指令(股票: {} 动作: {}) 异常: {}'.format(
+                    type(user).__name__, trade_cmd['strategy_name'],
+                    trade_cmd['stock_code'], trade_cmd['action'], error))
+                result = {
+                    'user': type(user).__name__,
+                    'response': None,
+                    'error': '{}: {}'.format(type(error).__name__, error.args),
+                    'latency': 0
+                }
             else:
-                log.info(
-                    '策略 [{}] 指令(股票: {} 动作: {} 数量: {} 价格: {} 指令产生时间: {}) 执行成功, 返回: {}'.
-                    format(trade_cmd['strategy_name'], trade_cmd['stock_code'],
-                           trade_cmd['action'], trade_cmd['amount'],
-                           trade_cmd['price'], trade_cmd['datetime'],
-                           response))
+                result = future.result()
+            with lock:
+                results[index] = result
+                pending[0] -= 1
+                if pending[0] > 0:
+                    return
+            executed = [r for r in results if r is not None]
+            if executed:
+                self.on_trade_results(trade_cmd, executed)
+
+        futures = []
+        for index, (user, lane) in enumerate(zip(users, lanes)):
+            future = lane.submit(execute, user)
+            future.add_done_callback(
+                lambda f, index=index, user=user: on_done(index, user, f))
+            futures.append(future)
+        return futures
+
+    def on_trade_results(self, trade_cmd, results):
+        """
+        交易指令在各 user 上执行完毕后的回调，默认打印各账户的耗时，可重载以收集执行结果
+        :param trade_cmd: 交易指令
+        :param results: [] 各 user 的执行结果，见 _execute_user_trade_cmd
+        """
+        log.info('策略 [{}] 指令(股票: {} 动作: {}) 各账户耗时: {}'.format(
+            trade_cmd['strategy_name'], trade_cmd['stock_code'],
+            trade_cmd['action'], ', '.join(
+                '{}#{} {:.3f}s'.format(i, r['user'], r['latency'])
+                for i, r in enumerate(results))))
 
     def trade_worker(self,
                      users,
                      expire_seconds=120,
                      entrust_prop='limit',
-                     send_interval=0):
+                     send_interval=0,
+                     parallel=False):
         """
         :param send_interval: 交易发送间隔， 默认为0s。调大可防止卖出买入时买出单没有及时成交导致的买入金额不足
+        :param parallel: 是否将每条指令同时分发到全部 user 并发执行，每个 user 独占一个执行线程，
+            同一 user 上的指令仍按队列顺序执行，执行较慢的 user 不会阻塞其他 user
         """
+        lanes = None
+        if parallel:
+            lanes = [ThreadPoolExecutor(max_workers=1) for _ in users]
         while True:
             trade_cmd = self.trade_queue.get()
             self._execute_trade_cmd(trade_cmd, users, expire_seconds,
-                                    entrust_prop, send_interval)
-            time.sleep(send_interval)
+                                    entrust_prop, send_interval, lanes)
+            if lanes is None:
+                time.sleep(send_interval)
 
     def query_strategy_transaction(self, strategy, **kwargs):
         params = self.create_query_transaction_params(strategy)
 
-        rep = self.s.get(self.TRANSACTION_API, params=params)
+        rep = self.s.get(
+            self.TRANSACTION_API,
+            params=params,
+            headers=self._transaction_validators.get(strategy))
+        if rep.status_code == 304:
+            return []
         history = rep.json()
 
         transactions = self.extract_transactions(history)
+        transactions, cursor = self.filter_new_transactions(
+            strategy, transactions)
         self.project_transactions(transactions, **kwargs)
+
+        # 调仓记录处理成功后再推进游标及缓存校验信息
+        if cursor is not None:
+            self._transaction_cursors[strategy] = cursor
+        self._save_transaction_validators(strategy, rep)
         return self.order_transactions_sell_first(transactions)
 
+    def extract_transaction_cursor(self, transaction):
+        """
+        抽取原始调仓记录的游标，如调仓时间或调仓 id，用于只处理上次查询之后的新记录
+        :param transaction: 原始调仓记录
+        :return: 可比较大小的游标，返回 None 表示不支持增量获取
+        """
+        return None
+
+    def filter_new_transactions(self, strategy, transactions):
+        """
+        根据策略的游标过滤出新的调仓记录
+        :param strategy: 策略 id
+        :param transactions: [] 原始调仓记录的列表
+        :return: ([] 新的调仓记录, 新游标)
+        """
+        last_cursor = self._transaction_cursors.get(strategy)
+        new_transactions = []
+        new_cursor = last_cursor
+        for t in transactions:
+            cursor = self.extract_transaction_cursor(t)
+            if cursor is None:
+                new_transactions.append(t)
+                continue
+            if last_cursor is not None:
+                if cursor < last_cursor:
+                    continue
+                if cursor == last_cursor and not self.CURSOR_INCLUSIVE:
+                    continue
+            new_transactions.append(t)
+            if new_cursor is None or cursor > new_cursor:
+                new_cursor = cursor
+        return new_transactions, new_cursor
+
+    def _save_transaction_validators(self, strategy, rep):
+        validators = {}
+        if rep.headers.get('ETag'):
+            validators['If-None-Match'] = rep.headers['ETag']
+        if rep.headers.get('Last-Modified'):
+            validators['If-Modified-Since'] = rep.headers['Last-Modified']
+        self._transaction_validators[strategy] = validators or None
+
     def extract_transactions(self, history):
         """
         抽取接口返回中的调仓记录列表
@@ -335,8 +648,31 @@ class BaseFollower(object):
         """
         pass
 
+    def extract_transaction_batch(self, transaction):
+        """
+        抽取调仓记录所属的调仓批次，先卖后买只在同一批次内调整，批次之间保持原有顺序
+        :param transaction: 调仓记录
+        :return: 批次标识，返回 None 表示全部调仓记录为同一批次
+        """
+        return None
+
     def order_transactions_sell_first(self, transactions):
-        # 调整调仓记录的顺序为先卖再买
+        # 调整每批调仓记录的顺序为先卖再买
+        ordered_transactions = []
+        batch = []
+        batch_key = None
+        for t in transactions:
+            key = self.extract_transaction_batch(t)
+            if batch and key != batch_key:
+                ordered_transactions.extend(self._sell_first(batch))
+                batch = []
+            batch_key = key
+            batch.append(t)
+        ordered_transactions.extend(self._sell_first(batch))
+        return ordered_transactions
+
+    @staticmethod
+    def _sell_first(transactions):
         sell_first_transactions = []
         for t in transactions:
             if t['action'] == 'sell':
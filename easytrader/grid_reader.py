@@ -0,0 +1,163 @@
+# coding:utf-8
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from abc import ABCMeta, abstractmethod
+
+import six
+
+from .log import log
+
+if not sys.platform.startswith('darwin'):
+    import pywinauto.clipboard
+
+# 系统剪贴板及键盘焦点为整个系统共用，多个账户的客户端同时复制表格或模拟按键时会互相干扰，
+# 使用剪贴板及 type_keys 的操作需要持有该锁
+INPUT_LOCK = threading.RLock()
+
+
+def parse_grid_text(text, dtype=None):
+    """
+    解析客户端表格复制或导出的 tab 分隔文本，不经过 pandas 直接生成记录列表
+    列类型推断与 pandas.read_csv(na_filter=False) 一致：整列均为整数时转为 int，
+    均为数字时转为 float，否则保留 str
+    :param text: 表格文本，首行为表头
+    :param dtype: {列名: 类型} 指定列的类型，未指定的列自动推断
+    :return: [{列名: 值}]
+    """
+    dtype = dtype or {}
+    lines = [line for line in text.splitlines() if line]
+    if not lines:
+        return []
+
+    names = [
+        name if name else 'Unnamed: {}'.format(i)
+        for i, name in enumerate(lines[0].split('\t'))
+    ]
+    width = len(names)
+    rows = []
+    for line in lines[1:]:
+        row = line.split('\t')
+        if len(row) < width:
+            row.extend([''] * (width - len(row)))
+        rows.append(row[:width])
+    if not rows:
+        return []
+
+    columns = []
+    for name, values in zip(names, zip(*rows)):
+        if name in dtype:
+            cast = dtype[name]
+            columns.append([cast(v) for v in values])
+        else:
+            columns.append(_infer_column(values))
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def _infer_column(values):
+    for cast in (int, float):
+        try:
+            return [cast(v) for v in values]
+        except ValueError:
+            pass
+    return list(values)
+
+
+class BaseGridReader(six.with_metaclass(ABCMeta, object)):
+    """读取客户端 CVirtualGridCtrl 表格数据的方式"""
+
+    def __init__(self, trader):
+        """
+        :param trader: ClientTrader 对象
+        """
+        self._trader = trader
+
+    @abstractmethod
+    def read(self, control_id):
+        """
+        读取表格数据
+        :param control_id: 表格控件 id
+        :return: [{列名: 值}]
+        """
+        pass
+
+    def _get_grid(self, control_id):
+        return self._trader._main.window(
+            control_id=control_id, class_name='CVirtualGridCtrl')
+
+    def parse(self, text):
+        return parse_grid_text(text, self._trader._config.GRID_DTYPE)
+
+
+class ClipboardGridReader(BaseGridReader):
+    """Ctrl+A Ctrl+C 复制表格后读取剪贴板，会占用系统剪贴板"""
+    MAX_RETRY = 20
+    RETRY_INTERVAL = 0.05
+
+    def read(self, control_id):
+        with INPUT_LOCK:
+            self._get_grid(control_id).type_keys('^A^C')
+            text = self._get_clipboard_data()
+        return self.parse(text)
+
+    def _get_clipboard_data(self):
+        for _ in range(self.MAX_RETRY):
+            try:
+                return pywinauto.clipboard.GetData()
+            except Exception as e:
+                log.warning('{}, retry ......'.format(e))
+                time.sleep(self.RETRY_INTERVAL)
+        raise Exception('read clipboard failed')
+
+
+class ExportFileGridReader(BaseGridReader):
+    """Ctrl+S 将表格导出到临时文件后读取，不占用系统剪贴板"""
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, trader, export_dir=None, timeout=5):
+        """
+        :param trader: ClientTrader 对象
+        :param export_dir: 导出文件目录，默认为系统临时目录
+        :param timeout: 等待导出完成的最长时间，单位为秒
+        """
+        super(ExportFileGridReader, self).__init__(trader)
+        self._export_dir = export_dir or tempfile.gettempdir()
+        self._timeout = timeout
+
+    def read(self, control_id):
+        file_path = os.path.join(self._export_dir,
+                                 'grid_{}.xls'.format(uuid.uuid4().hex))
+        with INPUT_LOCK:
+            self._get_grid(control_id).type_keys('^S')
+            self._save_as(file_path)
+        try:
+            self._wait_export_finish(file_path)
+            with io.open(file_path, encoding='gbk') as f:
+                text = f.read()
+        finally:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        return self.parse(text)
+
+    def _save_as(self, file_path):
+        dialog = self._trader._app.top_window()
+        dialog.wait('ready', self._timeout)
+        dialog.window(class_name='Edit', found_index=0).set_edit_text(file_path)
+        dialog.type_keys('{ENTER}')
+
+    def _wait_export_finish(self, file_path):
+        # 文件大小在两次检查之间不再变化时认为导出完成
+        deadline = time.time() + self._timeout
+        last_size = -1
+        while time.time() < deadline:
+            if os.path.exists(file_path):
+                size = os.path.getsize(file_path)
+                if size > 0 and size == last_size:
+                    return
+                last_size = size
+            time.sleep(self.POLL_INTERVAL)
+        raise Exception('export grid to {} timeout'.format(file_path))
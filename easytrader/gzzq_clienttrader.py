@@ -1,13 +1,16 @@
 # coding:utf8
 from __future__ import division
 
+import functools
 import os
 import subprocess
+import threading
 from datetime import datetime, timedelta
 import tempfile
 import time
 import traceback
 import win32api
+import win32clipboard
 import win32gui
 from io import StringIO
 import re
@@ -20,7 +23,11 @@ import win32con
 from PIL import ImageGrab
 import pythoncom
 from . import helpers
+from .limit_price import LimitPriceStore
 from .log import log
+from .order_plan import interleave_orders, plan_orders
+from .trade_state import TradeState, TradeStateRefresher
+from .twap_scheduler import TwapScheduler
 from win32_utils import find_window_whnd, filter_hwnd_func
 from mass_utils import get_min_move_unit
 from termcolor import cprint
@@ -30,7 +37,23 @@ import tushare as ts
 SHIFT_PRICE = 0.0
 
 
+def gui_owner(func):
+    """方法执行期间持有 gui_lock，后台刷新线程与下单、撤单不会同时操作客户端界面"""
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self.gui_lock:
+            return func(self, *args, **kwargs)
+
+    return wrapper
+
+
 class GZZQClientTrader():
+    # 用于确认列表已切换到对应窗口的表头
+    TABLE_CHECK_COLUMNS = {'holding': '股票余额', 'apply': '委托数量'}
+    # 等待复制、导出完成时的轮询间隔，单位为秒
+    TABLE_POLL_INTERVAL = 0.05
+
     def __init__(self):
         self.Title = ' - 广州总部电信交易1'
         self.re_lpClassName = r'Afx:400000:0:0:.+:0'
@@ -42,12 +65,28 @@ class GZZQClientTrader():
         # 最小忽略金额，小于该金额的订单将被忽略
         self.ignore_mini_order = 10000
         self._csv_data_dic = {}
+        # 由 _csv_data_dic 中的持仓、委托数据解析得到，数据刷新后重建
+        self._trade_state = None
+        # 下单、撤单计数，_trade_state.epoch 小于该值时数据早于最近一次下单、撤单，需要重新读取
+        self._trade_epoch = 0
+        # 操作客户端界面前需要持有该锁
+        self.gui_lock = threading.RLock()
+        # 后台刷新持仓、委托，start_refresher 后启用
+        self._refresher = None
+        # 后台刷新持仓、委托的间隔，单位为秒
+        self.refresh_interval = 5
         # 统计twap期间的交易情况
         self._stock_deal_datetime_dic = {}
         # 为了防止频繁获取 csv文件耽误时间，做了一个小的缓存机制，超时时间设置
         self.csv_expire_timedelta = timedelta(seconds=15)
-        # 涨跌停价格字典
-        self._stock_limit_price_dic = {}
+        # 持仓、委托列表读取方式：copy 复制到剪贴板后读取，失败时改用 export；export 通过另存为对话框导出文件
+        self.table_read_mode = 'copy'
+        # 等待复制、导出完成的最长时间，单位为秒
+        self.table_read_timeout = 3
+        # 当日涨跌停价格，保存在 base_dir 下的 limit_price.json
+        self.limit_price_store = LimitPriceStore(os.path.join(self.base_dir, 'limit_price.json'))
+        # 盘口行情来源 market_data.MarketDataProvider，默认None 从客户端界面逐只读取
+        self.market_data = None
         # 控制监控器终止执行
         self.monitor_running = True
 
@@ -66,6 +105,7 @@ class GZZQClientTrader():
             password = account['password']
             exe_path = account['exe_path'] if 'exe_path' in account else exe_path
             self.base_dir = account['base_dir'] if 'base_dir' in account else self.base_dir
+            self.limit_price_store.file_path = os.path.join(self.base_dir, 'limit_price.json')
         self.login(user, password, exe_path)
 
     def login(self, user, password, exe_path):
@@ -337,6 +377,7 @@ class GZZQClientTrader():
     def balance(self):
         return self.get_balance()
 
+    @gui_owner
     def get_balance(self):
         self._set_foreground_window(self.capital_window_hwnd)
         time.sleep(0.3)
@@ -355,6 +396,7 @@ class GZZQClientTrader():
     def get_tot_capital(self):
         return helpers.get_text_by_hwnd(self.tot_capital_hwnd, cast=float)
 
+    @gui_owner
     def buy(self, stock_code, price, amount, remark="", **kwargs):
         """
         买入股票
@@ -380,6 +422,7 @@ class GZZQClientTrader():
             win32gui.SendMessage(self.buy_amount_hwnd, win32con.WM_SETTEXT, None, amount_str)  # 输入买入数量
             time.sleep(0.2)
             win32gui.SendMessage(self.buy_btn_hwnd, win32con.BM_CLICK, None, None)  # 买入确定
+            self._mark_trade_changed()
             log.info("买入： %s 价格：%s 数量：%s 金额：%.3f %s", stock_code, price_str, amount_str, amount * price, remark)
             time.sleep(0.5)
             # 查找是否存在确认框，如果有，将其关闭
@@ -389,6 +432,7 @@ class GZZQClientTrader():
             return False
         return True
 
+    @gui_owner
     def sell(self, stock_code, price, amount, remark="", **kwargs):
         """
         卖出股票
@@ -415,6 +459,7 @@ class GZZQClientTrader():
             win32gui.SendMessage(self.sell_amount_hwnd, win32con.WM_SETTEXT, None, amount_str)  # 输入卖出数量
             time.sleep(0.2)
             win32gui.SendMessage(self.sell_btn_hwnd, win32con.BM_CLICK, None, None)  # 卖出确定
+            self._mark_trade_changed()
             log.info("卖出： %s 价格：%s 数量：%s 金额：%.3f %s", stock_code, price_str, amount_str, amount * price, remark)
             time.sleep(0.5)
             # 查找是否存在确认框，如果有，将其关闭
@@ -424,6 +469,7 @@ class GZZQClientTrader():
             return False
         return True
 
+    @gui_owner
     def cancel_entrust(self, stock_code, direction, check_final_position=None, **kwargs):
         """
         撤单
@@ -437,10 +483,10 @@ class GZZQClientTrader():
 
         if kwargs.setdefault('only_dealvol_0', False):
             # 仅撤销未成交委托，且未成交委托价格不在1档盘口
-            apply_df = self.get_apply(stock_code)
-            if apply_df is not None and apply_df.shape[0] > 0:
-                apply_vol = apply_df['apply_vol'].sum()
-                deal_vol = apply_df['deal_vol'].sum()
+            stock_state = self.get_stock_state(stock_code)
+            if stock_state.apply_vol > 0 or stock_state.deal_vol > 0:
+                apply_vol = stock_state.apply_vol
+                deal_vol = stock_state.deal_vol
                 if not (apply_vol > 0 and deal_vol == 0):
                     log.debug('%s 累计申请买入：%d 已成交：%d，无需撤单', stock_code, apply_vol, deal_vol)
                     return
@@ -449,13 +495,13 @@ class GZZQClientTrader():
                 offer_buy_list = kwargs.setdefault('offer_buy_list', None)
                 offer_sell_list = kwargs.setdefault('offer_sell_list', None)
                 if offer_buy_list is not None and direction == 1:
-                    apply_price = apply_df['apply_price'].max()
+                    apply_price = stock_state.apply_price_max
                     offer_price = offer_buy_list[0][0]
                     if (not math.isnan(offer_price)) and apply_price >= offer_price:
                         log.debug('%s 当前买入委托价格：%.3f 盘口价格：%.3f，无需撤单', stock_code, apply_price, offer_price)
                         return
                 if offer_sell_list is not None and direction == 0:
-                    apply_price = apply_df['apply_price'].min()
+                    apply_price = stock_state.apply_price_min
                     offer_price = offer_sell_list[0][0]
                     if (not math.isnan(offer_price)) and apply_price >= offer_price:
                         log.debug('%s 当前买入委托价格：%.3f 盘口价格：%.3f，无需撤单', stock_code, apply_price, offer_price)
@@ -467,20 +513,14 @@ class GZZQClientTrader():
             go_straight_to_cancel_action = False
 
             # 获取持仓状态
-            position_df = self.get_position(stock_code)
-            apply_df = self.get_apply(stock_code)
-            if position_df is None or position_df.shape[0] == 0:
-                holding_vol = 0
-            else:
-                holding_vol = position_df['holding_position'].sum()
+            stock_state = self.get_stock_state(stock_code)
+            holding_vol = stock_state.holding_position
+            apply_vol = stock_state.apply_vol
+            deal_vol = stock_state.deal_vol
 
             # 获取委托单状态
-            if apply_df is None or apply_df.shape[0] == 0:
-                apply_vol = 0
-                deal_vol = 0
-            else:
-                apply_vol = apply_df['apply_vol'].sum()
-                deal_vol = apply_df['deal_vol'].sum()
+            apply_df = self.get_apply(stock_code)
+            if apply_df is not None and apply_df.shape[0] > 0:
 
                 # 如果 持仓 + 未成交委托总量 > 目标持仓（卖出相反）则撤单
                 if direction == 1:
@@ -501,7 +541,7 @@ class GZZQClientTrader():
                     # 获取涨跌停价格
                     high_limit_price, low_limit_price = self.get_limit_price(stock_code)
                     if direction == 1:
-                        apply_price = min(apply_df['apply_price'])
+                        apply_price = stock_state.apply_price_min
                         price_list = [pri for pri, vol in offer_buy_list if not math.isnan(pri)]
                         if len(price_list) == 0:
                             # 有可能跌停，有可能没有获取到盘口价格
@@ -517,7 +557,7 @@ class GZZQClientTrader():
                                             stock_code, holding_vol, check_final_position, apply_vol, deal_vol, apply_price, offer5_price)
                                 go_straight_to_cancel_action = True
                     elif direction == 0:
-                        apply_price = max(apply_df['apply_price'])
+                        apply_price = stock_state.apply_price_max
                         price_list = [pri for pri, vol in offer_buy_list if not math.isnan(pri)]
                         if len(price_list) == 0:
                             # 有可能跌停，有可能没有获取到盘口价格
@@ -572,8 +612,7 @@ class GZZQClientTrader():
             if not self.close_confirm_win_if_exist():
                 log.info('%s %s 委托', action, stock_code)
             # 撤单后需要清除相关持仓缓存
-            if 'apply' in self._csv_data_dic:
-                del self._csv_data_dic['apply']
+            self._mark_trade_changed()
         except:
             traceback.print_exc()
             return False
@@ -586,71 +625,100 @@ class GZZQClientTrader():
     def get_position(self, stock_code=None, refresh=False) -> pd.DataFrame:
         """
         获取当前持仓信息
+        :param stock_code: 默认None 返回全部持仓，否则返回该股票的持仓记录
         :return: 
         """
-        _, position_df = self._get_csv_data(refresh=refresh)
-        if position_df is not None:
-            position_df.rename(columns={'证券代码': 'stock_code',
-                                        '证券名称': 'sec_name',
-                                        '股票余额': 'holding_position',
-                                        '可用余额': 'sellable_position',
-                                        '参考盈亏': 'profit',
-                                        '盈亏比例(%)': 'profit_rate',
-                                        '参考成本价': 'cost_price',
-                                        '成本金额': 'cost_tot',
-                                        '市价': 'market_price',
-                                        '市值': 'market_value'}, inplace=True)
-            position_df['stock_code'] = ['%06d' % stock_code for stock_code in position_df['stock_code']]
-            position_df.set_index('stock_code', inplace=True)
+        trade_state = self.get_trade_state(refresh=refresh)
         if stock_code is None:
-            ret_df = position_df
-        elif position_df is None:
-            ret_df = None
-        else:
-            gdf = position_df.groupby(level=0)
-            if stock_code in gdf.groups:
-                ret_df = gdf.get_group(stock_code)
-            else:
-                ret_df = None
-        return ret_df
+            return trade_state.position_df
+        return trade_state.get_position(stock_code)
 
     def get_apply(self, stock_code=None, refresh=False) -> pd.DataFrame:
         """
         获取全部委托单信息
+        :param stock_code: 默认None 返回全部委托，否则返回该股票的委托记录
         :return: 
         """
-        # apply_df = self._get_csv_data(sub_win_from='holding', sub_win_to='apply')
-        apply_df, _ = self._get_csv_data(refresh=refresh)
-        if apply_df is not None:
-            apply_df.rename(columns={'委托日期': 'apply_date',
-                                     '委托时间': 'apply_time',
-                                     '证券代码': 'stock_code',
-                                     '证券名称': 'sec_name',
-                                     '操作': 'operation',
-                                     '委托数量': 'apply_vol',
-                                     '委托价格': 'apply_price',
-                                     '合同编号': 'sid',
-                                     '成交数量': 'deal_vol',
-                                     '成交金额': 'deal_amount',
-                                     '成交均价': 'deal_price',
-                                     '委托状态': 'status'}, inplace=True)
-            apply_df['stock_code'] = ['%06d' % stock_code for stock_code in apply_df['stock_code']]
-            apply_df.set_index('stock_code', inplace=True)
+        trade_state = self.get_trade_state(refresh=refresh)
         if stock_code is None:
-            ret_df = apply_df
-        elif apply_df is None:
-            ret_df = None
-        else:
-            # 按 stock_code 进行group
-            gdf = apply_df.groupby(level=0)
-            if stock_code in gdf.groups:
-                ret_df = gdf.get_group(stock_code)
-            else:
-                ret_df = None
-        return ret_df
+            return trade_state.apply_df
+        return trade_state.get_apply(stock_code)
+
+    def get_stock_state(self, stock_code, refresh=False):
+        """
+        获取单只股票的持仓及委托汇总
+        :param stock_code: 
+        :param refresh: 
+        :return: trade_state.StockState，包括 holding_position sellable_position market_value apply_vol deal_vol undeal_vol
+        """
+        return self.get_trade_state(refresh=refresh).get_stock(stock_code)
+
+    def get_trade_state(self, refresh=False) -> TradeState:
+        """
+        获取持仓及委托数据，导出的表格只在刷新后解析一次，缓存未过期时直接返回上次解析结果
+        返回的 DataFrame 为共享数据，调用方不要修改
+        启用后台刷新后直接返回最新的数据，refresh 为 True 时通知后台立刻刷新，不等待客户端界面；
+        最新的数据早于最近一次下单、撤单时重新读取，避免按下单前的持仓、委托重复下单
+        :param refresh: 
+        :return: 
+        """
+        trade_state = self._trade_state
+        if self._refresher is not None and trade_state is not None \
+                and trade_state.epoch >= self._trade_epoch:
+            if refresh:
+                self._refresher.request_refresh()
+            return trade_state
+        return self._refresh_trade_state(refresh=refresh)
+
+    def _refresh_trade_state(self, refresh=False) -> TradeState:
+        with self.gui_lock:
+            trade_state = self._trade_state
+            if self._refresher is not None and not refresh and trade_state is not None \
+                    and trade_state.epoch >= self._trade_epoch:
+                # 等待 gui_lock 期间后台已完成刷新
+                return trade_state
+            # 持有 gui_lock 期间不会下单、撤单，计数在读取前后不变
+            epoch = self._trade_epoch
+            apply_df, position_df = self._get_csv_data(refresh=refresh)
+            if trade_state is None or not trade_state.is_built_from(apply_df, position_df) \
+                    or trade_state.epoch < epoch:
+                version = 1 if trade_state is None else trade_state.version + 1
+                trade_state = TradeState(apply_df, position_df, version=version, epoch=epoch)
+                self._trade_state = trade_state
+        return trade_state
+
+    def start_refresher(self, interval=None):
+        """
+        启动后台线程定时刷新持仓及委托，get_position、get_apply 等不再等待刷新
+        :param interval: 刷新间隔，默认为 self.refresh_interval
+        :return: 
+        """
+        if self._refresher is not None:
+            return
+        refresher = TradeStateRefresher(lambda: self._refresh_trade_state(refresh=True),
+                                        interval or self.refresh_interval)
+        refresher.start()
+        self._refresher = refresher
+        log.info('启动后台刷新持仓及委托，间隔 %s 秒', refresher.interval)
+
+    def stop_refresher(self):
+        refresher, self._refresher = self._refresher, None
+        if refresher is not None:
+            refresher.stop()
+            log.info('停止后台刷新持仓及委托')
 
     def clean_csv_cache(self):
         self._csv_data_dic = {}
+        if self._refresher is not None:
+            self._refresher.request_refresh()
+
+    def _mark_trade_changed(self):
+        """
+        下单、撤单后调用，此前读取的持仓及委托数据作废
+        此后 get_trade_state 返回的数据一定在本次下单、撤单之后读取
+        """
+        self._trade_epoch += 1
+        self.clean_csv_cache()
 
     def _get_csv_data(self, win_name_list=['apply', 'holding'], refresh=False) -> pd.DataFrame:
         """
@@ -667,53 +735,124 @@ class GZZQClientTrader():
                 update_datetime, data_df = self._csv_data_dic[win_name]
                 if update_datetime + self.csv_expire_timedelta > datetime_now:
                     is_ok = True
-                    data_df = data_df.copy()
 
             if (not is_ok) or refresh:
-                file_name = 'table.xls'
-                file_path = os.path.join(self.base_dir, file_name)
-                # 如果文件存在，将其删除
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                # win32gui.SendMessage(self.refresh_entrust_hwnd, win32con.BM_CLICK, None, None)  # 刷新持仓
-                # time.sleep(0.1)
-                # 多次尝试获取仓位
-                # fast_mode = True
-                for try_count in range(3):
-                    self.goto_buy_win(sub_win=win_name)
-                    time.sleep(0.5)
-                    win32gui.SendMessage(self.refresh_entrust_hwnd, win32con.BM_CLICK, None, None)  # 刷新持仓
-                    time.sleep(0.2)
-                    shell = GZZQClientTrader._set_foreground_window(self.position_list_hwnd)
-
-                    # Ctrl +s 热键保存
-                    shell.SendKeys('^s')
-                    # 停顿时间太短可能导致窗口还没打开，或者及时窗口打开，但最终保存的文件大小为0
-                    time.sleep(1)
-                    # Enter 热键 切断
-                    shell.SendKeys('~')
-                    time.sleep(0.2)
-                    for try_count_sub in range(3):
-                        if not os.path.exists(file_path):
-                            log.warning('文件：%s 没有找到，重按 Enter 尝试', file_path)
-                            shell.SendKeys('~')
-                            time.sleep(0.2)
-                        else:
-                            break
-                    # 检查文件是否ok
-                    if os.path.exists(file_path):
-                        if os.path.getsize(file_path) > 0:
-                            break
-                        else:
-                            os.remove(file_path)
-                # 读取文件
-                data_df = GZZQClientTrader.read_export_csv(file_path)
+                stale_df = data_df if win_name in self._csv_data_dic else None
+                data_df = self._read_table(win_name)
                 # 保存 cache
                 if data_df is not None:
-                    self._csv_data_dic[win_name] = (datetime_now, data_df.copy())  # 暂不考虑 deep copy
+                    # 缓存的数据不会被修改，无需 copy
+                    self._csv_data_dic[win_name] = (datetime_now, data_df)
+                elif stale_df is not None:
+                    log.warning('%s 列表读取失败，使用上次读取的数据', win_name)
+                    data_df = stale_df
             data_df_list.append(data_df)
         return data_df_list
 
+    @gui_owner
+    def _read_table(self, win_name):
+        """
+        读取持仓或委托列表
+        :param win_name: 'holding' 持仓 'apply' 委托
+        :return: DataFrame，读取失败返回 None
+        """
+        data_df = None
+        if self.table_read_mode == 'copy':
+            data_df = self._read_table_by_copy(win_name)
+            if data_df is None:
+                log.warning('%s 列表复制失败，改为导出文件读取', win_name)
+        if data_df is None:
+            data_df = self._read_table_by_export(win_name)
+        return data_df
+
+    def _read_table_by_copy(self, win_name):
+        """
+        Ctrl+C 复制列表后读取剪贴板，剪贴板内容变化即认为复制完成，无需等待另存为对话框
+        表头不符时说明列表尚未切换到 win_name，重新读取
+        :param win_name: 
+        :return: DataFrame，读取失败返回 None
+        """
+        check_column = self.TABLE_CHECK_COLUMNS[win_name]
+        for try_count in range(3):
+            self.goto_buy_win(sub_win=win_name)
+            win32gui.SendMessage(self.refresh_entrust_hwnd, win32con.BM_CLICK, None, None)  # 刷新持仓
+            time.sleep(0.2)
+            GZZQClientTrader._set_foreground_window(self.position_list_hwnd)
+            try:
+                text = self._read_clipboard(retry_count=1)
+            except Exception:
+                continue
+            if len(text.strip()) == 0:
+                continue
+            data_df = self._project_position_str(text)
+            if check_column in data_df.columns:
+                return data_df
+            log.warning('%s 列表表头：%s 与预期不符，重新读取', win_name, list(data_df.columns))
+        return None
+
+    def _read_table_by_export(self, win_name):
+        """
+        Ctrl+S 导出列表到 base_dir 下的 table.xls 后读取
+        等待对话框打开及文件写入完成均为轮询，不再固定等待
+        :param win_name: 
+        :return: DataFrame，读取失败返回 None
+        """
+        file_name = 'table.xls'
+        file_path = os.path.join(self.base_dir, file_name)
+        # 如果文件存在，将其删除
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        # 多次尝试获取仓位
+        for try_count in range(3):
+            self.goto_buy_win(sub_win=win_name)
+            win32gui.SendMessage(self.refresh_entrust_hwnd, win32con.BM_CLICK, None, None)  # 刷新持仓
+            time.sleep(0.2)
+            shell = GZZQClientTrader._set_foreground_window(self.position_list_hwnd)
+            list_top_hwnd = win32gui.GetForegroundWindow()
+
+            # Ctrl +s 热键保存
+            shell.SendKeys('^s')
+            # 等待另存为对话框打开，对话框未打开时按 Enter 无效
+            if not self._wait_foreground_changed(list_top_hwnd):
+                log.warning('%s 另存为对话框没有打开', win_name)
+                continue
+            # Enter 热键 切断
+            shell.SendKeys('~')
+            for try_count_sub in range(3):
+                if self._wait_export_finish(file_path):
+                    break
+                log.warning('文件：%s 没有找到，重按 Enter 尝试', file_path)
+                shell.SendKeys('~')
+            # 检查文件是否ok
+            if os.path.exists(file_path):
+                if os.path.getsize(file_path) > 0:
+                    break
+                else:
+                    os.remove(file_path)
+        # 读取文件
+        return GZZQClientTrader.read_export_csv(file_path)
+
+    def _wait_foreground_changed(self, hwnd):
+        deadline = time.time() + self.table_read_timeout
+        while time.time() < deadline:
+            if win32gui.GetForegroundWindow() != hwnd:
+                return True
+            time.sleep(self.TABLE_POLL_INTERVAL)
+        return False
+
+    def _wait_export_finish(self, file_path):
+        """文件大小在两次检查之间不再变化时认为导出完成"""
+        deadline = time.time() + self.table_read_timeout
+        last_size = -1
+        while time.time() < deadline:
+            if os.path.exists(file_path):
+                size = os.path.getsize(file_path)
+                if size > 0 and size == last_size:
+                    return True
+                last_size = size
+            time.sleep(self.TABLE_POLL_INTERVAL)
+        return False
+
     @staticmethod
     def read_export_csv(file_path):
         """读取持仓数据文件，并备份"""
@@ -741,20 +880,37 @@ class GZZQClientTrader():
         df = pd.read_csv(reader, sep='\t')
         return df.to_dict('records')
 
-    def _read_clipboard(self):
-        for _ in range(15):
+    def _read_clipboard(self, retry_count=15):
+        """
+        Ctrl+C 复制当前窗口内容后读取剪贴板，剪贴板序列号变化即认为复制完成，
+        最长等待 table_read_timeout 秒
+        :param retry_count: 复制或读取剪贴板失败时的尝试次数
+        :return: str
+        """
+        for try_count in range(retry_count):
+            sequence_number = win32clipboard.GetClipboardSequenceNumber()
             try:
                 win32api.keybd_event(17, 0, 0, 0)
                 win32api.keybd_event(67, 0, 0, 0)
                 win32api.keybd_event(67, 0, win32con.KEYEVENTF_KEYUP, 0)
                 win32api.keybd_event(17, 0, win32con.KEYEVENTF_KEYUP, 0)
-                time.sleep(0.2)
-                return pyperclip.paste()
+                if self._wait_clipboard_changed(sequence_number):
+                    return pyperclip.paste()
+                log.warning('复制超时，重试')
             except Exception as e:
+                # 剪贴板可能仍被客户端占用
                 log.error('open clipboard failed: {}, retry...'.format(e))
-                time.sleep(1)
-        else:
-            raise Exception('read clipbord failed')
+                if try_count + 1 < retry_count:
+                    time.sleep(1)
+        raise Exception('read clipbord failed')
+
+    def _wait_clipboard_changed(self, sequence_number):
+        deadline = time.time() + self.table_read_timeout
+        while time.time() < deadline:
+            if win32clipboard.GetClipboardSequenceNumber() != sequence_number:
+                return True
+            time.sleep(self.TABLE_POLL_INTERVAL)
+        return False
 
     @staticmethod
     def _project_position_str(raw):
@@ -775,6 +931,7 @@ class GZZQClientTrader():
     def entrust(self):
         return self.get_entrust()
 
+    @gui_owner
     def get_entrust(self):
         win32gui.SendMessage(self.refresh_entrust_hwnd, win32con.BM_CLICK, None, None)  # 刷新持仓
         time.sleep(0.2)
@@ -785,9 +942,21 @@ class GZZQClientTrader():
 
     def get_bs_offer_data(self, stock_code):
         """
-        获取股票当前盘口价格，同时获取当日涨跌停价格
+        获取股票当前盘口价格
+        设置了 market_data 时从 market_data 读取，否则从客户端界面读取，同时获取当日涨跌停价格
         :param stock_code: 
-        :return: 
+        :return: offer_buy_list, offer_sell_list
+        """
+        if self.market_data is not None:
+            return self.market_data.get_book(stock_code)
+        return self.get_bs_offer_data_from_gui(stock_code)
+
+    @gui_owner
+    def get_bs_offer_data_from_gui(self, stock_code):
+        """
+        从客户端界面读取股票当前盘口价格，同时获取当日涨跌停价格
+        :param stock_code: 
+        :return: offer_buy_list, offer_sell_list
         """
         win32gui.SendMessage(self.buy_stock_code_hwnd, win32con.WM_SETTEXT, None, stock_code)  # 输入买入代码
         win32gui.SendMessage(self.refresh_entrust_hwnd, win32con.BM_CLICK, None, None)  # 刷新持仓
@@ -803,7 +972,7 @@ class GZZQClientTrader():
             high_limit_price = helpers.get_text_by_hwnd(self.high_limit_price_hwnd, cast=float)
             low_limit_price = helpers.get_text_by_hwnd(self.low_limit_price_hwnd, cast=float)
             if not (math.isnan(offer_buy_list[0][0]) and math.isnan(high_limit_price) and math.isnan(low_limit_price)):
-                self._stock_limit_price_dic[stock_code] = (high_limit_price, low_limit_price)
+                self.limit_price_store.set(stock_code, high_limit_price, low_limit_price)
                 break
             else:
                 time.sleep(0.3)
@@ -813,18 +982,45 @@ class GZZQClientTrader():
 
     def get_limit_price(self, stock_code):
         """
-        获取当日股票涨跌停价格
+        获取当日股票涨跌停价格，limit_price_store 中没有时从客户端界面读取
         :return: 
         """
-        if stock_code not in self._stock_limit_price_dic:
-            self.get_bs_offer_data(stock_code)
-        if stock_code in self._stock_limit_price_dic:
-            high_limit_price, low_limit_price = self._stock_limit_price_dic[stock_code]
+        limit_prices = self.limit_price_store.get(stock_code)
+        if limit_prices is None:
+            self.get_bs_offer_data_from_gui(stock_code)
+            limit_prices = self.limit_price_store.get(stock_code)
+        if limit_prices is not None:
+            high_limit_price, low_limit_price = limit_prices
         else:
             high_limit_price, low_limit_price = None, None
         return high_limit_price, low_limit_price
 
+    def preload_limit_price(self, pre_close_df, **kwargs):
+        """
+        根据前收盘价批量计算当日涨跌停价格，避免交易时逐只股票从客户端界面读取
+        没有涨跌幅限制的新股不计算，见 LimitPriceStore.preload
+        :param pre_close_df: index 为 stock_code，包括 pre_close 列，sec_name、no_limit 列可选
+        :param kwargs: 参数同 LimitPriceStore.preload
+        :return: 新增的股票数量
+        """
+        return self.limit_price_store.preload(pre_close_df, **kwargs)
+
     def auto_order(self, stock_target_df: pd.DataFrame, config):
+        """
+        对每一只股票使用对应的算法交易
+        config 中 background_refresh 为 True 时，交易期间在后台刷新持仓及委托，刷新间隔为 refresh_interval
+        其他参数同 _auto_order
+        """
+        background_refresh = config.setdefault('background_refresh', False)
+        if background_refresh:
+            self.start_refresher(config.setdefault('refresh_interval', self.refresh_interval))
+        try:
+            self._auto_order(stock_target_df, config)
+        finally:
+            if background_refresh:
+                self.stop_refresher()
+
+    def _auto_order(self, stock_target_df: pd.DataFrame, config):
         """
         对每一只股票使用对应的算法交易
         :param stock_target_df: 每一行一只股票，列信息分别为 stock_code(index), final_position, price, wap_mode[对应不同算法名称]
@@ -883,32 +1079,74 @@ class GZZQClientTrader():
         config['deal_end_datetime'] = config['datetime_end']
         config['deal_start_datetime'] = max([config['datetime_start'], start_datetime])
         config['deal_seconds'] = (config['deal_end_datetime'] - config['deal_start_datetime']).seconds
-        keep_wap_mode = config.setdefault('keep_wap_mode', None)
+        config.setdefault('keep_wap_mode', None)
+        config.setdefault('once', False)
         # 开市时段 循环执行算法交易
         self.init_twap()
         log.info('开始交易时段算法交易')
+        if config.setdefault('scheduler', False) and not config['once']:
+            self._run_scheduler(stock_bs_df, config, datetime_end)
+        else:
+            self._run_loop(stock_bs_df, config, datetime_end)
+
+        # 循环结束，再次执行一遍确认所有单子都已经下出去了，价格主动成交
+        if config.setdefault('final_deal', True):
+            log.info("剩余未完成订单统一执行对手价买入")
+            for idx in stock_bs_df.index:
+                bs_s = stock_bs_df.ix[idx]
+                self.deal_order_active(bs_s, config)
+
+    def _run_wap_algorithm(self, bs_s, config):
+        """
+        按 wap_mode 执行一次对应的算法交易，config 中设置 keep_wap_mode 时统一使用该算法
+        :param bs_s: reform_order 生成的一行
+        :param config: 
+        :return: 
+        """
+        keep_wap_mode = config['keep_wap_mode']
+        wap_mode = bs_s.wap_mode
+        if (wap_mode in ('twap', 'twap_initiative')) if keep_wap_mode is None else keep_wap_mode == 'twap_initiative':
+            self.twap_initiative(bs_s, config)  # self.twap_initiative(bs_s, config)
+        elif (wap_mode in ("twap_half_passive")) if keep_wap_mode is None else keep_wap_mode == "twap_half_passive":
+            self.twap_half_passive(bs_s, config)
+        elif (wap_mode in ("twap_half_initiative")) if keep_wap_mode is None else keep_wap_mode == "twap_half_initiative":
+            self.twap_half_initiative(bs_s, config)
+        elif (wap_mode in ("twap_half_initiative_by_offer", 'auto')) if keep_wap_mode is None else keep_wap_mode == "twap_half_initiative_by_offer":
+            self.twap_half_initiative_by_offer(bs_s, config)
+        elif (wap_mode in ("twap_half_passive_by_offer")) if keep_wap_mode is None else keep_wap_mode == "twap_half_passive_by_offer":
+            self.twap_half_passive_by_offer(bs_s, config)
+        else:
+            raise ValueError('%s wap_mode %s error' % (bs_s.name, wap_mode))
+
+    def _iter_prefetch(self, stock_codes):
+        """
+        依次返回股票代码，设置了 market_data 时分批预读随后即将交易的股票的盘口
+        :param stock_codes: 
+        :return: 
+        """
+        if self.market_data is None:
+            return iter(stock_codes)
+        return self.market_data.iter_prefetch(stock_codes)
+
+    def _run_loop(self, stock_bs_df, config, datetime_end):
+        """
+        每隔 config['interval'] 秒依次执行全部股票的算法交易
+        :param stock_bs_df: reform_order 生成的交易计划
+        :param config: 
+        :param datetime_end: 
+        :return: 
+        """
+        interval = config['interval']
         while datetime.now() < datetime_end or config.setdefault('once', False):
             # 每个股票执行独立的算法交易
             self.clean_csv_cache()
             log.info('* ' * 30)
-            for idx in stock_bs_df.index:
+            for idx in self._iter_prefetch(stock_bs_df.index):
                 bs_s = stock_bs_df.ix[idx]
                 # 将小额买入卖出过滤掉，除了建仓、清仓指令
                 if self.ignore_order(bs_s, config):
                     continue
-                wap_mode = bs_s.wap_mode
-                if (wap_mode in ('twap', 'twap_initiative')) if keep_wap_mode is None else keep_wap_mode == 'twap_initiative':
-                    self.twap_initiative(bs_s, config)  # self.twap_initiative(bs_s, config)
-                elif (wap_mode in ("twap_half_passive")) if keep_wap_mode is None else keep_wap_mode == "twap_half_passive":
-                    self.twap_half_passive(bs_s, config)
-                elif (wap_mode in ("twap_half_initiative")) if keep_wap_mode is None else keep_wap_mode == "twap_half_initiative":
-                    self.twap_half_initiative(bs_s, config)
-                elif (wap_mode in ("twap_half_initiative_by_offer", 'auto')) if keep_wap_mode is None else keep_wap_mode == "twap_half_initiative_by_offer":
-                    self.twap_half_initiative_by_offer(bs_s, config)
-                elif (wap_mode in ("twap_half_passive_by_offer")) if keep_wap_mode is None else keep_wap_mode == "twap_half_passive_by_offer":
-                    self.twap_half_passive_by_offer(bs_s, config)
-                else:
-                    raise ValueError('%s) %s wap_mode %s error' % (idx, bs_s.name, wap_mode))
+                self._run_wap_algorithm(bs_s, config)
             # 清空 csv 缓存
             self.clean_csv_cache()
             if config.setdefault('once', False):
@@ -916,32 +1154,64 @@ class GZZQClientTrader():
             # 休息 继续
             time.sleep(interval)
 
-        # 循环结束，再次执行一遍确认所有单子都已经下出去了，价格主动成交
-        if config.setdefault('final_deal', True):
-            log.info("剩余未完成订单统一执行对手价买入")
-            for idx in stock_bs_df.index:
-                bs_s = stock_bs_df.ix[idx]
-                self.deal_order_active(bs_s, config)
+    def _run_scheduler(self, stock_bs_df, config, datetime_end):
+        """
+        每只股票按 config['interval'] 独立安排执行时间，只执行到期的股票，
+        多只股票同时到期时剩余金额大的先执行，达成目标仓位后不再执行
+        :param stock_bs_df: reform_order 生成的交易计划
+        :param config: 
+        :param datetime_end: 
+        :return: 
+        """
+        scheduler = TwapScheduler(config['interval'])
+        for stock_code in stock_bs_df.index:
+            bs_s = stock_bs_df.loc[stock_code]
+            # 将小额买入卖出过滤掉，除了建仓、清仓指令
+            if not self.ignore_order(bs_s, config):
+                scheduler.add(stock_code, bs_s)
+        log.info('调度执行 %d 只股票的算法交易', len(scheduler))
+
+        def remaining_amount(task):
+            bs_s = task.payload
+            holding_position = self.get_stock_state(task.stock_code).holding_position
+            return abs(bs_s.final_position - holding_position) * bs_s.ref_price
+
+        while len(scheduler) > 0 and datetime.now() < datetime_end:
+            wait_seconds = scheduler.wait_seconds()
+            if wait_seconds > 0:
+                # 等待期间可能已到结束时间，避免 sleep 负数
+                time.sleep(max(0, min(wait_seconds, (datetime_end - datetime.now()).total_seconds())))
+                continue
+            # 每批到期股票使用最新的持仓、委托及盘口
+            self.clean_csv_cache()
+            tasks = scheduler.pop_due(remaining_amount)
+            log.info('* ' * 30)
+            task_dic = {task.stock_code: task for task in tasks}
+            for stock_code in self._iter_prefetch([task.stock_code for task in tasks]):
+                task = task_dic[stock_code]
+                if datetime.now() >= datetime_end:
+                    break
+                bs_s = task.payload
+                # 上一次执行下单、撤单后 get_stock_state 会重新读取，不会按下单前的数据判断
+                stock_state = self.get_stock_state(task.stock_code)
+                if stock_state.holding_position == bs_s.final_position and stock_state.undeal_vol == 0:
+                    log.info('%s 已经达成目标仓位 %d', task.stock_code, bs_s.final_position)
+                    scheduler.finish(task)
+                    continue
+                self._run_wap_algorithm(bs_s, config)
+                scheduler.reschedule(task)
+        # 清空 csv 缓存
+        self.clean_csv_cache()
 
     def sort_order(self, stock_bs_df):
         """
         对order进行排序
-        按照先卖后买，穿插组合
+        按照先卖后买，穿插组合，可用资金充足时先买后卖
         :param stock_bs_df: 
         :return: 
         """
-        # stock_bs_df.sort_values(by='direction', inplace=True)
         buy_first = True if self.get_available_amount() > 20000 else False
-        stock_bs_df['orderbyvalue'] = 0
-        stock_bs_dfg = stock_bs_df.groupby('direction')
-        for direction in stock_bs_dfg.groups:
-            stock_bs_df_sub = stock_bs_dfg.get_group(direction)
-            for n, idx in zip(range(stock_bs_df_sub.shape[0]), stock_bs_df_sub.index):
-                stock_bs_df['orderbyvalue'][idx] = n + (-0.5 if buy_first and direction == 1 else 0.5)
-        stock_bs_df.sort_values(by='orderbyvalue', inplace=True)
-        stock_bs_df.drop('orderbyvalue', axis=1, inplace=True)
-        # stock_bs_df['orderbyvalue'] = stock_bs_df['direction'].apply(lambda x: orderbyvalue_0++ if x == 0 else orderbyvalue_1++)
-        return stock_bs_df
+        return interleave_orders(stock_bs_df, buy_first)
 
     def reform_order(self, stock_target_df):
         """
@@ -950,23 +1220,8 @@ class GZZQClientTrader():
         :param stock_target_df: 
         :return: 
         """
-        position_df = self.position
-        # position_df['wap_mode'] = 'twap'
-        stock_bs_df = pd.merge(position_df, stock_target_df, left_index=True, right_index=True, how='outer').fillna(0)
-        stock_bs_df.rename(columns={'holding_position': 'init_position'}, inplace=True)
-        stock_bs_df['direction'] = (stock_bs_df.init_position < stock_bs_df.final_position).apply(
-            lambda x: 1 if x else 0)
-        stock_bs_df['wap_mode'] = stock_bs_df['wap_mode'].apply(lambda x: 'auto' if x == 0 else x)
-        # 如果 refprice == 0，则以 market_price 为准
-        for stock_code in stock_bs_df.index:
-            if stock_bs_df['ref_price'][stock_code] == 0 and stock_bs_df['market_price'][stock_code] != 0:
-                # log.info('%s ref_price --> market_price %f', stock_code, stock_bs_df['market_price'][stock_code])
-                stock_bs_df['ref_price'][stock_code] = stock_bs_df['market_price'][stock_code]
-        stock_bs_df = self.sort_order(stock_bs_df)
-        stock_bs_df = stock_bs_df[['sec_name', 'init_position', 'final_position', 'wap_mode', 'direction',
-                                   'sellable_position', 'ref_price', 'cost_price', 'market_price',
-                                   'profit_rate', 'profit', 'cost_tot', 'market_value']]
-        return stock_bs_df
+        buy_first = True if self.get_available_amount() > 20000 else False
+        return plan_orders(self.position, stock_target_df, buy_first)
 
     def calc_order_bs(self, stock_code, ref_price, direction, target_position, limit_position=None):
         """
@@ -1047,24 +1302,18 @@ class GZZQClientTrader():
         limit_amount = limit_position * ref_price
 
         # 获取持仓信息
-        position_df = self.get_position(stock_code, refresh=refresh)
-        if position_df is None or stock_code not in position_df.index:
-            holding_position = 0
-            holding_amount = 0
-        else:
-            holding_position = position_df.holding_position.sum()
-            holding_amount = position_df.market_value.sum()
+        stock_state = self.get_stock_state(stock_code, refresh=refresh)
+        holding_position = stock_state.holding_position
+        holding_amount = stock_state.market_value
 
         # 获取委托单数据
         apply_vol_has = 0
         apply_vol_deal = 0
         apply_vol_un_deal = 0
         if include_apply:
-            apply_df = self.get_apply(stock_code)
-            if apply_df is not None and apply_df.shape[0] > 0:
-                apply_vol_has = apply_df.apply_vol.sum()
-                apply_vol_deal = apply_df.deal_vol.sum()
-                apply_vol_un_deal = apply_vol_has - apply_vol_deal
+            apply_vol_has = stock_state.apply_vol
+            apply_vol_deal = stock_state.deal_vol
+            apply_vol_un_deal = stock_state.undeal_vol
 
         # 计算 目标委托数量 最终委托数量
         order_vol_target = abs(target_position - holding_position) - apply_vol_un_deal
@@ -1110,24 +1359,18 @@ class GZZQClientTrader():
         order_vol = 0
 
         # 获取持仓信息
-        position_df = self.get_position(stock_code, refresh=refresh)
-        if position_df is None or stock_code not in position_df.index:
-            holding_position = 0
-            holding_amount = 0
-        else:
-            holding_position = position_df.holding_position.sum()
-            holding_amount = position_df.market_value.sum()
+        stock_state = self.get_stock_state(stock_code, refresh=refresh)
+        holding_position = stock_state.holding_position
+        holding_amount = stock_state.market_value
 
         # 获取委托单数据
         apply_vol_has = 0
         apply_vol_deal = 0
         apply_vol_un_deal = 0
         if include_apply:
-            apply_df = self.get_apply(stock_code)
-            if apply_df is not None and apply_df.shape[0] > 0:
-                apply_vol_has = apply_df.apply_vol.sum()
-                apply_vol_deal = apply_df.deal_vol.sum()
-                apply_vol_un_deal = apply_vol_has - apply_vol_deal
+            apply_vol_has = stock_state.apply_vol
+            apply_vol_deal = stock_state.deal_vol
+            apply_vol_un_deal = stock_state.undeal_vol
 
         # 计算 目标委托数量 最终委托数量
         order_vol_target = abs(target_position - holding_position) - apply_vol_un_deal
@@ -1738,11 +1981,7 @@ class GZZQClientTrader():
             # if math.isnan(offer_price):
             #     return
             # 获取已发送的买卖申请
-            apply_df = self.get_apply(stock_code)
-            if apply_df is None or apply_df.shape[0] == 0:
-                apply_vol_has = 0
-            else:
-                apply_vol_has = apply_df.apply_vol.sum()
+            apply_vol_has = self.get_stock_state(stock_code).apply_vol
             # 设置移动点差
             min_move = get_min_move_unit(stock_code)
             shift_price = min_move if direction == 1 else -min_move
@@ -3,7 +3,6 @@ from __future__ import unicode_literals
 
 import re
 from datetime import datetime
-from threading import Thread
 
 from .follower import BaseFollower
 from .log import log
@@ -38,27 +37,31 @@ class JoinQuantFollower(BaseFollower):
                trade_cmd_expire_seconds=120,
                cmd_cache=True,
                entrust_prop='limit',
-               send_interval=0):
+               send_interval=0,
+               parallel_users=False):
         """跟踪joinquant对应的模拟交易，支持多用户多策略
         :param users: 支持easytrader的用户对象，支持使用 [] 指定多个用户
         :param strategies: joinquant 的模拟交易地址，支持使用 [] 指定多个模拟交易,
             地址类似 https://www.joinquant.com/algorithm/live/index?backtestId=xxx
         :param track_interval: 轮训模拟交易时间，单位为秒
         :param trade_cmd_expire_seconds: 交易指令过期时间, 单位为秒
-        :param cmd_cache: 是否读取存储历史执行过的指令，防止重启时重复执行已经交易过的指令
+        :param cmd_cache: 是否读取存储历史执行过的指令，防止重启时重复执行已经交易过的指令，为 False 时清空历史指令
         :param entrust_prop: 委托方式, 'limit' 为限价，'market' 为市价, 仅在银河实现
         :param send_interval: 交易发送间隔， 默认为0s。调大可防止卖出买入时卖出单没有及时成交导致的买入金额不足
+        :param parallel_users: 是否将每条指令同时分发到全部 user 并发执行，同一 user 上的指令仍按先卖后买的顺序执行
         """
         users = self.warp_list(users)
         strategies = self.warp_list(strategies)
 
         if cmd_cache:
             self.load_expired_cmd_cache()
+        else:
+            self.expired_cmds.clear()
 
         self.start_trader_thread(users, trade_cmd_expire_seconds, entrust_prop,
-                                 send_interval)
+                                 send_interval, parallel_users)
 
-        workers = []
+        tracks = []
         for strategy_url in strategies:
             try:
                 strategy_id = self.extract_strategy_id(strategy_url)
@@ -66,15 +69,9 @@ class JoinQuantFollower(BaseFollower):
             except:
                 log.error('抽取交易id和策略名失败, 无效的模拟交易url: {}'.format(strategy_url))
                 raise
-            strategy_worker = Thread(
-                target=self.track_strategy_worker,
-                args=[strategy_id, strategy_name],
-                kwargs={'interval': track_interval})
-            strategy_worker.start()
-            workers.append(strategy_worker)
+            tracks.append((strategy_id, strategy_name, {}))
             log.info('开始跟踪策略: {}'.format(strategy_name))
-        for worker in workers:
-            worker.join()
+        self.track_strategies(tracks, interval=track_interval)
 
     @staticmethod
     def extract_strategy_id(strategy_url):
@@ -94,6 +91,11 @@ class JoinQuantFollower(BaseFollower):
         transactions = history['data']['transaction']
         return transactions
 
+    def extract_transaction_cursor(self, transaction):
+        # 调仓时间只精确到分钟，游标包含边界，同一分钟内的重复指令由 expired_cmds 去重
+        time_str = '{} {}'.format(transaction['date'], transaction['time'])
+        return datetime.strptime(time_str, '%Y-%m-%d %H:%M')
+
     @staticmethod
     def stock_shuffle_to_prefix(stock):
         assert len(
@@ -0,0 +1,71 @@
+# coding:utf-8
+import bisect
+import threading
+
+
+class LatencyHistogram(object):
+    """按固定分桶统计耗时分布，用于观察客户端界面的实际响应速度"""
+    # 分桶上界，单位为毫秒，超过最后一个上界的记录计入溢出桶
+    BUCKETS_MS = (10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self, buckets_ms=None):
+        """
+        :param buckets_ms: 升序排列的分桶上界，单位为毫秒，默认为 BUCKETS_MS
+        """
+        self.buckets_ms = tuple(buckets_ms or self.BUCKETS_MS)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        """
+        记录一次耗时
+        :param seconds: 耗时，单位为秒
+        """
+        ms = seconds * 1000
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets_ms, ms)] += 1
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent):
+        """
+        估算分位数，返回该分位所在分桶的上界
+        :param percent: 分位，0 - 100
+        :return: 耗时上界，单位为秒，落在溢出桶时返回记录到的最大耗时
+        """
+        if not self.count:
+            return 0.0
+        rank = self.count * percent / 100.0
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                if i < len(self.buckets_ms):
+                    return self.buckets_ms[i] / 1000.0
+                break
+        return self.max
+
+    def to_dict(self):
+        """
+        :return: {'count': 次数, 'mean': 平均耗时, 'max': 最大耗时, 'buckets': {'<=10ms': 次数, ..., '>5000ms': 次数}}
+        """
+        labels = ['<={}ms'.format(b) for b in self.buckets_ms]
+        labels.append('>{}ms'.format(self.buckets_ms[-1]))
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'max': self.max,
+            'buckets': dict(zip(labels, self.counts))
+        }
+
+    def __repr__(self):
+        return '<LatencyHistogram count={} mean={:.3f}s p90={:.3f}s max={:.3f}s>'.format(
+            self.count, self.mean, self.percentile(90), self.max)
@@ -0,0 +1,196 @@
+# coding:utf-8
+"""
+当日涨跌停价格，按交易日保存，可以根据前收盘价及涨跌幅限制规则预先批量计算
+"""
+import json
+import math
+import os
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+
+from .log import log
+
+# 主板涨跌幅限制
+MAIN_BOARD_LIMIT_RATE = Decimal('0.1')
+# 主板 ST、*ST 股票涨跌幅限制，2025-07-07 起由 5% 调整为与主板相同的 10%
+ST_LIMIT_RATE = Decimal('0.05')
+ST_LIMIT_RATE_CHANGE_DATE = date(2025, 7, 7)
+# 创业板、科创板涨跌幅限制，ST 股票相同
+GROWTH_BOARD_LIMIT_RATE = Decimal('0.2')
+GROWTH_BOARD_PREFIXES = ('300', '301', '688', '689')
+# 北交所涨跌幅限制
+BSE_LIMIT_RATE = Decimal('0.3')
+BSE_PREFIXES = ('43', '83', '87', '88', '92')
+
+PRICE_TICK = Decimal('0.01')
+
+# 新股上市首日名称前缀为 N，注册制新股上市第 2~5 日为 C，期间不设涨跌幅限制
+NO_LIMIT_NAME_PREFIXES = ('N', 'C')
+
+
+def is_st_name(sec_name):
+    return sec_name is not None and 'ST' in str(sec_name).upper()
+
+
+def is_no_limit_name(sec_name):
+    return sec_name is not None and str(sec_name).startswith(NO_LIMIT_NAME_PREFIXES)
+
+
+def get_limit_rate(stock_code, is_st=False, trade_date=None):
+    """
+    :param stock_code: 6 位股票代码
+    :param is_st: 是否为 ST、*ST 股票
+    :param trade_date: 交易日，默认为当天
+    :return: Decimal 涨跌幅限制
+    """
+    if stock_code.startswith(GROWTH_BOARD_PREFIXES):
+        return GROWTH_BOARD_LIMIT_RATE
+    if stock_code.startswith(BSE_PREFIXES):
+        return BSE_LIMIT_RATE
+    if is_st and (trade_date or date.today()) < ST_LIMIT_RATE_CHANGE_DATE:
+        return ST_LIMIT_RATE
+    return MAIN_BOARD_LIMIT_RATE
+
+
+def calc_limit_price(pre_close, limit_rate):
+    """
+    涨跌停价格为前收盘价 ×(1 ± 涨跌幅限制)，四舍五入到分
+    :param pre_close: 前收盘价
+    :param limit_rate: 涨跌幅限制
+    :return: (high_limit_price, low_limit_price)
+    """
+    pre_close = Decimal(str(pre_close))
+    limit_rate = Decimal(str(limit_rate))
+    high_limit_price = (pre_close * (1 + limit_rate)).quantize(
+        PRICE_TICK, rounding=ROUND_HALF_UP)
+    low_limit_price = (pre_close * (1 - limit_rate)).quantize(
+        PRICE_TICK, rounding=ROUND_HALF_UP)
+    return float(high_limit_price), float(low_limit_price)
+
+
+class LimitPriceStore(object):
+    """
+    涨跌停价格缓存，只保存一个交易日的数据，交易日变化后自动清空
+    设置 file_path 后保存到文件，进程重启后同一交易日内无需重新获取
+    """
+
+    def __init__(self, file_path=None, today=date.today):
+        """
+        :param file_path: 保存文件路径，json 格式，None 表示不保存
+        :param today: 返回当前交易日的函数
+        """
+        self.file_path = file_path
+        self._today = today
+        self._trade_date = None
+        self._prices = {}
+        # 由前收盘价计算得到的股票，从客户端界面读取后移除
+        self._preloaded = set()
+        self._loaded = False
+
+    def _check_date(self):
+        trade_date = self._today().isoformat()
+        if not self._loaded:
+            self._loaded = True
+            self.load()
+        if self._trade_date != trade_date:
+            if self._prices:
+                log.info('交易日 %s -> %s，清空涨跌停价格', self._trade_date, trade_date)
+            self._trade_date = trade_date
+            self._prices = {}
+            self._preloaded = set()
+
+    def get(self, stock_code):
+        """
+        :return: (high_limit_price, low_limit_price)，没有时返回 None
+        """
+        self._check_date()
+        return self._prices.get(stock_code)
+
+    def is_preloaded(self, stock_code):
+        """:return: 涨跌停价格是否由前收盘价计算得到，尚未从客户端界面确认"""
+        self._check_date()
+        return stock_code in self._preloaded
+
+    def set(self, stock_code, high_limit_price, low_limit_price, save=True):
+        """保存当日涨跌停价格，覆盖预先计算的价格，nan 不保存"""
+        if math.isnan(high_limit_price) or math.isnan(low_limit_price):
+            return
+        self._check_date()
+        self._prices[stock_code] = (high_limit_price, low_limit_price)
+        self._preloaded.discard(stock_code)
+        if save:
+            self.save()
+
+    def preload(self, pre_close_df, pre_close_col='pre_close', name_col='sec_name',
+                no_limit_col='no_limit'):
+        """
+        根据前收盘价批量计算当日涨跌停价格，已有的价格不覆盖
+        没有涨跌幅限制的股票不计算，交易时从客户端界面读取
+        :param pre_close_df: index 为 stock_code，包括前收盘价列，名称列可选，名称包含 ST 时按 ST 规则计算，
+            名称以 N、C 开头的新股视为没有涨跌幅限制
+        :param pre_close_col: 前收盘价列名
+        :param name_col: 证券名称列名
+        :param no_limit_col: 是否没有涨跌幅限制的列名，可选，为 True 的股票不计算
+        :return: 新增的股票数量
+        """
+        self._check_date()
+        trade_date = self._today()
+        has_name = name_col in pre_close_df.columns
+        has_no_limit = no_limit_col in pre_close_df.columns
+        count = 0
+        for stock_code, row in pre_close_df.iterrows():
+            pre_close = float(row[pre_close_col])
+            if stock_code in self._prices or math.isnan(pre_close) or pre_close <= 0:
+                continue
+            if (has_no_limit and row[no_limit_col] in (True, 1)) or \
+                    (has_name and is_no_limit_name(row[name_col])):
+                continue
+            is_st = has_name and is_st_name(row[name_col])
+            self._prices[stock_code] = calc_limit_price(
+                pre_close, get_limit_rate(stock_code, is_st, trade_date))
+            self._preloaded.add(stock_code)
+            count += 1
+        if count > 0:
+            self.save()
+        log.info('预先计算 %d 只股票当日涨跌停价格', count)
+        return count
+
+    def load(self):
+        if self.file_path is None or not os.path.exists(self.file_path):
+            return
+        try:
+            with open(self.file_path, encoding='utf-8') as f:
+                data = json.load(f)
+            trade_date = data['trade_date']
+            prices = {
+                stock_code: tuple(prices)
+                for stock_code, prices in data['prices'].items()
+            }
+            preloaded = set(data.get('preloaded', ())) & set(prices)
+        except (IOError, ValueError, KeyError, TypeError, AttributeError):
+            # 文件不完整或格式不符时忽略，重新获取
+            log.exception('读取涨跌停价格文件 %s 失败', self.file_path)
+            return
+        self._trade_date = trade_date
+        self._prices = prices
+        self._preloaded = preloaded
+
+    def save(self):
+        if self.file_path is None:
+            return
+        data = {
+            'trade_date': self._trade_date,
+            'prices': {
+                stock_code: list(prices)
+                for stock_code, prices in self._prices.items()
+            },
+            'preloaded': sorted(self._preloaded)
+        }
+        # 先写入临时文件再替换，避免进程中断时文件不完整
+        tmp_path = self.file_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.file_path)
+        except (IOError, OSError):
+            log.exception('保存涨跌停价格文件 %s 失败', self.file_path)
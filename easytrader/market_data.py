@@ -0,0 +1,284 @@
+# coding:utf-8
+"""
+算法交易使用的五档盘口行情
+
+盘口格式与 GZZQClientTrader.get_bs_offer_data 相同：
+(offer_buy_list, offer_sell_list)，各为 5 档 [价格, 数量(手)]，没有数据的档位为 nan
+"""
+import math
+import os
+import time
+from abc import ABCMeta, abstractmethod
+
+import pandas as pd
+import six
+
+from .log import log
+
+try:
+    import tushare as ts
+except ImportError:
+    ts = None
+
+OFFER_LEVELS = 5
+NAN_BOOK_LEVEL = [float('nan'), float('nan')]
+
+# 买 1~5 档、卖 1~5 档的价格及数量列名，与 tushare.get_realtime_quotes 相同
+BUY_COLUMNS = [('b%d_p' % n, 'b%d_v' % n) for n in range(1, OFFER_LEVELS + 1)]
+SELL_COLUMNS = [('a%d_p' % n, 'a%d_v' % n) for n in range(1, OFFER_LEVELS + 1)]
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+def book_from_row(row, volume_unit=1):
+    """
+    :param row: 包含 BUY_COLUMNS、SELL_COLUMNS 的行，dict 或 Series
+    :param volume_unit: 数量单位对应的手数，数据以股为单位时为 0.01
+    :return: (offer_buy_list, offer_sell_list)，价格为 0 的档位视为没有数据
+    """
+    books = []
+    for columns in (BUY_COLUMNS, SELL_COLUMNS):
+        book = []
+        for price_col, vol_col in columns:
+            price = _to_float(row.get(price_col))
+            if math.isnan(price) or price <= 0:
+                book.append(list(NAN_BOOK_LEVEL))
+            else:
+                book.append([price, _to_float(row.get(vol_col)) * volume_unit])
+        books.append(book)
+    return books[0], books[1]
+
+
+def empty_book():
+    return ([list(NAN_BOOK_LEVEL) for _ in range(OFFER_LEVELS)],
+            [list(NAN_BOOK_LEVEL) for _ in range(OFFER_LEVELS)])
+
+
+def is_empty_book(book):
+    offer_buy_list, offer_sell_list = book
+    return math.isnan(offer_buy_list[0][0]) and math.isnan(offer_sell_list[0][0])
+
+
+class BaseQuoteSource(six.with_metaclass(ABCMeta, object)):
+    """盘口行情来源，一次读取多只股票"""
+    # 是否为批量读取，逐只读取的来源不参与预读，使用时再读取
+    batch = True
+
+    @abstractmethod
+    def get_books(self, stock_codes):
+        """
+        :param stock_codes: [股票代码]
+        :return: {股票代码: (offer_buy_list, offer_sell_list)}，没有行情的股票不返回
+        """
+        pass
+
+
+class TushareQuoteSource(BaseQuoteSource):
+    """通过 tushare.get_realtime_quotes 批量读取新浪行情，需要安装 tushare"""
+    # 每次请求的最多股票数量
+    MAX_CODES_PER_REQUEST = 100
+
+    def __init__(self):
+        if ts is None:
+            raise ImportError('TushareQuoteSource requires: pip install tushare')
+
+    def get_books(self, stock_codes):
+        stock_codes = list(stock_codes)
+        books = {}
+        for start in range(0, len(stock_codes), self.MAX_CODES_PER_REQUEST):
+            quote_df = ts.get_realtime_quotes(
+                stock_codes[start:start + self.MAX_CODES_PER_REQUEST])
+            if quote_df is None:
+                continue
+            for row in quote_df.to_dict('records'):
+                # 新浪行情数量单位为股
+                books[row['code']] = book_from_row(row, volume_unit=0.01)
+        return books
+
+
+class FileQuoteSource(BaseQuoteSource):
+    """
+    读取外部行情程序写入的盘口文件，文件为 csv，包括 code 及 BUY_COLUMNS、SELL_COLUMNS 列，数量单位为手
+    文件修改时间不变时不重新读取，超过 max_age 秒没有更新时视为没有行情
+    """
+
+    def __init__(self, file_path, max_age=10, volume_unit=1):
+        """
+        :param file_path: 盘口文件路径
+        :param max_age: 文件最长未更新时间，单位为秒
+        :param volume_unit: 数量单位对应的手数，文件以股为单位时为 0.01
+        """
+        self.file_path = file_path
+        self.max_age = max_age
+        self.volume_unit = volume_unit
+        self._mtime = None
+        self._books = {}
+
+    def get_books(self, stock_codes):
+        try:
+            mtime = os.path.getmtime(self.file_path)
+        except OSError:
+            log.warning('盘口文件 %s 不存在', self.file_path)
+            return {}
+        if time.time() - mtime > self.max_age:
+            log.warning('盘口文件 %s 超过 %d 秒没有更新', self.file_path,
+                        self.max_age)
+            return {}
+        if mtime != self._mtime:
+            quote_df = pd.read_csv(self.file_path, dtype={'code': str})
+            self._books = {
+                row['code']: book_from_row(row, self.volume_unit)
+                for row in quote_df.to_dict('records')
+            }
+            self._mtime = mtime
+        return {
+            stock_code: self._books[stock_code]
+            for stock_code in stock_codes if stock_code in self._books
+        }
+
+
+class GUIQuoteSource(BaseQuoteSource):
+    """逐只股票从交易客户端界面读取，速度慢，一般作为最后的备用来源"""
+    batch = False
+
+    def __init__(self, trader):
+        """
+        :param trader: GZZQClientTrader 对象
+        """
+        self._trader = trader
+
+    def get_books(self, stock_codes):
+        return {
+            stock_code: self._trader.get_bs_offer_data_from_gui(stock_code)
+            for stock_code in stock_codes
+        }
+
+
+class MarketDataProvider(object):
+    """
+    按顺序从多个行情来源批量读取盘口，前一个来源没有返回的股票再从下一个来源读取
+    iter_prefetch 分批预读即将交易的股票的盘口，每只股票的预读结果只供随后第一次 get_book 使用，
+    撤单、改价等后续检查重新读取，不使用已经过时的盘口
+    """
+    # 第一批预读的股票数量，之后按每只股票的交易耗时调整
+    PREFETCH_CHUNK_SIZE = 10
+    # 每批预读的最多股票数量
+    MAX_PREFETCH_CHUNK_SIZE = 100
+
+    def __init__(self, sources, ttl=3):
+        """
+        :param sources: [BaseQuoteSource]
+        :param ttl: 预读结果的有效时间，单位为秒，超过后重新读取
+        """
+        self.sources = list(sources)
+        self.ttl = ttl
+        self._books = {}
+
+    def get_books(self, stock_codes):
+        """
+        :param stock_codes: [股票代码]
+        :return: {股票代码: (offer_buy_list, offer_sell_list)}，所有来源都没有行情的股票为空盘口
+        """
+        now = time.time()
+        books = {}
+        missing = []
+        # 预读时批量来源没有行情的股票，只需再从逐只读取的来源读取
+        batch_missing = []
+        for stock_code in stock_codes:
+            # 预读结果只使用一次
+            prefetched = self._books.pop(stock_code, None)
+            if prefetched is None or now - prefetched[0] >= self.ttl:
+                missing.append(stock_code)
+            elif prefetched[1] is None:
+                batch_missing.append(stock_code)
+            else:
+                books[stock_code] = prefetched[1]
+        books.update(self._read_books(missing))
+        books.update(self._read_books(batch_missing, batch=False))
+        for stock_code in missing + batch_missing:
+            if is_empty_book(books[stock_code]):
+                log.warning('%s has no bs offer data', stock_code)
+        return books
+
+    def _read_books(self, stock_codes, batch=None):
+        """
+        :param batch: True 只从批量读取的来源读取，False 只从逐只读取的来源读取，None 从全部来源读取
+        :return: {股票代码: 盘口}，所有来源都没有行情的股票为空盘口
+        """
+        books = {}
+        missing = list(stock_codes)
+        for source in self.sources:
+            if not missing:
+                break
+            if batch is not None and getattr(source, 'batch', True) != batch:
+                continue
+            try:
+                source_books = source.get_books(missing)
+            except Exception:
+                log.exception('%s 读取盘口失败', type(source).__name__)
+                continue
+            remain = []
+            for stock_code in missing:
+                book = source_books.get(stock_code)
+                if book is None or is_empty_book(book):
+                    remain.append(stock_code)
+                else:
+                    books[stock_code] = book
+            missing = remain
+
+        for stock_code in missing:
+            books[stock_code] = empty_book()
+        return books
+
+    def get_book(self, stock_code):
+        return self.get_books([stock_code])[stock_code]
+
+    def prefetch(self, stock_codes):
+        """
+        从批量读取的来源读取盘口，供随后逐只股票的第一次 get_book 使用，
+        没有读取到的股票在 get_book 时再从全部来源读取，逐只读取的来源不会重复读取
+        """
+        now = time.time()
+        self._books = {
+            stock_code: (now, None if is_empty_book(book) else book)
+            for stock_code, book in self._read_books(stock_codes, batch=True).items()
+        }
+
+    def iter_prefetch(self, stock_codes):
+        """
+        分批预读盘口并依次返回股票代码，调用方处理完一批股票后才预读下一批
+        每批的股票数量按已处理股票的平均耗时计算，使一批股票在 ttl 秒内处理完，预读结果不会过期后重新读取，
+        每只股票耗时超过 ttl 时逐只预读
+        :param stock_codes: [股票代码]，按处理顺序排列
+        :return: 生成器，返回股票代码
+        """
+        stock_codes = list(stock_codes)
+        chunk_size = self.PREFETCH_CHUNK_SIZE
+        seconds_per_stock = None
+        start = 0
+        try:
+            while start < len(stock_codes):
+                chunk = stock_codes[start:start + chunk_size]
+                start += len(chunk)
+                self.prefetch(chunk)
+                chunk_start = time.time()
+                for stock_code in chunk:
+                    yield stock_code
+                elapsed = (time.time() - chunk_start) / len(chunk)
+                seconds_per_stock = elapsed if seconds_per_stock is None \
+                    else (seconds_per_stock + elapsed) / 2
+                if seconds_per_stock > 0:
+                    chunk_size = int(self.ttl / seconds_per_stock)
+                else:
+                    chunk_size = self.MAX_PREFETCH_CHUNK_SIZE
+                chunk_size = max(1, min(chunk_size, self.MAX_PREFETCH_CHUNK_SIZE))
+        finally:
+            self.invalidate()
+
+    def invalidate(self):
+        self._books = {}
@@ -0,0 +1,67 @@
+# coding:utf8
+from __future__ import division
+
+import numpy as np
+import pandas as pd
+
+# reform_order 输出的列
+PLAN_COLUMNS = [
+    'sec_name', 'init_position', 'final_position', 'wap_mode', 'direction',
+    'sellable_position', 'ref_price', 'cost_price', 'market_price',
+    'profit_rate', 'profit', 'cost_tot', 'market_value'
+]
+
+
+def plan_orders(position_df, stock_target_df, buy_first=False):
+    """
+    合并持仓及目标仓位，生成交易计划，全部为向量化计算
+    :param position_df: 持仓，index 为 stock_code，列同 GZZQClientTrader.position
+    :param stock_target_df: 目标仓位，index 为 stock_code，列为 final_position, ref_price, wap_mode
+    :param buy_first: 穿插排序时是否先买后卖
+    :return: stock_code(index), PLAN_COLUMNS
+        direction: 1 买入 0 卖出
+        ref_price: 为 0 时取 market_price
+    """
+    stock_bs_df = pd.merge(
+        position_df,
+        stock_target_df,
+        left_index=True,
+        right_index=True,
+        how='outer').fillna(0)
+    stock_bs_df.rename(
+        columns={'holding_position': 'init_position'}, inplace=True)
+    for col_name in PLAN_COLUMNS:
+        if col_name not in stock_bs_df.columns:
+            stock_bs_df[col_name] = 0
+
+    init_position = stock_bs_df['init_position'].values
+    final_position = stock_bs_df['final_position'].values
+    direction = (init_position < final_position).astype(np.int64)
+    stock_bs_df['direction'] = direction
+
+    wap_mode = stock_bs_df['wap_mode'].values
+    stock_bs_df['wap_mode'] = np.where(
+        pd.isnull(wap_mode) | (wap_mode == 0), 'auto', wap_mode.astype(object))
+
+    # 如果 ref_price == 0，则以 market_price 为准
+    ref_price = stock_bs_df['ref_price'].values
+    market_price = stock_bs_df['market_price'].values
+    stock_bs_df['ref_price'] = np.where(ref_price == 0, market_price,
+                                        ref_price)
+
+    stock_bs_df = interleave_orders(stock_bs_df, buy_first)
+    return stock_bs_df[PLAN_COLUMNS]
+
+
+def interleave_orders(stock_bs_df, buy_first=False):
+    """
+    买卖单穿插排序，默认卖单在前：卖1 买1 卖2 买2 ...，buy_first 时买单在前
+    同一方向内保持原有顺序
+    :param stock_bs_df: 包含 direction 列
+    :return: 排序后的 DataFrame
+    """
+    direction = stock_bs_df['direction'].values
+    rank = stock_bs_df.groupby('direction').cumcount().values
+    lead_direction = 1 if buy_first else 0
+    order_key = rank * 2 + (direction != lead_direction)
+    return stock_bs_df.iloc[np.argsort(order_key, kind='mergesort')]
@@ -1,18 +1,78 @@
 # coding:utf8
+import json
+import threading
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 
+from . import exceptions
 from . import helpers
+from . import wire
 
 
 def use(broker, host, port=1430, **kwargs):
-    return RemoteClient(broker, host, port)
+    return RemoteClient(broker, host, port, **kwargs)
 
 
 class RemoteClient:
-    def __init__(self, broker, host, port=1430, **kwargs):
-        self._s = requests.session()
-        self._api = 'http://{}:{}'.format(host, port)
+    """
+    远程交易服务客户端，可在多个线程间共享
+    每个线程使用独立的 session，所有 session 共用同一个连接池
+    """
+    # 等待异步任务时每次长轮询的最长秒数
+    JOB_POLL_WAIT = 10
+    # 建立连接的超时时间，单位为秒
+    CONNECT_TIMEOUT = 5
+    # 默认等待响应的超时时间，单位为秒，下单可能需要等待客户端弹窗，不宜过短
+    READ_TIMEOUT = 30
+    # 只读接口，请求失败时可以安全重试
+    IDEMPOTENT_ENDPOINTS = {
+        'accounts', 'balance', 'position', 'today_entrusts', 'today_trades',
+        'cancel_entrusts', 'jobs'
+    }
+    # 只读接口返回这些状态码时重试
+    RETRY_STATUS_CODES = {502, 503, 504}
+
+    def __init__(self, broker, host, port=1430, account_id=None, timeout=None,
+                 wire_format='json', pool_size=10, timeouts=None, retries=2,
+                 backoff=0.5, **kwargs):
+        """
+        :param account_id: 服务器上的账户 id, 同一服务器托管多个账户时用于区分账户，默认使用服务器的默认账户
+        :param timeout: 等待响应的超时时间，单位为秒，默认为 READ_TIMEOUT
+        :param wire_format: 响应数据格式，可选 json, columnar, msgpack，
+                            columnar 和 msgpack 中列表数据的列名只传输一次，msgpack 需要安装 msgpack
+        :param pool_size: 连接池大小，多线程共享时不小于线程数
+        :param timeouts: {接口名: 超时秒数} 单独指定接口的超时时间，如 {'buy': 10, 'position': 5}
+        :param retries: 连接失败、超时或服务不可用时的重试次数，只读接口才会重试，
+                        交易接口只在未建立连接时重试，避免重复下单
+        :param backoff: 重试退避基数，第 n 次重试前等待 backoff * 2 ** (n - 1) 秒
+        """
+        self._adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size)
+        self._headers = {'Accept': wire.WIRE_FORMATS[wire_format]}
+        self._local = threading.local()
+        self._root = 'http://{}:{}'.format(host, port)
+        self._api = self._root
+        if account_id is not None:
+            self._api += '/accounts/{}'.format(account_id)
         self._broker = broker
+        self._timeout = self.READ_TIMEOUT if timeout is None else timeout
+        self._timeouts = timeouts or {}
+        self._retries = retries
+        self._backoff = backoff
+
+    @property
+    def _s(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.session()
+            session.mount('http://', self._adapter)
+            session.mount('https://', self._adapter)
+            session.headers.update(self._headers)
+            self._local.session = session
+        return session
 
     def prepare(self, config_path=None, user=None, password=None, exe_path=None, comm_password=None,
                 **kwargs):
@@ -35,10 +95,7 @@ class RemoteClient:
 
         params['broker'] = self._broker
 
-        response = self._s.post(self._api + '/prepare', json=params)
-        if response.status_code >= 300:
-            raise Exception(response.json()['error'])
-        return response.json()
+        return self.common_post('prepare', params)
 
     @property
     def balance(self):
@@ -67,34 +124,237 @@ class RemoteClient:
         return self.common_get('exit')
 
     def common_get(self, endpoint):
-        response = self._s.get(self._api + '/' + endpoint)
-        if response.status_code >= 300:
-            raise Exception(response.json()['error'])
-        return response.json()
+        return self._request('GET', endpoint)
 
     def buy(self, security, price, amount, **kwargs):
         params = locals().copy()
         params.pop('self')
 
-        response = self._s.post(self._api + '/buy', json=params)
-        if response.status_code >= 300:
-            raise Exception(response.json()['error'])
-        return response.json()
+        return self.common_post('buy', params)
 
     def sell(self, security, price, amount, **kwargs):
         params = locals().copy()
         params.pop('self')
 
-        response = self._s.post(self._api + '/sell', json=params)
-        if response.status_code >= 300:
-            raise Exception(response.json()['error'])
-        return response.json()
+        return self.common_post('sell', params)
 
     def cancel_entrust(self, entrust_no):
         params = locals().copy()
         params.pop('self')
 
-        response = self._s.post(self._api + '/cancel_entrust', json=params)
+        return self.common_post('cancel_entrust', params)
+
+    def batch_buy(self, orders):
+        """
+        批量买入，一次请求完成
+        :param orders: [{'security': 证券代码, 'price': 价格, 'amount': 数量}]
+        :return: 与 orders 一一对应的结果列表，失败为 {'error': 错误信息}
+        """
+        return self.batch_trade([dict(o, action='buy') for o in orders])
+
+    def batch_sell(self, orders):
+        """
+        批量卖出，一次请求完成
+        :param orders: [{'security': 证券代码, 'price': 价格, 'amount': 数量}]
+        :return: 与 orders 一一对应的结果列表，失败为 {'error': 错误信息}
+        """
+        return self.batch_trade([dict(o, action='sell') for o in orders])
+
+    def batch_trade(self, orders):
+        """
+        批量买卖，一次请求完成，服务端先卖后买
+        :param orders: [{'action': 'buy' or 'sell', 'security': 证券代码, 'price': 价格, 'amount': 数量}]
+        :return: 与 orders 一一对应的结果列表，失败为 {'error': 错误信息}
+        """
+        return self.common_post('orders:batch', {'orders': orders})
+
+    def batch_cancel(self, entrust_nos):
+        """
+        批量撤单，一次请求完成
+        :param entrust_nos: 委托单号列表
+        :return: 与 entrust_nos 一一对应的结果列表
+        """
+        return self.common_post('cancels:batch', {'entrust_nos': entrust_nos})
+
+    def common_post(self, endpoint, params):
+        return self._request('POST', endpoint, json=params)
+
+    def buy_async(self, security, price, amount, **kwargs):
+        """
+        异步买入，服务端接受委托后立即返回
+        :return: 任务 id，通过 get_job 或 wait_job 获取委托结果
+        """
+        params = locals().copy()
+        params.pop('self')
+
+        return self.common_post('buy?async=1', params)['job_id']
+
+    def sell_async(self, security, price, amount, **kwargs):
+        """
+        异步卖出，服务端接受委托后立即返回
+        :return: 任务 id，通过 get_job 或 wait_job 获取委托结果
+        """
+        params = locals().copy()
+        params.pop('self')
+
+        return self.common_post('sell?async=1', params)['job_id']
+
+    def cancel_entrust_async(self, entrust_no):
+        """
+        异步撤单，服务端接受撤单后立即返回
+        :return: 任务 id，通过 get_job 或 wait_job 获取撤单结果
+        """
+        return self.common_post('cancel_entrust?async=1',
+                                {'entrust_no': entrust_no})['job_id']
+
+    def batch_trade_async(self, orders):
+        """
+        异步批量买卖，参数同 batch_trade
+        :return: 任务 id，通过 get_job 或 wait_job 获取结果列表
+        """
+        return self.common_post('orders:batch?async=1',
+                                {'orders': orders})['job_id']
+
+    def get_job(self, job_id, wait=0):
+        """
+        查询异步任务
+        :param job_id: 任务 id
+        :param wait: 任务未完成时服务端最多等待的秒数
+        :return: {'job_id', 'status': pending/running/done/failed, 'result': 执行结果, 'error': 错误信息, ...}
+        :raises RemoteJobNotFoundError: 任务不存在或已被服务端清理
+        """
+        connect_timeout, read_timeout = self._get_timeout('jobs')
+        if read_timeout is not None:
+            read_timeout += wait
+        try:
+            return self._request(
+                'GET',
+                'jobs/' + job_id,
+                root=self._root,
+                params={'wait': wait},
+                timeout=(connect_timeout, read_timeout))
+        except exceptions.RemoteServerError as e:
+            if e.status_code == 404:
+                raise exceptions.RemoteJobNotFoundError(str(e), e.status_code)
+            raise
+
+    def wait_job(self, job_id, timeout=None):
+        """
+        等待异步任务完成
+        :param timeout: 最长等待秒数，默认一直等待
+        :return: 任务执行结果，任务失败时抛出异常，任务不存在时抛出 RemoteJobNotFoundError
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            wait = self.JOB_POLL_WAIT
+            if deadline is not None:
+                wait = max(0, min(wait, deadline - time.time()))
+            job = self.get_job(job_id, wait)
+            if job['status'] == 'done':
+                return job['result']
+            if job['status'] == 'failed':
+                raise exceptions.RemoteServerError(job['error'])
+            if deadline is not None and time.time() >= deadline:
+                raise exceptions.RemoteTimeoutError(
+                    'wait job {} timeout'.format(job_id))
+
+    def _get_timeout(self, name):
+        """:return: (连接超时, 响应超时)"""
+        return self.CONNECT_TIMEOUT, self._timeouts.get(name, self._timeout)
+
+    def _send(self, method, endpoint, root=None, **kwargs):
+        """
+        发送请求，按重试策略处理连接失败、超时及服务不可用
+        :param endpoint: 接口路径，如 'position', 'buy?async=1', 'jobs/<job_id>'
+        :param root: 接口前缀，默认为当前账户的接口前缀
+        :return: requests.Response
+        """
+        name = endpoint.split('?')[0].split('/')[0]
+        idempotent = name in self.IDEMPOTENT_ENDPOINTS
+        url = (root or self._api) + '/' + endpoint
+        kwargs.setdefault('timeout', self._get_timeout(name))
+        for attempt in range(self._retries + 1):
+            can_retry = attempt < self._retries
+            try:
+                response = self._s.request(method, url, **kwargs)
+            except requests.exceptions.ConnectTimeout as e:
+                # 未建立连接，请求没有发出，任何接口都可以重试
+                error = exceptions.RemoteTimeoutError(
+                    'connect {} timeout: {}'.format(url, e))
+            except requests.exceptions.Timeout as e:
+                error = exceptions.RemoteTimeoutError(
+                    'request {} timeout: {}'.format(url, e))
+                can_retry = can_retry and idempotent
+            except requests.exceptions.ConnectionError as e:
+                error = exceptions.RemoteConnectionError(
+                    'request {} connection error: {}'.format(url, e))
+                # 连接被拒绝等未建立连接的错误，请求没有发出，任何接口都可以重试
+                can_retry = can_retry and (idempotent or _is_connect_error(e))
+            else:
+                if not (can_retry and idempotent and
+                        response.status_code in self.RETRY_STATUS_CODES):
+                    return response
+                error = None
+            if not can_retry:
+                raise error
+            time.sleep(self._backoff * 2 ** attempt)
+
+    def _request(self, method, endpoint, root=None, **kwargs):
+        return self._parse_response(
+            self._send(method, endpoint, root, **kwargs))
+
+    def _parse_response(self, response):
+        try:
+            data = wire.decode(response.content,
+                               response.headers.get('Content-Type'))
+        except ValueError:
+            raise exceptions.RemoteServerError(
+                'invalid response: {}'.format(response.content[:200]),
+                response.status_code)
         if response.status_code >= 300:
-            raise Exception(response.json()['error'])
-        return response.json()
+            raise exceptions.RemoteServerError(
+                data.get('error', data) if isinstance(data, dict) else data,
+                response.status_code)
+        return data
+
+    def subscribe(self):
+        """
+        订阅服务端推送的当日委托及成交变化，连接断开时生成器结束
+        :return: 生成器，每次返回 {'type': 'entrust' or 'trade', 'data': 变化的行, 'timestamp': 读取时间}
+        """
+        response = self._send(
+            'GET', 'events', stream=True, timeout=(self.CONNECT_TIMEOUT, None))
+        if response.status_code >= 300:
+            self._parse_response(response)
+        try:
+            for event in parse_sse(
+                    response.iter_lines(decode_unicode=True)):
+                yield event
+        finally:
+            response.close()
+
+
+def _is_connect_error(error):
+    """
+    :param error: requests.exceptions.ConnectionError
+    :return: 是否为建立连接阶段的错误，如连接被拒绝、域名解析失败
+    """
+    reason = error.args[0] if error.args else None
+    reason = getattr(reason, 'reason', reason)
+    return isinstance(reason, NewConnectionError)
+
+
+def parse_sse(lines):
+    """
+    解析 Server-Sent Events 文本行
+    :param lines: 文本行迭代器
+    :return: 生成器，返回每个事件 data 字段解析后的 json
+    """
+    data = []
+    for line in lines:
+        if not line:
+            if data:
+                yield json.loads('\n'.join(data))
+                data = []
+        elif line.startswith('data:'):
+            data.append(line[5:].lstrip())
@@ -2,7 +2,6 @@
 from __future__ import unicode_literals
 
 from datetime import datetime
-from threading import Thread
 
 from .follower import BaseFollower
 from .log import log
@@ -14,34 +13,34 @@ class RiceQuantFollower(BaseFollower):
         self.client = RQOpenClient(user, password, logger=log)
 
     def follow(self, users, run_id, track_interval=1,
-               trade_cmd_expire_seconds=120, cmd_cache=True, entrust_prop='limit', send_interval=0):
+               trade_cmd_expire_seconds=120, cmd_cache=True, entrust_prop='limit', send_interval=0,
+               parallel_users=False):
         """跟踪ricequant对应的模拟交易，支持多用户多策略
         :param users: 支持easytrader的用户对象，支持使用 [] 指定多个用户
         :param run_id: ricequant 的模拟交易ID，支持使用 [] 指定多个模拟交易
         :param track_interval: 轮训模拟交易时间，单位为秒
         :param trade_cmd_expire_seconds: 交易指令过期时间, 单位为秒
-        :param cmd_cache: 是否读取存储历史执行过的指令，防止重启时重复执行已经交易过的指令
+        :param cmd_cache: 是否读取存储历史执行过的指令，防止重启时重复执行已经交易过的指令，为 False 时清空历史指令
         :param entrust_prop: 委托方式, 'limit' 为限价，'market' 为市价, 仅在银河实现
         :param send_interval: 交易发送间隔， 默认为0s。调大可防止卖出买入时卖出单没有及时成交导致的买入金额不足
+        :param parallel_users: 是否将每条指令同时分发到全部 user 并发执行，同一 user 上的指令仍按先卖后买的顺序执行
         """
         users = self.warp_list(users)
         run_id_list = self.warp_list(run_id)
 
         if cmd_cache:
             self.load_expired_cmd_cache()
+        else:
+            self.expired_cmds.clear()
 
-        self.start_trader_thread(users, trade_cmd_expire_seconds, entrust_prop, send_interval)
+        self.start_trader_thread(users, trade_cmd_expire_seconds, entrust_prop, send_interval, parallel_users)
 
-        workers = []
+        tracks = []
         for run_id in run_id_list:
             strategy_name = self.extract_strategy_name(run_id)
-            strategy_worker = Thread(target=self.track_strategy_worker, args=[run_id, strategy_name],
-                                     kwargs={'interval': track_interval})
-            strategy_worker.start()
-            workers.append(strategy_worker)
+            tracks.append((run_id, strategy_name, {}))
             log.info('开始跟踪策略: {}'.format(strategy_name))
-        for worker in workers:
-            worker.join()
+        self.track_strategies(tracks, interval=track_interval)
 
     def extract_strategy_name(self, run_id):
         ret_json = self.client.get_positions(run_id)
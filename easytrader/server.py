@@ -1,13 +1,356 @@
 import functools
+import gzip
+import json
+import operator
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
+from six.moves.queue import Empty
 
 from . import api
+from . import wire
+from .exceptions import AccountNotFoundError, JobNotFoundError
 from .log import log
+from .watcher import AccountWatcher
 
 app = Flask(__name__)
 
-global_store = {}
+# 不带 /accounts/<account_id> 前缀的接口使用的账户，兼容单账户用法
+DEFAULT_ACCOUNT = 'default'
+
+# 各查询接口的缓存时间，单位为秒，未列出或为 0 时不缓存，但并发的相同查询仍只读取一次
+DEFAULT_READ_CACHE_TTL = {
+    'balance': 1,
+    'position': 1,
+    'today_entrusts': 1,
+    'today_trades': 1,
+}
+
+# 推送委托及成交变化时读取客户端的间隔，单位为秒
+DEFAULT_WATCH_INTERVAL = 1
+# 推送连接的保活间隔，单位为秒
+EVENT_KEEPALIVE = 15
+# 响应大于该字节数且客户端支持时使用 gzip 压缩
+COMPRESS_MIN_SIZE = 1024
+
+
+class AccountSession(object):
+    """
+    一个交易账户的会话
+    客户端界面不能被并发操作，该账户的所有操作都提交到账户独占的线程中串行执行，
+    不同账户各自拥有线程，互不阻塞，
+    只有使用系统剪贴板及键盘输入的操作通过 grid_reader.INPUT_LOCK 在所有账户之间串行
+    查询结果按 cache_ttl 缓存，并发的相同查询合并为一次读取，交易操作后清空缓存
+    """
+
+    def __init__(self, account_id, cache_ttl=None,
+                 watch_interval=DEFAULT_WATCH_INTERVAL):
+        """
+        :param account_id: 账户 id
+        :param cache_ttl: {属性名: 缓存秒数}，默认为 DEFAULT_READ_CACHE_TTL
+        :param watch_interval: 推送委托及成交变化时读取客户端的间隔，单位为秒
+        """
+        self.account_id = account_id
+        self.user = None
+        self.cache_ttl = DEFAULT_READ_CACHE_TTL if cache_ttl is None else cache_ttl
+        self.watcher = AccountWatcher(self, watch_interval)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        # {属性名: (数据, 快照时间戳)}
+        self._cache = {}
+        # {属性名: Future} 正在读取的查询
+        self._inflight = {}
+        self._cache_lock = threading.Lock()
+
+    def call(self, func, *args, **kwargs):
+        """
+        在账户线程中执行 func 并等待结果
+        :return: func 的返回值，func 抛出的异常原样抛出
+        """
+        return self._executor.submit(func, *args, **kwargs).result()
+
+    def prepare(self, broker, **kwargs):
+        """
+        在账户线程中创建并登陆交易对象
+        :param broker: 券商类型，同 easytrader.use
+        """
+        self.call(self._prepare, broker, **kwargs)
+
+    def _prepare(self, broker, **kwargs):
+        user = api.use(broker)
+        user.prepare(**kwargs)
+        self.user = user
+        self.invalidate()
+
+    def get(self, name):
+        """
+        读取交易对象的属性，如 balance, position
+        :param name: 属性名
+        :return: (数据, 快照时间戳)
+        """
+        ttl = self.cache_ttl.get(name, 0)
+        with self._cache_lock:
+            cached = self._cache.get(name)
+            if cached is not None and time.time() - cached[1] < ttl:
+                return cached
+            future = self._inflight.get(name)
+            if future is None:
+                future = self._executor.submit(self._read, name)
+                self._inflight[name] = future
+        return future.result()
+
+    def _read(self, name):
+        snapshot = None
+        timestamp = time.time()
+        try:
+            snapshot = (getattr(self._get_user(), name), timestamp)
+            return snapshot
+        finally:
+            with self._cache_lock:
+                self._inflight.pop(name, None)
+                if snapshot is not None:
+                    self._cache[name] = snapshot
+
+    def invoke(self, name, **kwargs):
+        """
+        调用交易对象的方法，如 buy, sell，调用后清空查询缓存
+        :param name: 方法名
+        :param kwargs: 方法参数
+        """
+        return self.apply(operator.methodcaller(name, **kwargs))
+
+    def apply(self, func, *args):
+        """
+        在账户线程中执行 func(user, *args)，执行后清空查询缓存
+        :return: func 的返回值
+        """
+        return self.submit(func, *args).result()
+
+    def submit(self, func, *args):
+        """
+        将 func(user, *args) 提交到账户线程后立即返回，执行后清空查询缓存
+        :return: Future
+        """
+        return self._executor.submit(self._apply, func, *args)
+
+    def _apply(self, func, *args):
+        try:
+            return func(self._get_user(), *args)
+        finally:
+            self.invalidate()
+
+    def invalidate(self):
+        """清空查询缓存"""
+        with self._cache_lock:
+            self._cache.clear()
+
+    def close(self):
+        self.watcher.close()
+        self._executor.shutdown(wait=False)
+
+    def _get_user(self):
+        if self.user is None:
+            raise Exception('account {} not prepared'.format(self.account_id))
+        return self.user
+
+
+class AccountRegistry(object):
+    """account_id -> AccountSession"""
+
+    def __init__(self, cache_ttl=None, watch_interval=DEFAULT_WATCH_INTERVAL):
+        """
+        :param cache_ttl: {属性名: 缓存秒数}，新建账户时使用，默认为 DEFAULT_READ_CACHE_TTL
+        :param watch_interval: 新建账户推送委托及成交变化时读取客户端的间隔，单位为秒
+        """
+        self.cache_ttl = dict(DEFAULT_READ_CACHE_TTL if cache_ttl is None else cache_ttl)
+        self.watch_interval = watch_interval
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get_or_create(self, account_id):
+        with self._lock:
+            if account_id not in self._sessions:
+                self._sessions[account_id] = AccountSession(
+                    account_id, self.cache_ttl, self.watch_interval)
+            return self._sessions[account_id]
+
+    def get(self, account_id):
+        with self._lock:
+            session = self._sessions.get(account_id)
+        if session is None:
+            raise AccountNotFoundError('account {} not prepared'.format(account_id))
+        return session
+
+    def remove(self, account_id):
+        with self._lock:
+            session = self._sessions.pop(account_id, None)
+        if session is not None:
+            session.close()
+
+    def ids(self):
+        with self._lock:
+            return list(self._sessions)
+
+
+accounts = AccountRegistry()
+
+
+class Job(object):
+    """异步提交的交易任务"""
+
+    def __init__(self, account_id, action, future):
+        self.id = uuid.uuid4().hex
+        self.account_id = account_id
+        self.action = action
+        self.future = future
+        self.created_at = time.time()
+        self.finished_at = None
+        future.add_done_callback(self._on_done)
+
+    def _on_done(self, future):
+        self.finished_at = time.time()
+
+    @property
+    def status(self):
+        """pending: 排队中, running: 执行中, done: 已完成, failed: 执行出错"""
+        if not self.future.done():
+            return 'running' if self.future.running() else 'pending'
+        return 'failed' if self.future.exception() is not None else 'done'
+
+    def to_dict(self):
+        status = self.status
+        data = {
+            'job_id': self.id,
+            'account_id': self.account_id,
+            'action': self.action,
+            'status': status,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+        if status == 'done':
+            data['result'] = self.future.result()
+        elif status == 'failed':
+            e = self.future.exception()
+            data['error'] = '{}: {}'.format(e.__class__, e)
+        return data
+
+
+class JobStore(object):
+    """job_id -> Job，已完成的任务保留 FINISHED_TTL 秒"""
+    FINISHED_TTL = 3600
+    # 查询任务时最长等待秒数
+    MAX_WAIT = 30
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, session, action, func, *args):
+        """
+        提交任务到账户线程
+        :param session: AccountSession
+        :param action: 任务名称，如 buy, sell
+        :return: Job
+        """
+        job = Job(session.account_id, action, session.submit(func, *args))
+        with self._lock:
+            self._evict()
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id, wait_seconds=0):
+        """
+        查询任务，任务未完成时最多等待 wait_seconds 秒
+        :return: Job
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise JobNotFoundError('job {} not found'.format(job_id))
+        if wait_seconds > 0:
+            wait([job.future], timeout=min(wait_seconds, self.MAX_WAIT))
+        return job
+
+    def _evict(self):
+        deadline = time.time() - self.FINISHED_TTL
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < deadline
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+jobs = JobStore()
+
+
+def _error_result(e):
+    return {'error': '{}: {}'.format(e.__class__, e)}
+
+
+def _align_results(results, count, missing_error):
+    """结果数量少于请求数量时补齐，保证每一项都有结果"""
+    results = list(results)[:count]
+    results.extend({'error': missing_error} for _ in range(count - len(results)))
+    return results
+
+
+def batch_trade(user, orders):
+    """
+    依次执行一批限价委托，交易对象支持 batch_trade 时一次完成
+    单笔委托失败不影响其他委托，返回结果与 orders 一一对应
+    :param orders: [{'action': 'buy' or 'sell', 'security': 证券代码, 'price': 价格, 'amount': 数量}]
+    :return: 与 orders 一一对应的结果列表，失败为 {'error': 错误信息}
+    """
+    if hasattr(user, 'batch_trade'):
+        try:
+            results = user.batch_trade(orders)
+        except Exception as e:
+            # 无法确定中断前哪些委托已经发出，每一项都返回错误，由调用方查询当日委托确认
+            log.exception('batch trade error')
+            return [_error_result(e) for _ in orders]
+        return _align_results(results, len(orders), 'no result')
+    results = []
+    for order in orders:
+        try:
+            if order['action'] not in ('buy', 'sell'):
+                raise ValueError('unknown action: {}'.format(order['action']))
+            trade = getattr(user, order['action'])
+            results.append(
+                trade(order['security'], order['price'], order['amount']))
+        except Exception as e:
+            log.exception('batch trade error')
+            results.append(_error_result(e))
+    return results
+
+
+def batch_cancel(user, entrust_nos):
+    """
+    撤销一批委托，交易对象支持 cancel_entrusts_by_no 时只读取一次撤单表格
+    单笔撤单失败不影响其他撤单，返回结果与 entrust_nos 一一对应
+    :param entrust_nos: 委托单号列表
+    :return: 与 entrust_nos 一一对应的结果列表
+    """
+    if hasattr(user, 'cancel_entrusts_by_no'):
+        try:
+            results = user.cancel_entrusts_by_no(entrust_nos)
+        except Exception as e:
+            log.exception('batch cancel error')
+            return [_error_result(e) for _ in entrust_nos]
+        return [
+            results.get(entrust_no, {'error': 'no result'})
+            for entrust_no in entrust_nos
+        ]
+    results = []
+    for entrust_no in entrust_nos:
+        try:
+            results.append(user.cancel_entrust(entrust_no))
+        except Exception as e:
+            log.exception('batch cancel error')
+            results.append(_error_result(e))
+    return results
 
 
 def error_handle(f):
@@ -15,6 +358,8 @@ def error_handle(f):
     def wrapper(*args, **kwargs):
         try:
             return f(*args, **kwargs)
+        except (AccountNotFoundError, JobNotFoundError) as e:
+            return jsonify({'error': '{}: {}'.format(e.__class__, e)}), 404
         except Exception as e:
             log.exception('server error')
             message = '{}: {}'.format(e.__class__, e)
@@ -23,112 +368,235 @@ def error_handle(f):
     return wrapper
 
 
+def encode_response(data, status=200):
+    """按请求的 Accept 头选择 json, columnar 或 msgpack 格式编码响应，默认为 json"""
+    mimetype = request.accept_mimetypes.best_match(
+        wire.available_mimetypes(), default=wire.JSON_MIMETYPE)
+    return Response(
+        wire.encode(data, mimetype), status=status, mimetype=mimetype)
+
+
+@app.after_request
+def compress_response(response):
+    if (response.is_streamed or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or 'gzip' not in request.headers.get('Accept-Encoding', '')):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(data))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def snapshot_response(snapshot):
+    """查询结果的响应，X-Snapshot-Time 响应头为数据读取时的时间戳"""
+    data, timestamp = snapshot
+    response = encode_response(data)
+    response.headers['X-Snapshot-Time'] = '{:.3f}'.format(timestamp)
+    return response
+
+
+def trade_response(account_id, action, func, *args):
+    """
+    执行交易类请求，带 async=1 参数时提交后立即返回任务 id，否则等待执行结果
+    :param func: func(user, *args)
+    """
+    session = accounts.get(account_id)
+    if request.args.get('async') in ('1', 'true'):
+        job = jobs.submit(session, action, func, *args)
+        return encode_response({'job_id': job.id}, 202)
+    return encode_response(session.apply(func, *args), 201)
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+@error_handle
+def get_job(job_id):
+    job = jobs.get(job_id, float(request.args.get('wait', 0)))
+
+    return encode_response(job.to_dict(), 200)
+
+
+@app.route('/accounts', methods=['GET'])
+@error_handle
+def get_accounts():
+    return encode_response(accounts.ids(), 200)
+
+
 @app.route('/prepare', methods=['POST'])
+@app.route('/accounts/<account_id>/prepare', methods=['POST'])
 @error_handle
-def post_prepare():
+def post_prepare(account_id=DEFAULT_ACCOUNT):
     json_data = request.get_json(force=True)
 
-    user = api.use(json_data.pop('broker'))
-    user.prepare(**json_data)
+    session = accounts.get_or_create(account_id)
+    session.prepare(json_data.pop('broker'), **json_data)
 
-    global_store['user'] = user
-    return jsonify({'msg': 'login success'}), 201
+    return encode_response({'msg': 'login success'}, 201)
 
 
 @app.route('/balance', methods=['GET'])
+@app.route('/accounts/<account_id>/balance', methods=['GET'])
 @error_handle
-def get_balance():
-    user = global_store['user']
-    balance = user.balance
+def get_balance(account_id=DEFAULT_ACCOUNT):
+    balance = accounts.get(account_id).get('balance')
 
-    return jsonify(balance), 200
+    return snapshot_response(balance)
 
 
 @app.route('/position', methods=['GET'])
+@app.route('/accounts/<account_id>/position', methods=['GET'])
 @error_handle
-def get_position():
-    user = global_store['user']
-    position = user.position
+def get_position(account_id=DEFAULT_ACCOUNT):
+    position = accounts.get(account_id).get('position')
 
-    return jsonify(position), 200
+    return snapshot_response(position)
 
 
 @app.route('/auto_ipo', methods=['GET'])
+@app.route('/accounts/<account_id>/auto_ipo', methods=['GET'])
 @error_handle
-def get_auto_ipo():
-    user = global_store['user']
-    res = user.auto_ipo()
+def get_auto_ipo(account_id=DEFAULT_ACCOUNT):
+    res = accounts.get(account_id).invoke('auto_ipo')
 
-    return jsonify(res), 200
+    return encode_response(res, 200)
 
 
 @app.route('/today_entrusts', methods=['GET'])
+@app.route('/accounts/<account_id>/today_entrusts', methods=['GET'])
 @error_handle
-def get_today_entrusts():
-    user = global_store['user']
-    today_entrusts = user.today_entrusts
+def get_today_entrusts(account_id=DEFAULT_ACCOUNT):
+    today_entrusts = accounts.get(account_id).get('today_entrusts')
 
-    return jsonify(today_entrusts), 200
+    return snapshot_response(today_entrusts)
 
 
 @app.route('/today_trades', methods=['GET'])
+@app.route('/accounts/<account_id>/today_trades', methods=['GET'])
 @error_handle
-def get_today_trades():
-    user = global_store['user']
-    today_trades = user.today_trades
+def get_today_trades(account_id=DEFAULT_ACCOUNT):
+    today_trades = accounts.get(account_id).get('today_trades')
 
-    return jsonify(today_trades), 200
+    return snapshot_response(today_trades)
 
 
 @app.route('/cancel_entrusts', methods=['GET'])
+@app.route('/accounts/<account_id>/cancel_entrusts', methods=['GET'])
 @error_handle
-def get_cancel_entrusts():
-    user = global_store['user']
-    cancel_entrusts = user.cancel_entrusts
+def get_cancel_entrusts(account_id=DEFAULT_ACCOUNT):
+    cancel_entrusts = accounts.get(account_id).get('cancel_entrusts')
 
-    return jsonify(cancel_entrusts), 200
+    return snapshot_response(cancel_entrusts)
 
 
 @app.route('/buy', methods=['POST'])
+@app.route('/accounts/<account_id>/buy', methods=['POST'])
 @error_handle
-def post_buy():
+def post_buy(account_id=DEFAULT_ACCOUNT):
     json_data = request.get_json(force=True)
-    user = global_store['user']
-    res = user.buy(**json_data)
 
-    return jsonify(res), 201
+    return trade_response(account_id, 'buy',
+                          operator.methodcaller('buy', **json_data))
 
 
 @app.route('/sell', methods=['POST'])
+@app.route('/accounts/<account_id>/sell', methods=['POST'])
 @error_handle
-def post_sell():
+def post_sell(account_id=DEFAULT_ACCOUNT):
     json_data = request.get_json(force=True)
 
-    user = global_store['user']
-    res = user.sell(**json_data)
-
-    return jsonify(res), 201
+    return trade_response(account_id, 'sell',
+                          operator.methodcaller('sell', **json_data))
 
 
 @app.route('/cancel_entrust', methods=['POST'])
+@app.route('/accounts/<account_id>/cancel_entrust', methods=['POST'])
 @error_handle
-def post_cancel_entrust():
+def post_cancel_entrust(account_id=DEFAULT_ACCOUNT):
     json_data = request.get_json(force=True)
 
-    user = global_store['user']
-    res = user.cancel_entrust(**json_data)
+    return trade_response(account_id, 'cancel_entrust',
+                          operator.methodcaller('cancel_entrust', **json_data))
+
 
-    return jsonify(res), 201
+@app.route('/orders:batch', methods=['POST'])
+@app.route('/accounts/<account_id>/orders:batch', methods=['POST'])
+@error_handle
+def post_orders_batch(account_id=DEFAULT_ACCOUNT):
+    json_data = request.get_json(force=True)
 
+    return trade_response(account_id, 'orders:batch', batch_trade,
+                          json_data['orders'])
 
-@app.route('/exit', methods=['GET'])
+
+@app.route('/cancels:batch', methods=['POST'])
+@app.route('/accounts/<account_id>/cancels:batch', methods=['POST'])
 @error_handle
-def get_exit():
-    user = global_store['user']
-    user.exit()
+def post_cancels_batch(account_id=DEFAULT_ACCOUNT):
+    json_data = request.get_json(force=True)
+
+    return trade_response(account_id, 'cancels:batch', batch_cancel,
+                          json_data['entrust_nos'])
 
-    return jsonify({'msg': 'exit success'}), 200
 
+@app.route('/events', methods=['GET'])
+@app.route('/accounts/<account_id>/events', methods=['GET'])
+@error_handle
+def get_events(account_id=DEFAULT_ACCOUNT):
+    """
+    以 Server-Sent Events 推送当日委托及成交的变化
+    事件类型为 entrust 或 trade, data 为 {'type', 'data': 变化的行, 'timestamp': 读取时间}
+    """
+    watcher = accounts.get(account_id).watcher
+    subscriber = watcher.subscribe()
+
+    def stream():
+        try:
+            yield ': connected\n\n'
+            while not subscriber.closed:
+                try:
+                    event = subscriber.queue.get(timeout=EVENT_KEEPALIVE)
+                except Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield 'event: {}\ndata: {}\n\n'.format(
+                    event['type'],
+                    json.dumps(event, ensure_ascii=False, default=str))
+        finally:
+            watcher.unsubscribe(subscriber)
+
+    return Response(stream(), mimetype='text/event-stream')
 
-def run(port=1430):
-    app.run(host='0.0.0.0', port=port)
+
+@app.route('/exit', methods=['GET'])
+@app.route('/accounts/<account_id>/exit', methods=['GET'])
+@error_handle
+def get_exit(account_id=DEFAULT_ACCOUNT):
+    accounts.get(account_id).invoke('exit')
+    accounts.remove(account_id)
+
+    return encode_response({'msg': 'exit success'}, 200)
+
+
+def run(port=1430, threads=16, cache_ttl=None,
+        watch_interval=DEFAULT_WATCH_INTERVAL):
+    """
+    启动服务，已安装 waitress 时使用 waitress 作为 WSGI 服务器，否则使用 flask 自带的多线程服务器，
+    生产环境通过 pip install easytrader[server] 安装 waitress
+    :param port: 端口
+    :param threads: waitress 处理请求的线程数，每个 /events 订阅连接占用一个线程
+    :param cache_ttl: {属性名: 缓存秒数}，覆盖 DEFAULT_READ_CACHE_TTL 中对应接口的缓存时间
+    :param watch_interval: 推送委托及成交变化时读取客户端的间隔，单位为秒
+    """
+    if cache_ttl:
+        accounts.cache_ttl.update(cache_ttl)
+    accounts.watch_interval = watch_interval
+    try:
+        import waitress
+    except ImportError:
+        log.warning('未安装 waitress, 使用 flask 自带的服务器, 生产环境请先 pip install easytrader[server]')
+        app.run(host='0.0.0.0', port=port, threaded=True)
+    else:
+        waitress.serve(app, host='0.0.0.0', port=port, threads=threads)
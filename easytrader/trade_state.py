@@ -0,0 +1,215 @@
+# coding:utf8
+from __future__ import division
+
+import threading
+import time
+from collections import namedtuple
+
+import pandas as pd
+
+from .log import log
+
+# 导出的持仓表格列名
+POSITION_COLUMNS = {
+    '证券代码': 'stock_code',
+    '证券名称': 'sec_name',
+    '股票余额': 'holding_position',
+    '可用余额': 'sellable_position',
+    '参考盈亏': 'profit',
+    '盈亏比例(%)': 'profit_rate',
+    '参考成本价': 'cost_price',
+    '成本金额': 'cost_tot',
+    '市价': 'market_price',
+    '市值': 'market_value'
+}
+
+# 导出的委托表格列名
+APPLY_COLUMNS = {
+    '委托日期': 'apply_date',
+    '委托时间': 'apply_time',
+    '证券代码': 'stock_code',
+    '证券名称': 'sec_name',
+    '操作': 'operation',
+    '委托数量': 'apply_vol',
+    '委托价格': 'apply_price',
+    '合同编号': 'sid',
+    '成交数量': 'deal_vol',
+    '成交金额': 'deal_amount',
+    '成交均价': 'deal_price',
+    '委托状态': 'status'
+}
+
+
+class StockState(
+        namedtuple('StockState', [
+            'holding_position', 'sellable_position', 'market_value',
+            'apply_vol', 'deal_vol', 'apply_price_min', 'apply_price_max'
+        ])):
+    """单只股票的持仓及委托汇总，同一股票多条记录时为合计值"""
+    __slots__ = ()
+
+    @property
+    def undeal_vol(self):
+        """已委托尚未成交的数量"""
+        return self.apply_vol - self.deal_vol
+
+
+EMPTY_STOCK_STATE = StockState(0, 0, 0, 0, 0, float('nan'), float('nan'))
+
+
+def project_table(raw_df, columns):
+    """
+    导出表格的列名转换为英文，证券代码补齐 6 位后作为 index
+    :param raw_df: 导出的表格，None 表示没有数据
+    :param columns: 列名对照
+    :return: DataFrame or None
+    """
+    if raw_df is None:
+        return None
+    df = raw_df.rename(columns=columns)
+    df['stock_code'] = ['%06d' % stock_code for stock_code in df['stock_code']]
+    return df.set_index('stock_code')
+
+
+class TradeState(object):
+    """
+    一次刷新得到的持仓及委托数据
+    表格只在创建时解析一次，按股票代码建立行索引及汇总，单只股票的查询为 O(1)
+    创建后不再修改，可以在多个线程之间共享，position_df、apply_df 及查询返回的数据调用方不要修改
+    """
+
+    def __init__(self, apply_raw, position_raw, version=0, epoch=0):
+        """
+        :param apply_raw: 导出的委托表格，None 表示没有数据
+        :param position_raw: 导出的持仓表格，None 表示没有数据
+        :param version: 版本号，每次刷新后递增
+        :param epoch: 开始读取表格时的下单、撤单计数，小于当前计数说明数据早于最近一次下单、撤单
+        """
+        self.version = version
+        self.epoch = epoch
+        self.timestamp = time.time()
+        self._apply_raw = apply_raw
+        self._position_raw = position_raw
+        self.position_df = project_table(position_raw, POSITION_COLUMNS)
+        self.apply_df = project_table(apply_raw, APPLY_COLUMNS)
+        self._position_rows = self._index_rows(self.position_df)
+        self._apply_rows = self._index_rows(self.apply_df)
+        self._stocks = self._summarize()
+
+    def is_built_from(self, apply_raw, position_raw):
+        """是否由同一份导出数据创建"""
+        return apply_raw is self._apply_raw and position_raw is self._position_raw
+
+    @staticmethod
+    def _index_rows(df):
+        if df is None:
+            return {}
+        return df.groupby(level=0, sort=False).indices
+
+    def _summarize(self):
+        frames = []
+        if self.position_df is not None and self.position_df.shape[0] > 0:
+            frames.append(
+                self.position_df.groupby(level=0)[[
+                    'holding_position', 'sellable_position', 'market_value'
+                ]].sum())
+        if self.apply_df is not None and self.apply_df.shape[0] > 0:
+            apply_group = self.apply_df.groupby(level=0)
+            apply_sum = apply_group[['apply_vol', 'deal_vol']].sum()
+            apply_sum['apply_price_min'] = apply_group['apply_price'].min()
+            apply_sum['apply_price_max'] = apply_group['apply_price'].max()
+            frames.append(apply_sum)
+        if not frames:
+            return {}
+        summary = pd.concat(frames, axis=1)
+        for field in StockState._fields:
+            if field not in summary.columns:
+                summary[field] = getattr(EMPTY_STOCK_STATE, field)
+        summary = summary[list(StockState._fields)]
+        volume_fields = [
+            'holding_position', 'sellable_position', 'market_value',
+            'apply_vol', 'deal_vol'
+        ]
+        summary[volume_fields] = summary[volume_fields].fillna(0)
+        return {
+            stock_code: StockState(*row)
+            for stock_code, row in zip(summary.index,
+                                       summary.itertuples(index=False))
+        }
+
+    def get_stock(self, stock_code):
+        """
+        :return: StockState，没有持仓及委托时各数量为 0
+        """
+        return self._stocks.get(stock_code, EMPTY_STOCK_STATE)
+
+    def get_position(self, stock_code):
+        """
+        :return: 该股票的持仓记录 DataFrame，没有时返回 None
+        """
+        return self._get_rows(self.position_df, self._position_rows,
+                              stock_code)
+
+    def get_apply(self, stock_code):
+        """
+        :return: 该股票的委托记录 DataFrame，没有时返回 None
+        """
+        return self._get_rows(self.apply_df, self._apply_rows, stock_code)
+
+    @staticmethod
+    def _get_rows(df, rows, stock_code):
+        if stock_code not in rows:
+            return None
+        return df.iloc[rows[stock_code]]
+
+
+class TradeStateRefresher(object):
+    """
+    后台线程定时刷新持仓及委托数据
+    刷新结果由 refresh 函数自行发布，读取方使用最新的 TradeState，数据早于最近一次下单、撤单时由读取方自行重新读取
+    """
+
+    def __init__(self, refresh, interval=5):
+        """
+        :param refresh: 刷新函数，无参数
+        :param interval: 刷新间隔，单位为秒
+        """
+        self._refresh = refresh
+        self.interval = interval
+        self._wakeup = threading.Event()
+        self._running = False
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._running
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """停止刷新，等待正在进行的刷新结束"""
+        self._running = False
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def request_refresh(self):
+        """立刻开始下一次刷新，不等待刷新完成"""
+        self._wakeup.set()
+
+    def _run(self):
+        while self._running:
+            self._wakeup.clear()
+            start = time.time()
+            try:
+                self._refresh()
+            except Exception:
+                log.exception('刷新持仓及委托数据失败')
+            self._wakeup.wait(max(0, self.interval - (time.time() - start)))
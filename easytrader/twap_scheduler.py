@@ -0,0 +1,113 @@
+# coding:utf-8
+"""
+算法交易调度：每只股票独立维护状态及下次执行时间，只执行到期的股票
+"""
+import heapq
+import itertools
+import time
+
+# 等待下一次执行
+TASK_WAITING = 'waiting'
+# 正在执行一次交易
+TASK_RUNNING = 'running'
+# 已达成目标，不再执行
+TASK_DONE = 'done'
+
+
+class StockTask(object):
+    """单只股票的算法交易状态"""
+
+    def __init__(self, stock_code, payload, due):
+        """
+        :param stock_code: 股票代码
+        :param payload: 执行交易所需的数据，如 reform_order 生成的一行
+        :param due: 下次执行时间，time.time() 时间戳
+        """
+        self.stock_code = stock_code
+        self.payload = payload
+        self.due = due
+        self.state = TASK_WAITING
+        # 已执行次数
+        self.slices = 0
+
+    def __repr__(self):
+        return '<StockTask {} {} due={:.3f} slices={}>'.format(
+            self.stock_code, self.state, self.due, self.slices)
+
+
+class TwapScheduler(object):
+    """
+    按下次执行时间排列的股票队列
+    同一时刻到期的多只股票中，剩余金额大的先执行，某只股票执行较慢时只推迟排在其后的到期股票，
+    未到期的股票不受影响
+    """
+
+    def __init__(self, interval, clock=time.time):
+        """
+        :param interval: 同一只股票两次执行的间隔，单位为秒
+        :param clock: 返回当前时间戳的函数
+        """
+        self.interval = interval
+        self._clock = clock
+        self._queue = []
+        self._counter = itertools.count()
+        self.tasks = {}
+
+    def __len__(self):
+        return len(self._queue)
+
+    def add(self, stock_code, payload, due=None):
+        """
+        :param due: 第一次执行时间，默认立刻执行
+        :return: StockTask
+        """
+        task = StockTask(stock_code, payload, self._clock() if due is None else due)
+        self.tasks[stock_code] = task
+        self._push(task)
+        return task
+
+    def _push(self, task):
+        heapq.heappush(self._queue, (task.due, next(self._counter), task))
+
+    def next_due(self):
+        """:return: 最早的执行时间，队列为空时返回 None"""
+        return self._queue[0][0] if self._queue else None
+
+    def wait_seconds(self):
+        """:return: 距离最早执行时间的秒数，已到期为 0，队列为空时返回 None"""
+        due = self.next_due()
+        if due is None:
+            return None
+        return max(0, due - self._clock())
+
+    def pop_due(self, priority=None):
+        """
+        取出全部已到期的股票，状态变为 TASK_RUNNING
+        :param priority: 函数，参数为 StockTask，返回剩余金额，默认按到期时间排列
+        :return: [StockTask] 按剩余金额从大到小排列
+        """
+        now = self._clock()
+        tasks = []
+        while self._queue and self._queue[0][0] <= now:
+            task = heapq.heappop(self._queue)[2]
+            task.state = TASK_RUNNING
+            tasks.append(task)
+        if priority is not None:
+            # sort 为稳定排序，剩余金额相同时仍按到期时间排列
+            tasks.sort(key=priority, reverse=True)
+        return tasks
+
+    def reschedule(self, task):
+        """
+        一次执行结束，按固定间隔安排下次执行，间隔从本次到期时间开始计算，
+        下次执行时间已过时立刻到期，与其他到期股票按剩余金额排序
+        """
+        task.slices += 1
+        task.due = max(task.due + self.interval, self._clock())
+        task.state = TASK_WAITING
+        self._push(task)
+
+    def finish(self, task):
+        """已达成目标，不再执行"""
+        task.slices += 1
+        task.state = TASK_DONE
@@ -0,0 +1,140 @@
+# coding:utf-8
+import threading
+import time
+
+from six.moves.queue import Queue, Full
+
+from .log import log
+
+# 当日委托的主键字段，按顺序取第一个存在的字段
+ENTRUST_KEY_FIELDS = ('合同编号', '委托编号', 'entrust_no')
+# 当日成交的主键字段，都不存在时以整行数据作为主键
+TRADE_KEY_FIELDS = ('成交编号', 'business_no')
+
+
+def row_key(row, key_fields):
+    for field in key_fields:
+        if field in row:
+            return row[field]
+    return tuple(sorted(row.items()))
+
+
+def diff_rows(previous, current, key_fields):
+    """
+    比较两次读取的表格数据
+    :param previous: {主键: 行} 上次的数据
+    :param current: [行] 本次读取的数据
+    :param key_fields: 主键字段
+    :return: ({主键: 行} 本次的数据, [新增或变化的行])
+    """
+    rows = {}
+    changes = []
+    for row in current:
+        key = row_key(row, key_fields)
+        rows[key] = row
+        if previous.get(key) != row:
+            changes.append(row)
+    return rows, changes
+
+
+class Subscriber(object):
+    """一个事件订阅者，事件积压超过 QUEUE_SIZE 时被关闭，需重新订阅"""
+    QUEUE_SIZE = 1000
+
+    def __init__(self):
+        self.queue = Queue(self.QUEUE_SIZE)
+        self.closed = False
+
+
+class AccountWatcher(object):
+    """
+    定时读取账户的当日委托及成交，与上次的结果比较后把变化推送给所有订阅者
+    无论有多少订阅者，每个周期只读取一次客户端，没有订阅者时停止读取
+    """
+    # (账户属性, 事件类型, 主键字段)
+    WATCH_TABLES = (
+        ('today_entrusts', 'entrust', ENTRUST_KEY_FIELDS),
+        ('today_trades', 'trade', TRADE_KEY_FIELDS),
+    )
+
+    def __init__(self, session, interval=1):
+        """
+        :param session: server.AccountSession
+        :param interval: 读取间隔，单位为秒
+        """
+        self._session = session
+        self.interval = interval
+        self._subscribers = []
+        self._snapshots = {}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """
+        订阅事件，没有运行中的读取线程时启动读取线程
+        :return: Subscriber
+        """
+        subscriber = Subscriber()
+        with self._lock:
+            self._subscribers.append(subscriber)
+            if self._thread is None:
+                # 重新开始读取时以第一次读取的数据为基准，不推送
+                self._snapshots = {}
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        subscriber.closed = True
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def close(self):
+        """关闭所有订阅者"""
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, []
+        for subscriber in subscribers:
+            subscriber.closed = True
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            start = time.time()
+            try:
+                self.poll()
+            except Exception:
+                log.exception('watch account {} error'.format(
+                    self._session.account_id))
+            time.sleep(max(0, self.interval - (time.time() - start)))
+
+    def poll(self):
+        """读取一次数据并推送变化"""
+        for name, event_type, key_fields in self.WATCH_TABLES:
+            data, timestamp = self._session.get(name)
+            first_read = name not in self._snapshots
+            self._snapshots[name], changes = diff_rows(
+                self._snapshots.get(name, {}), data, key_fields)
+            if first_read:
+                continue
+            for row in changes:
+                self.publish({
+                    'type': event_type,
+                    'data': row,
+                    'timestamp': timestamp
+                })
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(event)
+            except Full:
+                log.warning('subscriber of account {} is too slow, closed'.format(
+                    self._session.account_id))
+                self.unsubscribe(subscriber)
@@ -0,0 +1,92 @@
+# coding:utf-8
+"""
+server 与 remoteclient 之间的数据编码
+
+json: 原有格式
+columnar: 列表数据编码为 {'columns': [列名], 'rows': [[值]]}，列名只出现一次，再以 json 序列化
+msgpack: 同 columnar，以 msgpack 序列化，需要安装 msgpack
+"""
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MIMETYPE = 'application/json'
+COLUMNAR_MIMETYPE = 'application/vnd.easytrader.columnar+json'
+MSGPACK_MIMETYPE = 'application/x-msgpack'
+
+WIRE_FORMATS = {
+    'json': JSON_MIMETYPE,
+    'columnar': COLUMNAR_MIMETYPE,
+    'msgpack': MSGPACK_MIMETYPE,
+}
+
+
+def available_mimetypes():
+    """服务端可以输出的格式，按优先级排列，json 在前以兼容未指定格式的客户端"""
+    mimetypes = [JSON_MIMETYPE, COLUMNAR_MIMETYPE]
+    if msgpack is not None:
+        mimetypes.append(MSGPACK_MIMETYPE)
+    return mimetypes
+
+
+def to_columnar(data):
+    """
+    列名相同的字典列表转换为列式结构，其他数据原样包装
+    :return: {'columns': [列名], 'rows': [[值]]} 或 {'value': data}
+    """
+    if isinstance(data, list) and data and all(
+            isinstance(row, dict) for row in data):
+        columns = list(data[0])
+        if all(len(row) == len(columns) for row in data) and all(
+                all(c in row for c in columns) for row in data):
+            return {
+                'columns': columns,
+                'rows': [[row[c] for c in columns] for row in data]
+            }
+    return {'value': data}
+
+
+def from_columnar(payload):
+    if 'columns' in payload:
+        columns = payload['columns']
+        return [dict(zip(columns, row)) for row in payload['rows']]
+    return payload['value']
+
+
+def encode(data, mimetype=JSON_MIMETYPE):
+    """
+    :param data: 可 json 序列化的数据
+    :param mimetype: 编码格式
+    :return: bytes
+    """
+    if mimetype == COLUMNAR_MIMETYPE:
+        return json.dumps(
+            to_columnar(data),
+            ensure_ascii=False,
+            separators=(',', ':'),
+            default=str).encode('utf-8')
+    if mimetype == MSGPACK_MIMETYPE:
+        if msgpack is None:
+            raise ImportError('msgpack format requires: pip install msgpack')
+        return msgpack.packb(
+            to_columnar(data), use_bin_type=True, default=str)
+    return json.dumps(data, ensure_ascii=False, default=str).encode('utf-8')
+
+
+def decode(content, content_type=JSON_MIMETYPE):
+    """
+    :param content: bytes
+    :param content_type: 响应的 Content-Type
+    :return: 解码后的数据
+    """
+    mimetype = (content_type or JSON_MIMETYPE).split(';')[0].strip()
+    if mimetype == COLUMNAR_MIMETYPE:
+        return from_columnar(json.loads(content.decode('utf-8')))
+    if mimetype == MSGPACK_MIMETYPE:
+        if msgpack is None:
+            raise ImportError('msgpack format requires: pip install msgpack')
+        return from_columnar(msgpack.unpackb(content, raw=False))
+    return json.loads(content.decode('utf-8'))
@@ -5,7 +5,7 @@ import json
 import re
 from datetime import datetime
 from numbers import Number
-from threading import Thread
+from threading import Lock
 
 from . import helpers
 from .follower import BaseFollower
@@ -18,9 +18,16 @@ class XueQiuFollower(BaseFollower):
     TRANSACTION_API = 'https://xueqiu.com/cubes/rebalancing/history.json'
     PORTFOLIO_URL = 'https://xueqiu.com/p/'
     WEB_REFERER = 'https://www.xueqiu.com'
+    # created_at 为毫秒时间戳，足以区分不同调仓
+    CURSOR_INCLUSIVE = False
+    # 已有游标时每次查询的调仓次数，防止两次轮询之间发生多次调仓时遗漏
+    REBALANCING_FETCH_COUNT = 3
 
     def __init__(self):
         super(XueQiuFollower, self).__init__()
+        # 第一个 user 的持仓快照，按证券代码索引，每批调仓最多读取一次持仓
+        self._position_index = None
+        self._position_lock = Lock()
 
     def login(self, user=None, password=None, **kwargs):
         """
@@ -51,7 +58,8 @@ class XueQiuFollower(BaseFollower):
                adjust_sell=False,
                track_interval=10,
                trade_cmd_expire_seconds=120,
-               cmd_cache=True):
+               cmd_cache=True,
+               parallel_users=False):
         """跟踪 joinquant 对应的模拟交易，支持多用户多策略
         :param users: 支持 easytrader 的用户对象，支持使用 [] 指定多个用户
         :param strategies: 雪球组合名, 类似 ZH123450
@@ -69,7 +77,8 @@ class XueQiuFollower(BaseFollower):
             总资产由 初始资产 × 组合净值 算得， total_assets 会覆盖此参数
         :param track_interval: 轮训模拟交易时间，单位为秒
         :param trade_cmd_expire_seconds: 交易指令过期时间, 单位为秒
-        :param cmd_cache: 是否读取存储历史执行过的指令，防止重启时重复执行已经交易过的指令
+        :param cmd_cache: 是否读取存储历史执行过的指令，防止重启时重复执行已经交易过的指令，为 False 时清空历史指令
+        :param parallel_users: 是否将每条指令同时分发到全部 user 并发执行，同一 user 上的指令仍按先卖后买的顺序执行
         """
         self._adjust_sell = adjust_sell
 
@@ -82,9 +91,13 @@ class XueQiuFollower(BaseFollower):
 
         if cmd_cache:
             self.load_expired_cmd_cache()
+        else:
+            self.expired_cmds.clear()
 
-        self.start_trader_thread(users, trade_cmd_expire_seconds)
+        self.start_trader_thread(users, trade_cmd_expire_seconds,
+                                 parallel=parallel_users)
 
+        tracks = []
         for strategy_url, strategy_total_assets, strategy_initial_assets in zip(
                 strategies, total_assets, initial_assets):
             assets = self.calculate_assets(strategy_url, strategy_total_assets,
@@ -95,15 +108,9 @@ class XueQiuFollower(BaseFollower):
             except:
                 log.error('抽取交易id和策略名失败, 无效模拟交易url: {}'.format(strategy_url))
                 raise
-            strategy_worker = Thread(
-                target=self.track_strategy_worker,
-                args=[strategy_id, strategy_name],
-                kwargs={
-                    'interval': track_interval,
-                    'assets': assets
-                })
-            strategy_worker.start()
+            tracks.append((strategy_id, strategy_name, {'assets': assets}))
             log.info('开始跟踪策略: {}'.format(strategy_name))
+        self.track_strategies(tracks, interval=track_interval, block=False)
 
     def calculate_assets(self,
                          strategy_url,
@@ -131,16 +138,39 @@ class XueQiuFollower(BaseFollower):
         return rep.json()[info_index]['name']
 
     def extract_transactions(self, history):
-        print(history)
         if history['count'] <= 0:
             return []
-        rebalancing_index = 0
-        transactions = history['list'][rebalancing_index][
-            'rebalancing_histories']
+        transactions = []
+        # 接口按时间倒序返回，按调仓时间从早到晚依次执行
+        for batch, rebalancing in enumerate(
+                sorted(history['list'], key=self._rebalancing_time)):
+            for t in rebalancing['rebalancing_histories']:
+                t['rebalancing_batch'] = batch
+                transactions.append(t)
         return transactions
 
+    @staticmethod
+    def _rebalancing_time(rebalancing):
+        created_at = rebalancing.get('created_at')
+        if created_at is None:
+            created_at = max(
+                (t['created_at'] for t in rebalancing['rebalancing_histories']),
+                default=0)
+        return created_at
+
+    def extract_transaction_batch(self, transaction):
+        return transaction.get('rebalancing_batch')
+
+    def extract_transaction_cursor(self, transaction):
+        return transaction['created_at']
+
     def create_query_transaction_params(self, strategy):
-        params = {'cube_symbol': strategy, 'page': 1, 'count': 1}
+        # 首次查询只处理最近一次调仓，之后依靠游标过滤已处理的调仓
+        if strategy in self._transaction_cursors:
+            count = self.REBALANCING_FETCH_COUNT
+        else:
+            count = 1
+        params = {'cube_symbol': strategy, 'page': 1, 'count': count}
         return params
 
     # noinspection PyMethodOverriding
@@ -152,6 +182,8 @@ class XueQiuFollower(BaseFollower):
 
     # noinspection PyMethodOverriding
     def project_transactions(self, transactions, assets):
+        # 每批调仓使用新的持仓快照
+        self._invalidate_position_index()
         for t in transactions:
             weight_diff = self.none_to_zero(t['weight']) - self.none_to_zero(
                 t['prev_weight'])
@@ -165,7 +197,7 @@ class XueQiuFollower(BaseFollower):
             t['action'] = 'buy' if weight_diff > 0 else 'sell'
 
             t['amount'] = int(round(initial_amount, -2))
-            if self._adjust_sell:
+            if self._adjust_sell and t['action'] == 'sell':
                 t['amount'] = self._adjust_sell_amount(t['stock_code'],
                                                        t['amount'])
 
@@ -184,11 +216,8 @@ class XueQiuFollower(BaseFollower):
         :rtype: int
         """
         stock_code = stock_code[-6:]
-        user = self._users[0]
-        position = user.position
-        try:
-            stock = next(s for s in position if s['证券代码'] == stock_code)
-        except StopIteration:
+        stock = self._get_position_index().get(stock_code)
+        if stock is None:
             log.info('根据持仓调整 {} 卖出额，发现未持有股票 {}, 不做任何调整'.format(
                 stock_code, stock_code))
             return amount
@@ -202,6 +231,27 @@ class XueQiuFollower(BaseFollower):
             stock_code, available_amount, amount, adjust_amount))
         return adjust_amount
 
+    def _get_position_index(self):
+        """
+        获取第一个 user 按证券代码索引的持仓，快照失效前不会重复读取持仓
+        :return: {证券代码: 持仓记录}
+        :rtype: dict
+        """
+        with self._position_lock:
+            if self._position_index is None:
+                position = self._users[0].position
+                self._position_index = {s['证券代码']: s for s in position}
+            return self._position_index
+
+    def _invalidate_position_index(self):
+        with self._position_lock:
+            self._position_index = None
+
+    def on_trade_results(self, trade_cmd, results):
+        # 成交后持仓可能变化，作废持仓快照
+        self._invalidate_position_index()
+        super(XueQiuFollower, self).on_trade_results(trade_cmd, results)
+
     def _get_portfolio_info(self, portfolio_code):
         """
         获取组合信息
@@ -89,6 +89,12 @@ setup(
         'requests', 'six', 'rqopen-client', 'easyutils', 'flask', 'pywinauto',
         'pillow', 'pandas'
     ],
+    extras_require={
+        # async_remoteclient.AsyncRemoteClient
+        'async': ['aiohttp>=3.3'],
+        # server.run 使用的生产环境 WSGI 服务器
+        'server': ['waitress'],
+    },
     classifiers=[
         'Development Status :: 4 - Beta',
         'Programming Language :: Python :: 2.6',
@@ -0,0 +1,107 @@
+# coding:utf-8
+import asyncio
+import threading
+import unittest
+
+from werkzeug.serving import make_server
+
+from easytrader import exceptions, server
+
+try:
+    from easytrader.async_remoteclient import AsyncRemoteClient
+except (ImportError, SyntaxError):
+    AsyncRemoteClient = None
+
+
+class FakeUser(object):
+    def __init__(self, account_id):
+        self.position = [{'证券代码': '600000', '账户': account_id}]
+        self.balance = [{'资金余额': 100}]
+
+    def buy(self, security, price, amount, **kwargs):
+        return {'entrust_no': security}
+
+    def sell(self, security, price, amount, **kwargs):
+        raise ValueError('no position')
+
+
+@unittest.skipIf(AsyncRemoteClient is None, 'aiohttp is not installed')
+class TestAsyncRemoteClient(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.http_server = make_server('127.0.0.1', 0, server.app, threaded=True)
+        cls.port = cls.http_server.server_port
+        cls.thread = threading.Thread(target=cls.http_server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.http_server.shutdown()
+
+    def setUp(self):
+        server.accounts = server.AccountRegistry()
+        for account_id in ('1', '2'):
+            session = server.accounts.get_or_create(account_id)
+            session.user = FakeUser(account_id)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.clients = [
+            AsyncRemoteClient(
+                'ht_client', '127.0.0.1', self.port, account_id=account_id)
+            for account_id in ('1', '2')
+        ]
+
+    def tearDown(self):
+        for client in self.clients:
+            self.loop.run_until_complete(client.close())
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def test_concurrent_calls(self):
+        results = self.loop.run_until_complete(
+            asyncio.gather(*[c.position for c in self.clients] +
+                           [self.clients[0].buy('600000', 10, 100)]))
+
+        self.assertEqual(results[0][0]['账户'], '1')
+        self.assertEqual(results[1][0]['账户'], '2')
+        self.assertEqual(results[2], {'entrust_no': '600000'})
+
+    def test_server_error(self):
+        with self.assertRaises(exceptions.RemoteServerError) as cm:
+            self.loop.run_until_complete(
+                self.clients[0].sell('600000', 10, 100))
+        self.assertEqual(cm.exception.status_code, 400)
+
+    def test_wait_job(self):
+        client = self.clients[0]
+
+        async def buy_and_wait():
+            job = await client.common_post(
+                'buy?async=1',
+                {'security': '600000', 'price': 10, 'amount': 100})
+            job_id = job['job_id']
+            return await client.wait_job(job_id, timeout=5)
+
+        self.assertEqual(
+            self.loop.run_until_complete(buy_and_wait()),
+            {'entrust_no': '600000'})
+
+    def test_job_not_found(self):
+        with self.assertRaises(exceptions.RemoteJobNotFoundError):
+            self.loop.run_until_complete(self.clients[0].wait_job('x'))
+
+    def test_client_timeout(self):
+        timeout = self.clients[0]._client_timeout(
+            *self.clients[0]._get_timeout('buy'))
+        self.assertEqual(timeout.sock_connect,
+                         AsyncRemoteClient.CONNECT_TIMEOUT)
+        self.assertIsNone(timeout.connect)
+        self.assertEqual(timeout.sock_read, AsyncRemoteClient.READ_TIMEOUT)
+
+    def test_connection_error(self):
+        client = AsyncRemoteClient(
+            'ht_client', '127.0.0.1', 1, retries=1, backoff=0)
+        with self.assertRaises(exceptions.RemoteConnectionError):
+            self.loop.run_until_complete(client.balance)
+        self.loop.run_until_complete(client.close())
@@ -0,0 +1,193 @@
+# coding:utf-8
+import unittest
+from unittest import mock
+
+from easytrader import exceptions
+from easytrader.clienttrader import ClientTrader
+
+
+class TestClientTraderPopDialog(unittest.TestCase):
+    def setUp(self):
+        self.trader = ClientTrader()
+        self.trader._app = mock.MagicMock()
+        self.trader._main = mock.MagicMock()
+        self.trader._main.wrapper_object().handle = 1
+        self.trader._wait = lambda seconds: None
+
+    def test_no_dialog_until_timeout(self):
+        self.trader._get_top_window_handle = lambda: 1
+        self.assertFalse(self.trader._is_exist_pop_dialog(timeout=0.01))
+
+    def test_handle_dialogs_records_latency(self):
+        # 委托确认 -> 提示, 第一个弹窗处理后仍短暂停留在顶层
+        windows = iter([(2, '委托确认'), (2, '委托确认'), (2, '委托确认'),
+                        (3, '提示'), (3, '提示'), (3, '提示')])
+        current = {}
+
+        def top_window_handle():
+            current['handle'], current['title'] = next(windows, (3, '提示'))
+            return current['handle']
+
+        self.trader._get_top_window_handle = top_window_handle
+        self.trader._get_pop_dialog_title = lambda: current['title']
+
+        handler = mock.MagicMock()
+        handler.handle.side_effect = [None, {'entrust_no': '123'}]
+        result = self.trader._handle_pop_dialogs(
+            handler_class=lambda app: handler)
+
+        self.assertEqual(result, {'entrust_no': '123'})
+        self.assertEqual(
+            [c[0][0] for c in handler.handle.call_args_list], ['委托确认', '提示'])
+        self.assertEqual(self.trader.pop_dialog_latency['委托确认'].count, 1)
+        self.assertEqual(self.trader.pop_dialog_latency['提示'].count, 1)
+
+
+class TestClientTraderCancelEntrusts(unittest.TestCase):
+    def setUp(self):
+        self.trader = ClientTrader()
+        self.trader._switch_left_menus = mock.MagicMock()
+        self.trader._cancel_entrust_by_double_click = mock.MagicMock()
+        self.trader._click = mock.MagicMock()
+        self.trader._handle_pop_dialogs = mock.MagicMock(
+            return_value={'message': '撤单申报成功'})
+        self.trader.grid_reader = mock.MagicMock()
+        self.trader.grid_reader.read.return_value = [
+            {'合同编号': '1'}, {'合同编号': '2'}, {'合同编号': '3'}]
+
+    def test_cancel_bottom_up(self):
+        results = self.trader.cancel_entrusts_by_no(['1', '3', '4'])
+
+        self.assertEqual(self.trader.grid_reader.read.call_count, 1)
+        self.assertEqual(
+            [c[0][0] for c in
+             self.trader._cancel_entrust_by_double_click.call_args_list],
+            [2, 0])
+        self.assertEqual(results['1'], {'message': '撤单申报成功'})
+        self.assertIn('不能撤单', results['4']['message'])
+        self.trader._click.assert_not_called()
+
+    def test_cancel_all(self):
+        results = self.trader.cancel_entrusts_by_no(['3', '2', '1'])
+
+        self.trader._click.assert_called_once_with(
+            self.trader._config.CANCEL_ENTRUST_ALL_BUTTON_CONTROL_ID)
+        self.trader._cancel_entrust_by_double_click.assert_not_called()
+        self.assertEqual(len(results), 3)
+
+
+class TestClientTraderBatchTrade(unittest.TestCase):
+    def setUp(self):
+        self.trader = ClientTrader()
+        self.trader._switch_trade_menus = mock.MagicMock()
+        self.trader._batch_submit_trade = mock.MagicMock(
+            side_effect=lambda security, price, amount: {'entrust_no': security})
+
+    def test_sell_first_and_keep_order(self):
+        orders = [
+            {'action': 'buy', 'security': '600000', 'price': 10, 'amount': 100},
+            {'action': 'sell', 'security': '600001', 'price': 10, 'amount': 100},
+            {'action': 'hold', 'security': '600002', 'price': 10, 'amount': 100},
+        ]
+        results = self.trader.batch_trade(orders)
+
+        self.assertEqual(
+            [c[0][0] for c in self.trader._switch_trade_menus.call_args_list],
+            [['卖出[F2]'], ['买入[F1]']])
+        self.assertEqual(
+            [c[0][0] for c in self.trader._batch_submit_trade.call_args_list],
+            ['600001', '600000'])
+        self.assertEqual(results[0], {'entrust_no': '600000'})
+        self.assertEqual(results[1], {'entrust_no': '600001'})
+        self.assertIn('unknown action', results[2]['error'])
+
+    def test_error_per_order(self):
+        def trade(security, price, amount):
+            if security == '600000':
+                raise RuntimeError('control not found')
+            return {'entrust_no': security}
+
+        self.trader._batch_submit_trade.side_effect = trade
+        orders = [
+            {'action': 'buy', 'security': '600000', 'price': 10, 'amount': 100},
+            {'action': 'buy', 'security': '600001', 'price': 10, 'amount': 100},
+        ]
+        results = self.trader.batch_trade(orders)
+
+        self.assertIn('control not found', results[0]['error'])
+        self.assertEqual(results[1], {'entrust_no': '600001'})
+
+    def test_switch_menu_error(self):
+        self.trader._switch_trade_menus.side_effect = [
+            RuntimeError('menu not found'), None]
+        orders = [
+            {'action': 'sell', 'security': '600000', 'price': 10, 'amount': 100},
+            {'action': 'buy', 'security': '600001', 'price': 10, 'amount': 100},
+        ]
+        results = self.trader.batch_trade(orders)
+
+        self.assertIn('menu not found', results[0]['error'])
+        self.assertEqual(results[1], {'entrust_no': '600001'})
+
+
+class TestClientTraderBatchSubmitTrade(unittest.TestCase):
+    def setUp(self):
+        self.trader = ClientTrader()
+        self.trader._main = mock.MagicMock()
+        self.trader._main.wrapper_object().handle = 1
+        self.trader._wait = mock.MagicMock()
+        self.calls = []
+        self.trader._set_trade_params = mock.MagicMock(
+            side_effect=lambda *args: self.calls.append('set'))
+        self.trader._submit_trade = mock.MagicMock(
+            side_effect=lambda sleep: self.calls.append('submit'))
+        self.trader._handle_pop_dialogs = mock.MagicMock(
+            return_value={'entrust_no': '1'})
+
+    def test_fill_params_while_dialog_closing(self):
+        # 上一笔委托的提示弹窗关闭前已填好本笔委托
+        handles = iter([2, 2, 1])
+
+        def top_window_handle():
+            self.calls.append('poll')
+            return next(handles)
+
+        self.trader._get_top_window_handle = top_window_handle
+        result = self.trader._batch_submit_trade('600000', 10, 100)
+
+        self.assertEqual(result, {'entrust_no': '1'})
+        self.assertEqual(self.calls, ['set', 'poll', 'poll', 'poll', 'submit'])
+        self.trader._submit_trade.assert_called_once_with(sleep=0)
+
+    def test_dialog_not_closed(self):
+        self.trader._get_top_window_handle = lambda: 2
+        with mock.patch('easytrader.clienttrader.time.time',
+                        side_effect=[0, 0, 2]):
+            with self.assertRaises(exceptions.TradeError):
+                self.trader._batch_submit_trade('600000', 10, 100)
+
+        self.trader._submit_trade.assert_not_called()
+        self.trader._handle_pop_dialogs.assert_not_called()
+
+
+class TestClientTraderWaitSecurityLoaded(unittest.TestCase):
+    def setUp(self):
+        self.trader = ClientTrader()
+        self.trader._main = mock.MagicMock()
+        self.price_edit = self.trader._main.window.return_value
+        self.trader._wait = mock.MagicMock()
+
+    def test_return_when_price_filled(self):
+        self.price_edit.window_text.side_effect = ['', '', '10.00']
+        self.trader._wait_security_loaded(1)
+
+        self.assertEqual(self.price_edit.window_text.call_count, 3)
+        self.assertEqual(self.trader._wait.call_count, 2)
+
+    def test_timeout(self):
+        self.price_edit.window_text.return_value = ''
+        with mock.patch('easytrader.clienttrader.time.time',
+                        side_effect=[0, 0, 0.05, 0.2]):
+            self.trader._wait_security_loaded(0.1)
+
+        self.assertEqual(self.price_edit.window_text.call_count, 2)
@@ -0,0 +1,75 @@
+# coding:utf-8
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from easytrader.cmd_journal import CmdJournal
+
+
+class TestCmdJournal(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'cmd_cache.log')
+
+    def test_add_and_load(self):
+        journal = CmdJournal(self.path)
+        journal.add('cmd1', datetime.now())
+        journal.add('cmd2', datetime.now())
+        journal.add('cmd1', datetime.now())
+
+        reloaded = CmdJournal(self.path)
+        reloaded.load()
+        self.assertIn('cmd1', reloaded)
+        self.assertIn('cmd2', reloaded)
+        self.assertEqual(len(reloaded), 2)
+
+    def test_load_evicts_expired(self):
+        journal = CmdJournal(self.path, ttl=timedelta(days=1))
+        journal.add('old', datetime.now() - timedelta(days=2))
+        journal.add('new', datetime.now())
+
+        journal.load()
+        self.assertNotIn('old', journal)
+        self.assertIn('new', journal)
+        with open(self.path, encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 1)
+
+    def test_load_skips_partial_line(self):
+        journal = CmdJournal(self.path)
+        journal.add('cmd1', datetime.now())
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write('[1500000000.0, "cm')
+
+        appender = CmdJournal(self.path)
+        appender.add('cmd2', datetime.now())
+
+        reloaded = CmdJournal(self.path)
+        reloaded.load()
+        self.assertIn('cmd1', reloaded)
+        self.assertIn('cmd2', reloaded)
+        self.assertEqual(len(reloaded), 2)
+
+    def test_load_skips_malformed_line(self):
+        journal = CmdJournal(self.path)
+        journal.add('cmd1', datetime.now())
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write('5\nnull\n[1500000000.0, ["cmd"]]\n[1, 2, 3]\n')
+
+        reloaded = CmdJournal(self.path)
+        reloaded.load()
+        self.assertEqual(len(reloaded), 1)
+        with open(self.path, encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 1)
+
+    def test_clear_truncates_file(self):
+        journal = CmdJournal(self.path)
+        journal.add('cmd1', datetime.now())
+
+        unloaded = CmdJournal(self.path)
+        unloaded.clear()
+        unloaded.add('cmd2', datetime.now())
+
+        reloaded = CmdJournal(self.path)
+        reloaded.load()
+        self.assertNotIn('cmd1', reloaded)
+        self.assertIn('cmd2', reloaded)
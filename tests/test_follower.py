@@ -0,0 +1,223 @@
+# coding:utf-8
+import os
+import pickle
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from unittest import mock
+
+from easytrader.cmd_journal import CmdJournal
+from easytrader.follower import BaseFollower
+
+
+class TestBaseFollowerTracking(unittest.TestCase):
+    def test_next_track_delay_backoff(self):
+        follower = BaseFollower()
+        follower.TRACK_JITTER = 0
+
+        self.assertEqual(follower._next_track_delay(10), 10)
+        self.assertEqual(follower._next_track_delay(10, 1), 20)
+        self.assertEqual(follower._next_track_delay(10, 3), 80)
+        self.assertEqual(
+            follower._next_track_delay(10, 100), follower.TRACK_MAX_BACKOFF)
+
+    def test_track_once_reschedules_on_error(self):
+        follower = BaseFollower()
+        follower.TRACK_JITTER = 0
+        follower._tracking = True
+
+        def query_strategy_transaction(strategy, **kwargs):
+            raise IOError('remote error')
+
+        follower.query_strategy_transaction = query_strategy_transaction
+        task = {'strategy': 's', 'name': 'n', 'kwargs': {}, 'failures': 0}
+        before = time.time()
+        follower._track_once(task, 10)
+
+        self.assertEqual(task['failures'], 1)
+        due, _, scheduled = follower._track_schedule[0]
+        self.assertIs(scheduled, task)
+        self.assertGreaterEqual(due, before + 20)
+
+    def test_track_once_dispatches_transactions(self):
+        follower = BaseFollower()
+        follower._tracking = True
+        follower.expired_cmds = CmdJournal(
+            os.path.join(tempfile.mkdtemp(), 'cmd_cache.log'))
+
+        transaction = {
+            'action': 'buy',
+            'stock_code': 'sh600000',
+            'amount': 100,
+            'price': 10.0,
+            'datetime': datetime(2017, 1, 1)
+        }
+        follower.query_strategy_transaction = lambda strategy, **kwargs: [transaction]
+        task = {'strategy': 's', 'name': 'n', 'kwargs': {}, 'failures': 2}
+        follower._track_once(task, 10)
+
+        self.assertEqual(task['failures'], 0)
+        self.assertEqual(follower.trade_queue.qsize(), 1)
+
+    def test_stop_tracking_while_scheduling(self):
+        follower = BaseFollower()
+        follower.query_strategy_transaction = lambda strategy, **kwargs: []
+        follower._track_executor = ThreadPoolExecutor(max_workers=1)
+        follower._tracking = True
+        follower._push_track_task(
+            {'strategy': 's', 'name': 'n', 'kwargs': {}, 'failures': 0},
+            time.time())
+        errors = []
+
+        class StopOnRelease(threading.Condition):
+            """调度线程取出任务释放锁后立刻停止跟踪"""
+            stopped = False
+
+            def __exit__(self, *args):
+                result = super(StopOnRelease, self).__exit__(*args)
+                if threading.current_thread() is scheduler and not self.stopped:
+                    self.stopped = True
+                    follower.stop_tracking()
+                return result
+
+        follower._track_cond = StopOnRelease()
+
+        def run_scheduler():
+            try:
+                follower._track_scheduler(0)
+            except Exception as e:
+                errors.append(e)
+
+        scheduler = threading.Thread(target=run_scheduler)
+        scheduler.start()
+        scheduler.join(1)
+
+        self.assertFalse(scheduler.is_alive())
+        self.assertEqual(errors, [])
+
+    def test_track_strategies_refuse_when_tracking(self):
+        follower = BaseFollower()
+        follower.query_strategy_transaction = lambda strategy, **kwargs: []
+        strategies = [('s', 'n', {})]
+        follower.track_strategies(strategies, interval=60, block=False)
+        executor = follower._track_executor
+        try:
+            follower.track_strategies(strategies, interval=60, block=False)
+
+            self.assertIs(follower._track_executor, executor)
+            self.assertLessEqual(len(follower._track_schedule), 1)
+        finally:
+            follower.stop_tracking()
+
+    def test_track_strategy_worker(self):
+        follower = BaseFollower()
+        follower.TRACK_JITTER = 0
+        queries = []
+
+        def query_strategy_transaction(strategy, **kwargs):
+            queries.append((strategy, kwargs))
+            if len(queries) == 2:
+                follower.stop_tracking()
+            return []
+
+        follower.query_strategy_transaction = query_strategy_transaction
+        thread = threading.Thread(
+            target=follower.track_strategy_worker,
+            args=['s', 'n', 0.01],
+            kwargs={'assets': 100})
+        thread.start()
+        thread.join(1)
+
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(queries, [('s', {'assets': 100})] * 2)
+
+
+class TestBaseFollowerCmdCache(unittest.TestCase):
+    def test_migrate_legacy_cache_with_existing_backup(self):
+        tmp_dir = tempfile.mkdtemp()
+        follower = BaseFollower()
+        follower.LEGACY_CMD_CACHE_FILE = os.path.join(tmp_dir, 'cmd_cache.pk')
+        follower.expired_cmds = CmdJournal(
+            os.path.join(tmp_dir, 'cmd_cache.log'))
+        with open(follower.LEGACY_CMD_CACHE_FILE + '.bak', 'wb') as f:
+            f.write(b'old backup')
+        with open(follower.LEGACY_CMD_CACHE_FILE, 'wb') as f:
+            pickle.dump({'n_sh600000_buy'}, f)
+
+        follower.load_expired_cmd_cache()
+
+        self.assertIn('n_sh600000_buy', follower.expired_cmds)
+        self.assertFalse(os.path.exists(follower.LEGACY_CMD_CACHE_FILE))
+        with open(follower.LEGACY_CMD_CACHE_FILE + '.bak', 'rb') as f:
+            self.assertEqual(pickle.load(f), {'n_sh600000_buy'})
+
+
+class TestBaseFollowerDispatch(unittest.TestCase):
+    def _trade_cmd(self, action='buy'):
+        return {
+            'strategy_name': 'n',
+            'stock_code': 'sh600000',
+            'action': action,
+            'amount': 100,
+            'price': 10.0,
+            'datetime': datetime.now()
+        }
+
+    def test_parallel_dispatch_reports_each_user(self):
+        follower = BaseFollower()
+        users = [mock.MagicMock(), mock.MagicMock()]
+        users[0].buy.return_value = {'entrust_no': '1'}
+        users[1].buy.return_value = {'entrust_no': '2'}
+        lanes = [ThreadPoolExecutor(max_workers=1) for _ in users]
+
+        futures = follower._execute_trade_cmd(
+            self._trade_cmd(), users, 120, 'limit', 0, lanes)
+        results = [future.result(1) for future in futures]
+
+        self.assertEqual([r['response'] for r in results],
+                         [{'entrust_no': '1'}, {'entrust_no': '2'}])
+        for result in results:
+            self.assertIsNone(result['error'])
+            self.assertGreaterEqual(result['latency'], 0)
+
+    def test_parallel_dispatch_does_not_wait_slow_user(self):
+        follower = BaseFollower()
+        reported = threading.Semaphore(0)
+        follower.on_trade_results = mock.MagicMock(
+            side_effect=lambda trade_cmd, results: reported.release())
+        release = threading.Event()
+        users = [mock.MagicMock(), mock.MagicMock()]
+        users[0].buy.side_effect = lambda **kwargs: release.wait(1)
+        users[1].buy.side_effect = RuntimeError('window not found')
+        lanes = [ThreadPoolExecutor(max_workers=1) for _ in users]
+
+        first = follower._execute_trade_cmd(
+            self._trade_cmd(), users, 120, 'limit', 0, lanes)
+        second = follower._execute_trade_cmd(
+            self._trade_cmd('sell'), users, 120, 'limit', 0, lanes)
+        # user 0 仍在执行第一条指令，user 1 已执行完两条指令
+        self.assertIsNone(second[1].result(1)['error'])
+        self.assertIn('RuntimeError', first[1].result()['error'])
+        self.assertFalse(first[0].done())
+        follower.on_trade_results.assert_not_called()
+
+        release.set()
+        self.assertIsNone(second[0].result(1)['error'])
+        self.assertTrue(reported.acquire(timeout=1))
+        self.assertTrue(reported.acquire(timeout=1))
+        for call in follower.on_trade_results.call_args_list:
+            self.assertEqual(len(call[0][1]), 2)
+
+    def test_dispatch_drops_invalid_cmd(self):
+        follower = BaseFollower()
+        user = mock.MagicMock()
+        trade_cmd = self._trade_cmd()
+        trade_cmd['price'] = 0
+
+        results = follower._execute_trade_cmd(trade_cmd, [user], 120,
+                                              'limit', 0)
+        self.assertEqual(results, [])
+        user.buy.assert_not_called()
@@ -0,0 +1,69 @@
+# coding:utf-8
+import io
+import threading
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from easytrader.config import client
+from easytrader.grid_reader import (INPUT_LOCK, BaseGridReader,
+                                    ClipboardGridReader, parse_grid_text)
+
+POSITION_TEXT = (
+    '证券代码\t证券名称\t股票余额\t可用余额\t参考盈亏\t参考成本价\t股东代码\t备注\t\n'
+    '000001\t平安银行\t1000\t1000\t-43.77\t10.534\t0000000000\t\t\n'
+    '600000\t浦发银行\t200\t100\t12\t12.1\t0000000001\t\t\n')
+
+
+class TestParseGridText(unittest.TestCase):
+    def test_parse_like_pandas(self):
+        dtype = client.CommonConfig.GRID_DTYPE
+        expected = pd.read_csv(
+            io.StringIO(POSITION_TEXT),
+            delimiter='\t',
+            dtype=dtype,
+            na_filter=False).to_dict('records')
+
+        result = parse_grid_text(POSITION_TEXT, dtype)
+        self.assertEqual(result, expected)
+        self.assertEqual(result[0]['证券代码'], '000001')
+        self.assertIsInstance(result[0]['股票余额'], int)
+        self.assertIsInstance(result[1]['参考盈亏'], float)
+        self.assertEqual(result[0]['Unnamed: 8'], '')
+
+    def test_parse_empty(self):
+        self.assertEqual(parse_grid_text(''), [])
+        self.assertEqual(parse_grid_text('证券代码\t证券名称\n'), [])
+
+
+class TestBaseGridReader(unittest.TestCase):
+    def test_read_is_abstract(self):
+        class NoReadGridReader(BaseGridReader):
+            pass
+
+        with self.assertRaises(TypeError):
+            NoReadGridReader(mock.Mock())
+
+
+class TestClipboardGridReader(unittest.TestCase):
+    def test_read_holds_input_lock(self):
+        trader = mock.Mock()
+        trader._config.GRID_DTYPE = {}
+        reader = ClipboardGridReader(trader)
+        acquired_elsewhere = []
+
+        def get_clipboard_data():
+            # 其他账户的线程此时不能使用剪贴板
+            thread = threading.Thread(
+                target=lambda: acquired_elsewhere.append(
+                    INPUT_LOCK.acquire(blocking=False)))
+            thread.start()
+            thread.join()
+            return POSITION_TEXT
+
+        reader._get_clipboard_data = get_clipboard_data
+        result = reader.read(1047)
+        self.assertEqual(acquired_elsewhere, [False])
+        self.assertEqual(len(result), 2)
+
@@ -0,0 +1,25 @@
+# coding:utf-8
+import unittest
+
+from easytrader.latency import LatencyHistogram
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_record(self):
+        histogram = LatencyHistogram(buckets_ms=(10, 100))
+        for seconds in (0.005, 0.02, 0.05, 0.5):
+            histogram.record(seconds)
+
+        self.assertEqual(histogram.counts, [1, 2, 1])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.mean, 0.14375)
+        self.assertEqual(histogram.max, 0.5)
+        self.assertEqual(histogram.percentile(50), 0.1)
+        self.assertEqual(histogram.percentile(100), 0.5)
+        self.assertEqual(histogram.to_dict()['buckets'],
+                         {'<=10ms': 1, '<=100ms': 2, '>100ms': 1})
+
+    def test_empty(self):
+        histogram = LatencyHistogram()
+        self.assertEqual(histogram.mean, 0.0)
+        self.assertEqual(histogram.percentile(90), 0.0)
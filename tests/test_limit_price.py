@@ -0,0 +1,110 @@
+# coding:utf-8
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date
+from decimal import Decimal
+
+import pandas as pd
+
+from easytrader.limit_price import (LimitPriceStore, calc_limit_price,
+                                    get_limit_rate)
+
+
+class TestLimitRule(unittest.TestCase):
+    def test_get_limit_rate(self):
+        trade_date = date(2026, 10, 19)
+        self.assertEqual(get_limit_rate('600000', trade_date=trade_date), Decimal('0.1'))
+        self.assertEqual(get_limit_rate('300750', trade_date=trade_date), Decimal('0.2'))
+        self.assertEqual(get_limit_rate('688981', True, trade_date), Decimal('0.2'))
+        self.assertEqual(get_limit_rate('830799', trade_date=trade_date), Decimal('0.3'))
+        self.assertEqual(get_limit_rate('000001', True, trade_date), Decimal('0.1'))
+        self.assertEqual(get_limit_rate('000001', True, date(2025, 7, 4)), Decimal('0.05'))
+
+    def test_calc_limit_price(self):
+        self.assertEqual(calc_limit_price(10.0, 0.1), (11.0, 9.0))
+        # 四舍五入到分
+        self.assertEqual(calc_limit_price(3.75, 0.1), (4.13, 3.38))
+        self.assertEqual(calc_limit_price(2.05, 0.05), (2.15, 1.95))
+
+
+class TestLimitPriceStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.tmp_dir, 'limit_price.json')
+        self.today = date(2026, 10, 19)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def make_store(self):
+        return LimitPriceStore(self.file_path, today=lambda: self.today)
+
+    def test_set_and_persist(self):
+        store = self.make_store()
+        self.assertIsNone(store.get('600000'))
+        store.set('600000', 11.0, 9.0)
+        store.set('000001', float('nan'), float('nan'))
+        self.assertEqual(store.get('600000'), (11.0, 9.0))
+        self.assertIsNone(store.get('000001'))
+
+        self.assertEqual(self.make_store().get('600000'), (11.0, 9.0))
+
+    def test_trade_date_changed(self):
+        store = self.make_store()
+        store.set('600000', 11.0, 9.0)
+        self.today = date(2026, 10, 20)
+        self.assertIsNone(store.get('600000'))
+        self.assertIsNone(self.make_store().get('600000'))
+
+    def test_preload(self):
+        store = self.make_store()
+        store.set('600000', 11.11, 9.09)
+        pre_close_df = pd.DataFrame({
+            'pre_close': [10.0, 20.0, 5.0, 0],
+            'sec_name': ['浦发银行', '宁德时代', '*ST 某某', '停牌'],
+        }, index=['600000', '300750', '000002', '600001'])
+        self.assertEqual(store.preload(pre_close_df), 2)
+        self.assertEqual(store.get('600000'), (11.11, 9.09))
+        self.assertEqual(store.get('300750'), (24.0, 16.0))
+        self.assertEqual(store.get('000002'), (5.5, 4.5))
+        self.assertIsNone(store.get('600001'))
+        self.assertEqual(self.make_store().get('300750'), (24.0, 16.0))
+
+    def test_preload_skip_no_limit(self):
+        store = self.make_store()
+        pre_close_df = pd.DataFrame({
+            'pre_close': [10.0, 30.0, 40.0],
+            'sec_name': ['N 新股', 'C 次新', '某某股份'],
+            'no_limit': [False, False, True],
+        }, index=['301001', '688001', '001001'])
+        self.assertEqual(store.preload(pre_close_df), 0)
+        for stock_code in pre_close_df.index:
+            self.assertIsNone(store.get(stock_code))
+
+    def test_gui_price_overrides_preload(self):
+        store = self.make_store()
+        store.preload(pd.DataFrame({'pre_close': [10.0]}, index=['600000']))
+        self.assertTrue(store.is_preloaded('600000'))
+        self.assertTrue(self.make_store().is_preloaded('600000'))
+
+        store.set('600000', 11.01, 9.01)
+        self.assertFalse(store.is_preloaded('600000'))
+        self.assertEqual(store.get('600000'), (11.01, 9.01))
+        self.assertFalse(self.make_store().is_preloaded('600000'))
+
+    def test_load_invalid_file(self):
+        for content in ('[1, 2]', '{"trade_date": "2026-10-19"}',
+                        '{"trade_date": "2026-10-19", "prices": {"600000": 1}}',
+                        '{"trade_date": "2026-10-19", "prices": [1]}', '{'):
+            with open(self.file_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            store = self.make_store()
+            self.assertIsNone(store.get('600000'))
+            store.set('600000', 11.0, 9.0)
+            self.assertEqual(self.make_store().get('600000'), (11.0, 9.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+# coding:utf-8
+import math
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from easytrader.market_data import (FileQuoteSource, GUIQuoteSource,
+                                    MarketDataProvider, book_from_row,
+                                    empty_book)
+
+
+def make_row(code, price):
+    row = {'code': code}
+    for n in range(1, 6):
+        row['b%d_p' % n] = price - 0.01 * n
+        row['b%d_v' % n] = 1000 * n
+        row['a%d_p' % n] = price + 0.01 * n
+        row['a%d_v' % n] = 2000 * n
+    return row
+
+
+class FakeSource(object):
+    def __init__(self, books):
+        self.books = books
+        self.requests = []
+
+    def get_books(self, stock_codes):
+        self.requests.append(list(stock_codes))
+        return {c: self.books[c] for c in stock_codes if c in self.books}
+
+
+class TestBookFromRow(unittest.TestCase):
+    def test_book_from_row(self):
+        row = make_row('600000', 10.0)
+        row['b5_p'] = '0.000'
+        offer_buy_list, offer_sell_list = book_from_row(row, volume_unit=0.01)
+        self.assertEqual(offer_buy_list[0], [9.99, 10.0])
+        self.assertEqual(offer_sell_list[4], [10.05, 100.0])
+        self.assertTrue(math.isnan(offer_buy_list[4][0]))
+        self.assertTrue(math.isnan(offer_buy_list[4][1]))
+
+
+class TestMarketDataProvider(unittest.TestCase):
+    def setUp(self):
+        self.book_a = book_from_row(make_row('600000', 10.0))
+        self.book_b = book_from_row(make_row('000001', 20.0))
+        self.first = FakeSource({'600000': self.book_a,
+                                 '000002': empty_book()})
+        self.second = FakeSource({'000001': self.book_b})
+        self.provider = MarketDataProvider([self.first, self.second], ttl=60)
+
+    def test_fallback(self):
+        books = self.provider.get_books(['600000', '000001', '000002'])
+        self.assertEqual(books['600000'], self.book_a)
+        self.assertEqual(books['000001'], self.book_b)
+        self.assertTrue(math.isnan(books['000002'][0][0][0]))
+        self.assertEqual(self.first.requests, [['600000', '000001', '000002']])
+        self.assertEqual(self.second.requests, [['000001', '000002']])
+
+    def test_prefetch_cache(self):
+        self.provider.prefetch(['600000', '000001'])
+        self.assertEqual(self.provider.get_book('000001'), self.book_b)
+        self.assertEqual(len(self.first.requests), 1)
+        self.provider.invalidate()
+        self.provider.get_book('600000')
+        self.assertEqual(self.first.requests[-1], ['600000'])
+
+    def test_prefetch_used_once(self):
+        self.provider.prefetch(['600000'])
+        self.assertEqual(self.provider.get_book('600000'), self.book_a)
+        self.assertEqual(len(self.first.requests), 1)
+        # 撤单、改价检查重新读取盘口
+        self.assertEqual(self.provider.get_book('600000'), self.book_a)
+        self.assertEqual(len(self.first.requests), 2)
+
+    def test_no_cache_without_prefetch(self):
+        self.provider.get_book('600000')
+        self.provider.get_book('600000')
+        self.assertEqual(len(self.first.requests), 2)
+
+    def test_prefetch_expired(self):
+        self.provider.ttl = 0
+        self.provider.prefetch(['600000'])
+        self.provider.get_book('600000')
+        self.assertEqual(len(self.first.requests), 2)
+
+    def test_prefetch_skips_gui_source(self):
+        trader = mock.MagicMock()
+        trader.get_bs_offer_data_from_gui.side_effect = lambda code: self.book_b
+        provider = MarketDataProvider([self.first, GUIQuoteSource(trader)])
+
+        provider.prefetch(['600000', '000001'])
+        trader.get_bs_offer_data_from_gui.assert_not_called()
+        self.assertEqual(provider.get_book('600000'), self.book_a)
+        # 批量来源没有行情的股票使用时才从客户端界面读取，只读取一次
+        self.assertEqual(provider.get_book('000001'), self.book_b)
+        trader.get_bs_offer_data_from_gui.assert_called_once_with('000001')
+
+    def test_iter_prefetch_chunk_by_elapsed(self):
+        codes = ['600000', '000001', '000002', '600001', '600002', '600003']
+        self.provider.ttl = 3
+        self.provider.PREFETCH_CHUNK_SIZE = 2
+        clock = [0.0]
+        with mock.patch('easytrader.market_data.time.time',
+                        side_effect=lambda: clock[0]):
+            result = []
+            for stock_code in self.provider.iter_prefetch(codes):
+                result.append(stock_code)
+                self.provider.get_book(stock_code)
+                # 每只股票交易耗时 1 秒，之后每批预读 3 只
+                clock[0] += 1
+        self.assertEqual(result, codes)
+        self.assertEqual(self.first.requests,
+                         [codes[:2], codes[2:5], codes[5:]])
+
+    def test_iter_prefetch_slow_stock(self):
+        self.provider.PREFETCH_CHUNK_SIZE = 2
+        clock = [0.0]
+        with mock.patch('easytrader.market_data.time.time',
+                        side_effect=lambda: clock[0]):
+            for stock_code in self.provider.iter_prefetch(
+                    ['600000', '000001', '000002', '600001']):
+                self.provider.get_book(stock_code)
+                clock[0] += 100
+        # 第一批的第二只股票预读结果过期后重新读取，之后每只股票耗时超过 ttl，逐只预读
+        self.assertEqual(self.first.requests,
+                         [['600000', '000001'], ['000001'], ['000002'],
+                          ['600001']])
+        # 批量来源都没有行情的股票使用时不再重复从批量来源读取
+        self.assertEqual(self.second.requests,
+                         [['000001'], ['000001'], ['000002'], ['600001']])
+
+    def test_source_error(self):
+        class BrokenSource(object):
+            def get_books(self, stock_codes):
+                raise IOError('feed down')
+
+        provider = MarketDataProvider([BrokenSource(), self.first])
+        self.assertEqual(provider.get_book('600000'), self.book_a)
+
+
+class TestFileQuoteSource(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.tmp_dir, 'quotes.csv')
+        rows = [make_row('000001', 20.0), make_row('600000', 10.0)]
+        columns = list(rows[0])
+        with open(self.file_path, 'w') as f:
+            f.write(','.join(columns) + '\n')
+            for row in rows:
+                f.write(','.join(str(row[c]) for c in columns) + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_get_books(self):
+        source = FileQuoteSource(self.file_path)
+        books = source.get_books(['000001', '300001'])
+        self.assertEqual(list(books), ['000001'])
+        self.assertEqual(books['000001'][0][0], [19.99, 1000.0])
+
+    def test_expired(self):
+        source = FileQuoteSource(self.file_path, max_age=10)
+        old = time.time() - 60
+        os.utime(self.file_path, (old, old))
+        self.assertEqual(source.get_books(['000001']), {})
+
+    def test_missing_file(self):
+        source = FileQuoteSource(os.path.join(self.tmp_dir, 'none.csv'))
+        self.assertEqual(source.get_books(['000001']), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
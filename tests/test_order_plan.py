@@ -0,0 +1,44 @@
+# coding:utf-8
+import unittest
+
+import pandas as pd
+
+from easytrader.order_plan import interleave_orders, plan_orders
+
+
+class TestOrderPlan(unittest.TestCase):
+    def setUp(self):
+        self.position_df = pd.DataFrame({
+            'sec_name': ['a', 'b', 'c'],
+            'holding_position': [1000, 500, 300],
+            'sellable_position': [1000, 500, 300],
+            'cost_price': [10.0, 20.0, 5.0],
+            'market_price': [11.0, 19.0, 5.5],
+            'profit_rate': [10.0, -5.0, 10.0],
+            'profit': [1000.0, -500.0, 150.0],
+            'cost_tot': [10000.0, 10000.0, 1500.0],
+            'market_value': [11000.0, 9500.0, 1650.0],
+        }, index=['000001', '000002', '000003'])
+        self.target_df = pd.DataFrame({
+            'final_position': [0, 1050, 100, 250],
+            'ref_price': [0, 21.0, 5.0, 8.0],
+            'wap_mode': ['twap', 0, 'twap', 'twap_half_passive'],
+        }, index=['000001', '000002', '000003', '000004'])
+
+    def test_plan_orders(self):
+        plan = plan_orders(self.position_df, self.target_df)
+
+        self.assertEqual(list(plan.index), ['000001', '000002', '000003', '000004'])
+        self.assertEqual(list(plan['direction']), [0, 1, 0, 1])
+        self.assertEqual(plan.loc['000001', 'ref_price'], 11.0)
+        self.assertEqual(plan.loc['000002', 'wap_mode'], 'auto')
+        self.assertEqual(plan.loc['000004', 'init_position'], 0)
+
+    def test_buy_first(self):
+        plan = plan_orders(self.position_df, self.target_df, buy_first=True)
+        self.assertEqual(list(plan['direction']), [1, 0, 1, 0])
+        self.assertEqual(list(plan.index), ['000002', '000001', '000004', '000003'])
+
+    def test_interleave_uneven(self):
+        df = pd.DataFrame({'direction': [1, 1, 1, 0]}, index=list('abcd'))
+        self.assertEqual(list(interleave_orders(df).index), list('dabc'))
@@ -0,0 +1,98 @@
+# coding:utf-8
+import threading
+import unittest
+from unittest import mock
+
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from easytrader import exceptions
+from easytrader.remoteclient import RemoteClient
+
+
+def make_response(status_code, content=b'{}'):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    response.headers['Content-Type'] = 'application/json'
+    return response
+
+
+class TestRemoteClientTransport(unittest.TestCase):
+    def setUp(self):
+        self.client = RemoteClient(
+            'ht_client', 'localhost', retries=2, backoff=0,
+            timeouts={'position': 3})
+        self.request = mock.MagicMock()
+        self.client._s.request = self.request
+
+    def test_retry_idempotent(self):
+        self.request.side_effect = [
+            requests.exceptions.ConnectionError('reset'),
+            make_response(503),
+            make_response(200, b'[{"a": 1}]')
+        ]
+        self.assertEqual(self.client.position, [{'a': 1}])
+        self.assertEqual(self.request.call_count, 3)
+        self.assertEqual(self.request.call_args[1]['timeout'],
+                         (RemoteClient.CONNECT_TIMEOUT, 3))
+
+    def test_no_retry_trade(self):
+        self.request.side_effect = requests.exceptions.ReadTimeout('slow')
+        with self.assertRaises(exceptions.RemoteTimeoutError):
+            self.client.buy('600000', 10, 100)
+        self.assertEqual(self.request.call_count, 1)
+
+    def test_retry_trade_on_connect_timeout(self):
+        self.request.side_effect = [
+            requests.exceptions.ConnectTimeout('connect'),
+            make_response(201, b'{"entrust_no": "1"}')
+        ]
+        self.assertEqual(
+            self.client.buy('600000', 10, 100), {'entrust_no': '1'})
+
+    def test_retry_trade_on_connection_refused(self):
+        refused = MaxRetryError(
+            None, '/buy', NewConnectionError(None, 'Connection refused'))
+        self.request.side_effect = [
+            requests.exceptions.ConnectionError(refused),
+            make_response(201, b'{"entrust_no": "1"}')
+        ]
+        self.assertEqual(
+            self.client.buy('600000', 10, 100), {'entrust_no': '1'})
+        self.assertEqual(self.request.call_count, 2)
+
+    def test_no_retry_trade_on_connection_reset(self):
+        self.request.side_effect = requests.exceptions.ConnectionError('reset')
+        with self.assertRaises(exceptions.RemoteConnectionError):
+            self.client.buy('600000', 10, 100)
+        self.assertEqual(self.request.call_count, 1)
+
+    def test_default_read_timeout(self):
+        self.request.return_value = make_response(200, b'[]')
+        self.client.balance
+        self.assertEqual(
+            self.request.call_args[1]['timeout'],
+            (RemoteClient.CONNECT_TIMEOUT, RemoteClient.READ_TIMEOUT))
+
+    def test_server_error(self):
+        self.request.return_value = make_response(400, b'{"error": "bad"}')
+        with self.assertRaises(exceptions.RemoteServerError) as cm:
+            self.client.sell('600000', 10, 100)
+        self.assertEqual(cm.exception.status_code, 400)
+        self.assertEqual(str(cm.exception), 'bad')
+
+    def test_job_not_found(self):
+        self.request.return_value = make_response(
+            404, b'{"error": "job x not found"}')
+        with self.assertRaises(exceptions.RemoteJobNotFoundError):
+            self.client.wait_job('x')
+
+    def test_session_per_thread(self):
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(self.client._s))
+        thread.start()
+        thread.join()
+        self.assertIsNot(sessions[0], self.client._s)
+        self.assertIs(sessions[0].get_adapter('http://localhost'),
+                      self.client._s.get_adapter('http://localhost'))
@@ -0,0 +1,230 @@
+# coding:utf-8
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from easytrader import server
+
+
+class FakeUser(object):
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, **kwargs):
+        self.kwargs = kwargs
+
+    @property
+    def balance(self):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.05)
+        with self._lock:
+            self.active -= 1
+        return [{'资金余额': 100}]
+
+    def buy(self, security, price, amount, **kwargs):
+        return {'entrust_no': security}
+
+
+class TestServerAccounts(unittest.TestCase):
+    def setUp(self):
+        server.accounts = server.AccountRegistry()
+        self.client = server.app.test_client()
+        self.users = {}
+        patcher = mock.patch.object(server.api, 'use', side_effect=self._use)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _use(self, broker):
+        user = FakeUser()
+        self.users[broker] = user
+        return user
+
+    def _prepare(self, account_id, broker):
+        url = '/accounts/{}/prepare'.format(account_id)
+        response = self.client.post(url, json={'broker': broker, 'user': account_id})
+        self.assertEqual(response.status_code, 201)
+
+    def test_default_account(self):
+        response = self.client.post('/prepare', json={'broker': 'a'})
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.post(
+            '/buy', json={'security': '600000', 'price': 10, 'amount': 100})
+        self.assertEqual(response.get_json(), {'entrust_no': '600000'})
+        self.assertIn('X-Snapshot-Time', self.client.get('/balance').headers)
+        self.assertEqual(
+            self.client.get('/accounts').get_json(), [server.DEFAULT_ACCOUNT])
+
+    def test_unknown_account(self):
+        response = self.client.get('/accounts/x/balance')
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('not prepared', response.get_json()['error'])
+
+    def test_serialize_per_account(self):
+        self._prepare('1', 'a')
+        self._prepare('2', 'b')
+
+        def get(account_id):
+            client = server.app.test_client()
+            return client.get('/accounts/{}/balance'.format(account_id))
+
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            responses = list(executor.map(get, ['1', '1', '1', '2', '2', '2']))
+
+        self.assertTrue(all(r.status_code == 200 for r in responses))
+        self.assertEqual(self.users['a'].max_active, 1)
+        self.assertEqual(self.users['b'].max_active, 1)
+
+
+class TestAccountSessionCache(unittest.TestCase):
+    def setUp(self):
+        self.session = server.AccountSession('1', {'balance': 60})
+        self.session.user = mock.MagicMock()
+        self.reads = 0
+
+        def balance():
+            self.reads += 1
+            time.sleep(0.05)
+            return [{'资金余额': self.reads}]
+
+        type(self.session.user).balance = mock.PropertyMock(side_effect=balance)
+
+    def test_coalesce_and_cache(self):
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            snapshots = list(
+                executor.map(lambda _: self.session.get('balance'), range(5)))
+
+        self.assertEqual(self.reads, 1)
+        self.assertEqual(len(set(ts for _, ts in snapshots)), 1)
+        self.assertEqual(self.session.get('balance'), snapshots[0])
+        self.assertEqual(self.reads, 1)
+
+    def test_invalidate_after_trade(self):
+        self.session.get('balance')
+        self.session.invoke('buy', security='600000', price=10, amount=100)
+        data, _ = self.session.get('balance')
+
+        self.assertEqual(self.reads, 2)
+        self.assertEqual(data, [{'资金余额': 2}])
+
+
+class TestServerBatch(unittest.TestCase):
+    def setUp(self):
+        server.accounts = server.AccountRegistry()
+        self.client = server.app.test_client()
+        self.user = FakeUser()
+        server.accounts.get_or_create(server.DEFAULT_ACCOUNT).user = self.user
+
+    def test_orders_batch(self):
+        orders = [
+            {'action': 'buy', 'security': '600000', 'price': 10, 'amount': 100},
+            {'action': 'hold', 'security': '600001', 'price': 10, 'amount': 100},
+        ]
+        response = self.client.post('/orders:batch', json={'orders': orders})
+
+        self.assertEqual(response.status_code, 201)
+        results = response.get_json()
+        self.assertEqual(results[0], {'entrust_no': '600000'})
+        self.assertIn('unknown action', results[1]['error'])
+
+    def test_orders_batch_error(self):
+        orders = [
+            {'action': 'buy', 'security': '600000', 'price': 10, 'amount': 100},
+            {'security': '600001', 'price': 10, 'amount': 100},
+        ]
+        self.user.buy = mock.MagicMock(side_effect=RuntimeError('gui busy'))
+        response = self.client.post('/orders:batch', json={'orders': orders})
+
+        results = response.get_json()
+        self.assertEqual(len(results), 2)
+        self.assertIn('gui busy', results[0]['error'])
+        self.assertIn('action', results[1]['error'])
+
+    def test_user_batch_trade_error(self):
+        orders = [
+            {'action': 'buy', 'security': '600000', 'price': 10, 'amount': 100},
+            {'action': 'sell', 'security': '600001', 'price': 10, 'amount': 100},
+        ]
+        self.user.batch_trade = mock.MagicMock(
+            side_effect=RuntimeError('menu not found'))
+        response = self.client.post('/orders:batch', json={'orders': orders})
+
+        results = response.get_json()
+        self.assertEqual(len(results), 2)
+        for result in results:
+            self.assertIn('menu not found', result['error'])
+
+        self.user.batch_trade = mock.MagicMock(
+            return_value=[{'entrust_no': '1'}])
+        results = self.client.post(
+            '/orders:batch', json={'orders': orders}).get_json()
+        self.assertEqual(results, [{'entrust_no': '1'}, {'error': 'no result'}])
+
+    def test_cancels_batch(self):
+        self.user.cancel_entrusts_by_no = mock.MagicMock(
+            return_value={'2': {'message': 'b'}, '1': {'message': 'a'}})
+        response = self.client.post(
+            '/cancels:batch', json={'entrust_nos': ['1', '2']})
+
+        self.assertEqual(response.get_json(), [{'message': 'a'}, {'message': 'b'}])
+        self.user.cancel_entrusts_by_no.assert_called_once_with(['1', '2'])
+
+        self.user.cancel_entrusts_by_no.return_value = {'1': {'message': 'a'}}
+        response = self.client.post(
+            '/cancels:batch', json={'entrust_nos': ['1', '2']})
+        self.assertEqual(response.get_json(),
+                         [{'message': 'a'}, {'error': 'no result'}])
+
+
+class TestServerJobs(unittest.TestCase):
+    def setUp(self):
+        server.accounts = server.AccountRegistry()
+        server.jobs = server.JobStore()
+        self.client = server.app.test_client()
+        self.user = FakeUser()
+        self.release = threading.Event()
+
+        def buy(security, price, amount, **kwargs):
+            self.release.wait(1)
+            return {'entrust_no': security}
+
+        self.user.buy = buy
+        server.accounts.get_or_create(server.DEFAULT_ACCOUNT).user = self.user
+
+    def test_async_buy(self):
+        response = self.client.post(
+            '/buy?async=1',
+            json={'security': '600000', 'price': 10, 'amount': 100})
+        self.assertEqual(response.status_code, 202)
+        job_id = response.get_json()['job_id']
+
+        job = self.client.get('/jobs/' + job_id).get_json()
+        self.assertIn(job['status'], ('pending', 'running'))
+
+        self.release.set()
+        job = self.client.get('/jobs/{}?wait=1'.format(job_id)).get_json()
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['result'], {'entrust_no': '600000'})
+
+    def test_failed_job(self):
+        def sell(security, price, amount, **kwargs):
+            raise ValueError('no position')
+
+        self.user.sell = sell
+        response = self.client.post(
+            '/sell?async=1',
+            json={'security': '600000', 'price': 10, 'amount': 100})
+        job_id = response.get_json()['job_id']
+
+        job = self.client.get('/jobs/{}?wait=1'.format(job_id)).get_json()
+        self.assertEqual(job['status'], 'failed')
+        self.assertIn('no position', job['error'])
+
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get('/jobs/x').status_code, 404)
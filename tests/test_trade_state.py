@@ -0,0 +1,135 @@
+# coding:utf-8
+import math
+import threading
+import unittest
+
+import pandas as pd
+
+from easytrader.trade_state import (EMPTY_STOCK_STATE, TradeState,
+                                    TradeStateRefresher)
+
+
+class TestTradeState(unittest.TestCase):
+    def setUp(self):
+        self.position_raw = pd.DataFrame({
+            '证券代码': [1, 2, 2],
+            '证券名称': ['a', 'b', 'b'],
+            '股票余额': [1000, 500, 300],
+            '可用余额': [1000, 500, 0],
+            '市值': [11000.0, 9500.0, 5700.0],
+        })
+        self.apply_raw = pd.DataFrame({
+            '证券代码': [2, 2, 600000],
+            '委托数量': [200, 300, 100],
+            '委托价格': [19.0, 19.5, 8.0],
+            '成交数量': [200, 100, 0],
+        })
+        self.state = TradeState(self.apply_raw, self.position_raw)
+
+    def test_position_df(self):
+        position_df = self.state.position_df
+        self.assertEqual(list(position_df.index), ['000001', '000002', '000002'])
+        self.assertIn('holding_position', position_df.columns)
+        # 原始数据不被修改
+        self.assertIn('证券代码', self.position_raw.columns)
+
+    def test_get_rows(self):
+        self.assertEqual(self.state.get_position('000002').shape[0], 2)
+        self.assertEqual(self.state.get_apply('600000').shape[0], 1)
+        self.assertIsNone(self.state.get_position('600000'))
+        self.assertIsNone(self.state.get_apply('000001'))
+
+    def test_get_stock(self):
+        stock = self.state.get_stock('000002')
+        self.assertEqual(stock.holding_position, 800)
+        self.assertEqual(stock.sellable_position, 500)
+        self.assertEqual(stock.market_value, 15200.0)
+        self.assertEqual(stock.apply_vol, 500)
+        self.assertEqual(stock.deal_vol, 300)
+        self.assertEqual(stock.undeal_vol, 200)
+        self.assertEqual(stock.apply_price_min, 19.0)
+        self.assertEqual(stock.apply_price_max, 19.5)
+
+        only_position = self.state.get_stock('000001')
+        self.assertEqual(only_position.holding_position, 1000)
+        self.assertEqual(only_position.apply_vol, 0)
+        self.assertTrue(math.isnan(only_position.apply_price_min))
+
+        only_apply = self.state.get_stock('600000')
+        self.assertEqual(only_apply.holding_position, 0)
+        self.assertEqual(only_apply.undeal_vol, 100)
+
+        self.assertIs(self.state.get_stock('300001'), EMPTY_STOCK_STATE)
+
+    def test_empty(self):
+        state = TradeState(None, None)
+        self.assertIsNone(state.position_df)
+        self.assertIsNone(state.get_apply('000001'))
+        self.assertIs(state.get_stock('000001'), EMPTY_STOCK_STATE)
+        self.assertTrue(state.is_built_from(None, None))
+
+    def test_version(self):
+        self.assertEqual(self.state.version, 0)
+        self.assertEqual(TradeState(None, None, version=3).version, 3)
+        self.assertEqual(self.state.epoch, 0)
+        self.assertEqual(TradeState(None, None, epoch=2).epoch, 2)
+
+    def test_is_built_from(self):
+        self.assertTrue(self.state.is_built_from(self.apply_raw, self.position_raw))
+        self.assertFalse(
+            self.state.is_built_from(self.apply_raw.copy(), self.position_raw))
+
+
+class TestTradeStateRefresher(unittest.TestCase):
+    def setUp(self):
+        self.count = 0
+        self.refreshed = threading.Event()
+
+    def refresh(self):
+        self.count += 1
+        self.refreshed.set()
+
+    def test_refresh_periodically(self):
+        refresher = TradeStateRefresher(self.refresh, interval=0.01)
+        refresher.start()
+        try:
+            self.assertTrue(self.refreshed.wait(1))
+        finally:
+            refresher.stop(1)
+        self.assertFalse(refresher.running)
+        count = self.count
+        self.assertGreaterEqual(count, 1)
+        self.refreshed.clear()
+        self.assertFalse(self.refreshed.wait(0.05))
+        self.assertEqual(self.count, count)
+
+    def test_request_refresh(self):
+        refresher = TradeStateRefresher(self.refresh, interval=60)
+        refresher.start()
+        try:
+            self.assertTrue(self.refreshed.wait(1))
+            self.refreshed.clear()
+            refresher.request_refresh()
+            self.assertTrue(self.refreshed.wait(1))
+        finally:
+            refresher.stop(1)
+        self.assertEqual(self.count, 2)
+
+    def test_refresh_error(self):
+        def refresh():
+            self.refresh()
+            raise ValueError('gui busy')
+
+        refresher = TradeStateRefresher(refresh, interval=0.01)
+        refresher.start()
+        try:
+            self.assertTrue(self.refreshed.wait(1))
+            self.refreshed.clear()
+            # 刷新失败后继续刷新
+            self.assertTrue(self.refreshed.wait(1))
+        finally:
+            refresher.stop(1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# coding:utf-8
+import unittest
+
+from easytrader.twap_scheduler import (TASK_DONE, TASK_RUNNING, TASK_WAITING,
+                                       TwapScheduler)
+
+
+class TestTwapScheduler(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.scheduler = TwapScheduler(10, clock=lambda: self.now)
+
+    def test_only_due_tasks(self):
+        self.scheduler.add('600000', None)
+        self.scheduler.add('000001', None, due=1005)
+        tasks = self.scheduler.pop_due()
+        self.assertEqual([t.stock_code for t in tasks], ['600000'])
+        self.assertEqual(tasks[0].state, TASK_RUNNING)
+        self.assertEqual(self.scheduler.wait_seconds(), 5)
+        self.now = 1005
+        self.assertEqual([t.stock_code for t in self.scheduler.pop_due()],
+                         ['000001'])
+        self.assertIsNone(self.scheduler.wait_seconds())
+
+    def test_priority_by_remaining_amount(self):
+        amounts = {'600000': 1000, '000001': 50000, '000002': 8000}
+        for stock_code in amounts:
+            self.scheduler.add(stock_code, None)
+        tasks = self.scheduler.pop_due(lambda t: amounts[t.stock_code])
+        self.assertEqual([t.stock_code for t in tasks],
+                         ['000001', '000002', '600000'])
+
+    def test_reschedule(self):
+        task = self.scheduler.add('600000', None)
+        self.scheduler.pop_due()
+        # 按时执行完成，间隔从到期时间开始计算
+        self.now = 1002
+        self.scheduler.reschedule(task)
+        self.assertEqual(task.due, 1010)
+        self.assertEqual(task.state, TASK_WAITING)
+        self.assertEqual(task.slices, 1)
+
+        self.now = 1010
+        self.scheduler.pop_due()
+        # 执行较慢，下次执行时间已过，立刻到期
+        self.now = 1025
+        self.scheduler.reschedule(task)
+        self.assertEqual(task.due, 1025)
+        self.assertEqual(self.scheduler.wait_seconds(), 0)
+
+    def test_slow_task_does_not_delay_others(self):
+        slow = self.scheduler.add('600000', None)
+        fast = self.scheduler.add('000001', None, due=1003)
+        self.scheduler.pop_due()
+        self.now = 1008
+        self.scheduler.reschedule(slow)
+        tasks = self.scheduler.pop_due()
+        self.assertEqual(tasks, [fast])
+        self.assertEqual(self.scheduler.next_due(), 1010)
+
+    def test_finish(self):
+        task = self.scheduler.add('600000', None)
+        self.scheduler.pop_due()
+        self.scheduler.finish(task)
+        self.assertEqual(task.state, TASK_DONE)
+        self.assertEqual(len(self.scheduler), 0)
+        self.assertIs(self.scheduler.tasks['600000'], task)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+# coding:utf-8
+import unittest
+
+from easytrader.remoteclient import parse_sse
+from easytrader.watcher import (AccountWatcher, ENTRUST_KEY_FIELDS, Subscriber,
+                                diff_rows)
+
+
+class FakeSession(object):
+    account_id = '1'
+
+    def __init__(self):
+        self.tables = {'today_entrusts': [], 'today_trades': []}
+
+    def get(self, name):
+        return self.tables[name], 0
+
+
+class TestAccountWatcher(unittest.TestCase):
+    def test_diff_rows(self):
+        previous, _ = diff_rows(
+            {}, [{'合同编号': '1', '委托状态': '已报'}], ENTRUST_KEY_FIELDS)
+        current = [{'合同编号': '1', '委托状态': '已成'},
+                   {'合同编号': '2', '委托状态': '已报'}]
+
+        rows, changes = diff_rows(previous, current, ENTRUST_KEY_FIELDS)
+        self.assertEqual(changes, current)
+        _, changes = diff_rows(rows, current, ENTRUST_KEY_FIELDS)
+        self.assertEqual(changes, [])
+
+    def test_poll_publishes_changes_after_first_read(self):
+        session = FakeSession()
+        watcher = AccountWatcher(session)
+        # 不启动后台读取线程, 手动读取
+        subscriber = Subscriber()
+        watcher._subscribers.append(subscriber)
+
+        session.tables['today_trades'] = [{'成交编号': 'a', '成交数量': 100}]
+        watcher.poll()
+        self.assertTrue(subscriber.queue.empty())
+
+        session.tables['today_trades'].append({'成交编号': 'b', '成交数量': 200})
+        watcher.poll()
+        event = subscriber.queue.get_nowait()
+        self.assertEqual(event['type'], 'trade')
+        self.assertEqual(event['data']['成交编号'], 'b')
+        self.assertTrue(subscriber.queue.empty())
+
+
+class TestParseSse(unittest.TestCase):
+    def test_parse(self):
+        lines = [': connected', '', 'event: trade',
+                 'data: {"type": "trade", "data": {"成交编号": "b"}}', '',
+                 ': keepalive', '']
+        self.assertEqual(
+            list(parse_sse(lines)),
+            [{'type': 'trade', 'data': {'成交编号': 'b'}}])
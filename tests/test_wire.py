@@ -0,0 +1,56 @@
+# coding:utf-8
+import gzip
+import unittest
+
+from easytrader import server, wire
+
+ENTRUSTS = [{
+    '委托时间': '09:30:0{}'.format(i % 10),
+    '证券代码': '600000',
+    '证券名称': '浦发银行',
+    '操作': '买入',
+    '委托数量': 100 * i,
+    '委托价格': 10.5,
+    '合同编号': str(i),
+    '委托状态': '已成'
+} for i in range(100)]
+
+
+class TestWire(unittest.TestCase):
+    def test_round_trip(self):
+        for mimetype in wire.available_mimetypes():
+            for data in (ENTRUSTS, [], {'entrust_no': '1'}, [1, 2]):
+                self.assertEqual(
+                    wire.decode(wire.encode(data, mimetype), mimetype), data)
+
+    def test_columnar_smaller(self):
+        json_size = len(wire.encode(ENTRUSTS))
+        columnar_size = len(wire.encode(ENTRUSTS, wire.COLUMNAR_MIMETYPE))
+        self.assertLess(columnar_size, json_size / 2)
+
+
+class TestServerWire(unittest.TestCase):
+    def setUp(self):
+        server.accounts = server.AccountRegistry()
+        self.client = server.app.test_client()
+        session = server.accounts.get_or_create(server.DEFAULT_ACCOUNT)
+        session.user = type('User', (), {'today_entrusts': ENTRUSTS})()
+
+    def test_negotiate_and_compress(self):
+        response = self.client.get(
+            '/today_entrusts',
+            headers={'Accept': wire.COLUMNAR_MIMETYPE,
+                     'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(response.mimetype, wire.COLUMNAR_MIMETYPE)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        content = gzip.decompress(response.get_data())
+        self.assertEqual(
+            wire.decode(content, response.headers['Content-Type']), ENTRUSTS)
+
+    def test_default_json(self):
+        response = self.client.get('/today_entrusts')
+
+        self.assertEqual(response.mimetype, wire.JSON_MIMETYPE)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.get_json(), ENTRUSTS)
@@ -34,6 +34,112 @@ class TestXueQiuTrader(unittest.TestCase):
             amount = follower._adjust_sell_amount(stock_code, sell_amount)
             self.assertEqual(amount, excepted_amount)
 
+    def test_adjust_sell_amount_reads_position_once(self):
+        follower = XueQiuFollower()
+
+        mock_user = mock.MagicMock()
+        follower._users = [mock_user]
+        position = mock.PropertyMock(return_value=TEST_POSITION)
+        type(mock_user).position = position
+
+        follower._adjust_sell = True
+        transactions = [{
+            'stock_symbol': symbol,
+            'weight': 0,
+            'prev_weight': 10,
+            'price': 1.5,
+            'created_at': 1500000000000
+        } for symbol in ['SZ169101', 'SH600000', 'SZ000001']]
+        follower.project_transactions(transactions, assets=10000)
+        self.assertEqual(position.call_count, 1)
+        self.assertEqual(transactions[0]['amount'], 600)
+
+        follower.on_trade_results({'strategy_name': 'n', 'stock_code': 'sz169101',
+                                   'action': 'sell'}, [])
+        follower._adjust_sell_amount('169101', 700)
+        self.assertEqual(position.call_count, 2)
+
+    def test_incremental_transactions(self):
+        follower = XueQiuFollower()
+        follower._adjust_sell = False
+        history = {
+            'count': 1,
+            'list': [{
+                'rebalancing_histories': [{
+                    'created_at': 1500000000000,
+                    'stock_symbol': 'SH600000',
+                    'weight': 10,
+                    'prev_weight': 0,
+                    'price': 10.0
+                }]
+            }]
+        }
+        rep = mock.MagicMock(status_code=200, headers={})
+        rep.json.return_value = history
+        follower.s.get = mock.MagicMock(return_value=rep)
+
+        transactions = follower.query_strategy_transaction(
+            'ZH000001', assets=10000)
+        self.assertEqual(len(transactions), 1)
+        self.assertEqual(
+            follower.create_query_transaction_params('ZH000001')['count'],
+            follower.REBALANCING_FETCH_COUNT)
+
+        transactions = follower.query_strategy_transaction(
+            'ZH000001', assets=10000)
+        self.assertEqual(transactions, [])
+
+    def test_sell_first_per_rebalancing(self):
+        follower = XueQiuFollower()
+        follower._adjust_sell = False
+
+        def history(symbol, weight, prev_weight, created_at):
+            return {
+                'created_at': created_at,
+                'stock_symbol': symbol,
+                'weight': weight,
+                'prev_weight': prev_weight,
+                'price': 10.0
+            }
+
+        # 接口按时间倒序返回
+        rep = mock.MagicMock(status_code=200, headers={})
+        rep.json.return_value = {
+            'count': 2,
+            'list': [{
+                'created_at': 1500000060000,
+                'rebalancing_histories': [
+                    history('SH600002', 10, 0, 1500000060000),
+                    history('SH600001', 0, 10, 1500000060000),
+                ]
+            }, {
+                'created_at': 1500000000000,
+                'rebalancing_histories': [
+                    history('SH600001', 10, 0, 1500000000000),
+                    history('SH600000', 0, 10, 1500000000000),
+                ]
+            }]
+        }
+        follower.s.get = mock.MagicMock(return_value=rep)
+        follower._transaction_cursors['ZH000001'] = 0
+
+        transactions = follower.query_strategy_transaction(
+            'ZH000001', assets=10000)
+        self.assertEqual(
+            [(t['stock_code'], t['action']) for t in transactions],
+            [('sh600000', 'sell'), ('sh600001', 'buy'),
+             ('sh600001', 'sell'), ('sh600002', 'buy')])
+
+    def test_not_modified_transactions(self):
+        follower = XueQiuFollower()
+        rep = mock.MagicMock(status_code=304, headers={})
+        follower.s.get = mock.MagicMock(return_value=rep)
+
+        transactions = follower.query_strategy_transaction(
+            'ZH000001', assets=10000)
+        self.assertEqual(transactions, [])
+        rep.json.assert_not_called()
+
 
 TEST_POSITION = [{
     'Unnamed: 14': '',